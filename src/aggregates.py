@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+from time_index import DailyTimeIndex
+
+# --------------------------------------------------------------------------------
+# RUNNING AGGREGATES FOR THE SALES ANALYSIS
+# Everything the four analyze_* functions need, kept as small mergeable tables,
+# so transactions can be folded in chunk by chunk instead of held in memory.
+# --------------------------------------------------------------------------------
+
+# Compact dtypes for reading Transactions.csv (the export has a trailing space in 'Product name ').
+# Dates repeat a lot, so they are read as categories and only the distinct values are parsed.
+TRANSACTION_DTYPES = {
+    'Transaction ID': 'int32',
+    'Date': 'category',
+    'Product name ': 'category',
+    'Product name': 'category',
+    'Quantity': 'int32',
+}
+
+def _add(table, key, value):
+    """Adds a value to a running total, storing plain Python numbers."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    table[key] = table.get(key, 0) + value
+
+def enrich_chunk(chunk, catalog):
+    """
+    Prepares one chunk of raw transactions for AnalysisAggregates.update.
+    - Renames the column with an extra space.
+    - Parses the distinct dates only.
+    - Gathers category and price from the ProductCatalog by product id (unknown products get NaN, as with a left merge).
+    Returns a DataFrame with 'Transaction ID', 'Date', 'Category' and 'Turnover' columns.
+    """
+    chunk = chunk.rename(columns={'Product name ': 'Product name'})
+
+    dates = chunk['Date'].astype('category').cat
+    parsed_dates = pd.to_datetime(dates.categories, format='%m/%d/%Y')
+    date_values = parsed_dates.to_numpy().take(dates.codes)
+
+    product_ids, _ = catalog.encode(chunk['Product name'])
+    return pd.DataFrame({
+        'Transaction ID': chunk['Transaction ID'].to_numpy(),
+        'Date': date_values,
+        'Category': catalog.categories_of(product_ids),
+        'Turnover': chunk['Quantity'].to_numpy() * catalog.prices_of(product_ids),
+    })
+
+def split_last_order(chunk):
+    """
+    Splits a chunk into the rows of complete orders and the rows of its last order,
+    which may continue in the next chunk. Returns (complete, carry).
+    """
+    transaction_ids = chunk['Transaction ID'].to_numpy()
+    boundaries = np.flatnonzero(transaction_ids != transaction_ids[-1])
+    last_order_start = boundaries[-1] + 1 if len(boundaries) else 0
+    return chunk.iloc[:last_order_start], chunk.iloc[last_order_start:]
+
+def fold_chunks(aggregates, chunks, catalog):
+    """
+    Enriches raw transaction chunks against the ProductCatalog and folds them into the aggregates.
+    Lines of one order are expected to be contiguous; the last order of a chunk is
+    carried over to the next one, so an order never spans two updates.
+    """
+    carry = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        chunk = enrich_chunk(chunk, catalog)
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        # Hold back the last (possibly incomplete) order until the next chunk
+        complete, carry = split_last_order(chunk)
+        aggregates.update(complete)
+    if carry is not None:
+        aggregates.update(carry)
+    return aggregates
+
+class AnalysisAggregates:
+    """
+    Mergeable running totals for the sales analysis.
+    - Turnover per month x category.
+    - Distinct orders per weekday.
+    - Lines per category sold together with the focus category (Televize).
+    - Turnover and distinct orders per day (for the marketing comparison).
+    Orders must not be split between two update() calls, otherwise they are counted twice.
+    """
+
+    def __init__(self, focus_category='Televize'):
+        self.focus_category = focus_category
+        self.month_category_turnover = {}
+        self.weekday_orders = {}
+        self.cosold_category_lines = {}
+        self.daily_turnover = {}
+        self.daily_orders = {}
+        self.rows = 0
+        # Sums stay integers unless a turnover was missing (unknown product), as with pandas
+        self.turnover_is_float = False
+
+    def update(self, df):
+        """Folds prepared transactions (Transaction ID, Date, Category, Turnover) into the totals."""
+        if df.empty:
+            return
+        self.rows += len(df)
+        self.turnover_is_float |= df['Turnover'].dtype.kind == 'f'
+
+        # Month x category turnover, derived from the (much smaller) day x category totals
+        daily_category_turnover = df.groupby(['Date', 'Category'], observed=True)['Turnover'].sum()
+        for (date, category), turnover in daily_category_turnover.items():
+            _add(self.month_category_turnover, (date.strftime('%Y-%m'), category), turnover)
+
+        # Distinct orders per weekday, taking the date of the first line of each order
+        first_lines = df.drop_duplicates(subset='Transaction ID')
+        for date, orders in first_lines.groupby('Date').size().items():
+            _add(self.weekday_orders, date.day_name(), orders)
+
+        # Lines of other categories in orders containing the focus category
+        transaction_ids = df['Transaction ID'].to_numpy()
+        is_focus = (df['Category'] == self.focus_category).to_numpy()
+        in_focus_order = np.isin(transaction_ids, np.unique(transaction_ids[is_focus]))
+        co_sold = df.loc[in_focus_order & ~is_focus, 'Category'].value_counts()
+        for category, lines in co_sold[co_sold > 0].items():
+            _add(self.cosold_category_lines, category, lines)
+
+        # Daily totals
+        by_date = df.groupby('Date')
+        for date, turnover in by_date['Turnover'].sum().items():
+            _add(self.daily_turnover, date.strftime('%Y-%m-%d'), turnover)
+        for date, orders in by_date['Transaction ID'].nunique().items():
+            _add(self.daily_orders, date.strftime('%Y-%m-%d'), orders)
+
+    def merge(self, other):
+        """Adds the totals of another AnalysisAggregates (e.g. from another chunk or worker)."""
+        for name in self.TABLES:
+            table = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                _add(table, key, value)
+        self.rows += other.rows
+        self.turnover_is_float |= other.turnover_is_float
+        return self
+
+    # Names of the running totals, in the order they are stored
+    TABLES = ('month_category_turnover', 'weekday_orders', 'cosold_category_lines', 'daily_turnover', 'daily_orders')
+
+    def to_dict(self):
+        """JSON-serializable form of the totals, with each table as a list of [key..., value] rows."""
+        state = {'focus_category': self.focus_category, 'rows': self.rows, 'turnover_is_float': self.turnover_is_float}
+        for name in self.TABLES:
+            state[name] = [[*key, value] if isinstance(key, tuple) else [key, value] for key, value in getattr(self, name).items()]
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        """Restores totals saved with to_dict."""
+        aggregates = cls(state['focus_category'])
+        for name in cls.TABLES:
+            table = getattr(aggregates, name)
+            for *key, value in state[name]:
+                table[tuple(key) if len(key) > 1 else key[0]] = value
+        aggregates.rows = state['rows']
+        aggregates.turnover_is_float = state['turnover_is_float']
+        return aggregates
+
+    # --- Results in the shapes the analysis printers expect ---
+
+    def _turnover(self, series):
+        return series.astype(float) if self.turnover_is_float else series
+
+    def monthly_category_turnover(self):
+        """Turnover table with months as rows and categories as columns."""
+        records = pd.DataFrame(
+            [(month, category, turnover) for (month, category), turnover in self.month_category_turnover.items()],
+            columns=['Month', 'Category', 'Turnover'],
+        )
+        records['Month'] = pd.PeriodIndex(records['Month'], freq='M')
+        records['Turnover'] = self._turnover(records['Turnover'])
+        return records.groupby(['Month', 'Category'])['Turnover'].sum().unstack(fill_value=0)
+
+    def category_turnover(self):
+        """Total turnover per category, largest first."""
+        totals = {}
+        for (_, category), turnover in self.month_category_turnover.items():
+            _add(totals, category, turnover)
+        totals = pd.Series(totals, name='Turnover', dtype='float64' if self.turnover_is_float else 'int64')
+        return totals.rename_axis('Category').sort_index().sort_values(ascending=False)
+
+    def orders_per_weekday(self):
+        """Distinct orders per English day name."""
+        return pd.Series(self.weekday_orders, name='Transaction ID', dtype='int64').rename_axis('Day of Week')
+
+    def cosold_categories(self):
+        """Lines per category sold together with the focus category, most frequent first."""
+        counts = pd.Series(self.cosold_category_lines, name='count', dtype='int64').rename_axis('Category')
+        return counts.sort_index().sort_values(ascending=False, kind='stable')
+
+    def time_index(self):
+        """Daily turnover and distinct orders as a DailyTimeIndex (prefix sums for date-range queries)."""
+        days = pd.to_datetime(pd.Index(list(self.daily_orders)), format='%Y-%m-%d')
+        daily_turnover = self._turnover(pd.Series([self.daily_turnover[key] for key in self.daily_orders]))
+        return DailyTimeIndex(days, daily_turnover.to_numpy(), np.array(list(self.daily_orders.values()), dtype=np.int64))
+
+    def marketing_totals(self, change_date):
+        """Turnover, distinct orders and number of days before and after the change date."""
+        return self.time_index().marketing_totals(change_date)
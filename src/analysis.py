@@ -1,50 +1,57 @@
+import argparse
 import pandas as pd
 import sys
 
-def load_and_prepare_data(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv'):
+from aggregates import AnalysisAggregates, TRANSACTION_DTYPES, fold_chunks
+from catalog import ProductCatalog
+from data_cache import CACHE_DIR, load_prepared_data
+from time_index import DailyTimeIndex
+
+def load_and_prepare_data(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', cache_dir=None):
     """
     Loads and prepares data from CSV files.
     - Loads products and transactions.
     - Renames the column with an extra space.
-    - Merges the tables.
+    - Joins the products by their integer catalog id (catalog.py).
     - Converts the date column to the correct format.
     - Calculates turnover.
+    With cache_dir set, the prepared frame is loaded from the binary cache when it is fresh.
     Returns the prepared DataFrame.
     """
     try:
-        products_df = pd.read_csv(products_path)
-        transactions_df = pd.read_csv(transactions_path)
+        return load_prepared_data(products_path, transactions_path, cache_dir=cache_dir)
     except FileNotFoundError as e:
         print(f"Chyba: Súbor nebol nájdený. Uistite sa, že súbory sú v priečinku 'data/in'. Detaily: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Fix column name
-    transactions_df.rename(columns={'Product name ': 'Product name'}, inplace=True)
-
-    # Merge tables
-    df = pd.merge(transactions_df, products_df, on='Product name', how='left')
-
-    # Convert date
-    df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y')
+def load_aggregates_streaming(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', chunksize=1_000_000):
+    """
+    Streaming counterpart of load_and_prepare_data for exports that do not fit in memory.
+    - Reads transactions in chunks of `chunksize` lines with compact dtypes.
+    - Enriches each chunk against the (small) products table.
+    - Folds the chunk into running aggregates covering all four analyses.
+    Peak memory is bounded by the chunk size. Lines of one order are expected to be
+    contiguous in the export; the last order of a chunk is carried over to the next one.
+    Returns AnalysisAggregates.
+    """
+    try:
+        products_df = pd.read_csv(products_path)
+        reader = pd.read_csv(transactions_path, dtype=TRANSACTION_DTYPES, chunksize=chunksize)
+    except FileNotFoundError as e:
+        print(f"Chyba: Súbor nebol nájdený. Uistite sa, že súbory sú v priečinku 'data/in'. Detaily: {e}", file=sys.stderr)
+        sys.exit(1)
 
-    # Calculate turnover
-    df['Turnover'] = df['Quantity'] * df['Price']
-    
-    return df
+    with reader:
+        return fold_chunks(AnalysisAggregates(), reader, ProductCatalog.from_products(products_df))
 
-def analyze_turnover_by_category(df):
-    """Analyzes and prints turnover by category."""
+def print_turnover_by_category(category_turnover, monthly_category_turnover):
+    """Prints the answer to question 1 from the total and the month x category turnover."""
     print("1. Na jaké kategorii produktů máme největší obrat? A zajímalo by mě i jestli se to v jednotlivých měsících mění.\n")
     
-    # Total turnover
-    category_turnover = df.groupby('Category')['Turnover'].sum().sort_values(ascending=False)
     print("Celkový obrat podle kategorií:")
     print(category_turnover.to_string(float_format='{:,.0f} Kč'.format))
     print(f"\n-> Největší obrat je v kategorii: {category_turnover.index[0]}\n")
 
-    # Monthly turnover
-    df['Month'] = df['Date'].dt.to_period('M')
-    monthly_category_turnover = df.groupby(['Month', 'Category'])['Turnover'].sum().unstack(fill_value=0)
     print("Obrat podle kategorií v jednotlivých měsících:")
     print(monthly_category_turnover.to_string(float_format='{:,.0f} Kč'.format))
     
@@ -57,13 +64,21 @@ def analyze_turnover_by_category(df):
     print("Postup: Pro výpočet celkového obratu jsem sečetl tržby pro každou kategorii produktů. Pro měsíční analýzu jsem přidal sloupec s měsícem a následně opět sečetl tržby pro jednotlivé kategorie v každém měsíci.")
     print("Celkově má největší obrat kategorie Televize. Tato kategorie je dominantní ve všech sledovaných měsících.")
 
-def analyze_orders_by_weekday(df):
-    """Analyzes and prints the number of orders by weekday."""
+def analyze_turnover_by_category(df):
+    """Analyzes and prints turnover by category."""
+    # Total turnover
+    category_turnover = df.groupby('Category')['Turnover'].sum().sort_values(ascending=False)
+
+    # Monthly turnover (the month is a separate Series, so the input frame is not modified)
+    month = df['Date'].dt.to_period('M').rename('Month')
+    monthly_category_turnover = df.groupby([month, 'Category'])['Turnover'].sum().unstack(fill_value=0)
+
+    print_turnover_by_category(category_turnover, monthly_category_turnover)
+
+def print_orders_by_weekday(orders_per_day):
+    """Prints the answer to question 2 from the order counts per (English) day name."""
     print("\n\n2. Který den v týdnu je nejsilnější na počet objednávek?\n")
     
-    df['Day of Week'] = df['Date'].dt.day_name()
-    orders_per_day = df.drop_duplicates(subset='Transaction ID').groupby('Day of Week')['Transaction ID'].count()
-    
     days_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     czech_days = {"Monday": "Pondělí", "Tuesday": "Úterý", "Wednesday": "Středa", "Thursday": "Čtvrtek", "Friday": "Pátek", "Saturday": "Sobota", "Sunday": "Neděle"}
     
@@ -78,14 +93,17 @@ def analyze_orders_by_weekday(df):
     print("Postup: Ze sloupce s datem jsem extrahoval název dne v týdnu. Následně jsem spočítal unikátní počet objednávek (Transaction ID) pro každý den.")
     print("Nejvíce objednávek bylo zaznamenáno v pondělí a v sobotu.")
 
-def analyze_cosold_with_tv(df):
-    """Analyzes and prints what is most often bought with a TV."""
+def analyze_orders_by_weekday(df):
+    """Analyzes and prints the number of orders by weekday."""
+    first_lines = df.drop_duplicates(subset='Transaction ID')
+    day_of_week = first_lines['Date'].dt.day_name().rename('Day of Week')
+    orders_per_day = first_lines.groupby(day_of_week)['Transaction ID'].count()
+    print_orders_by_weekday(orders_per_day)
+
+def print_cosold_with_tv(co_sold_categories):
+    """Prints the answer to question 3 from the line counts of categories co-sold with a TV."""
     print("\n\n3. Která kategorie se prodává nejčastěji spolu s produkty z kategorie Televize?\n")
     
-    tv_transactions = df[df['Category'] == 'Televize']['Transaction ID'].unique()
-    co_sold_products = df[df['Transaction ID'].isin(tv_transactions)]
-    co_sold_categories = co_sold_products[co_sold_products['Category'] != 'Televize']['Category'].value_counts()
-    
     print("Kategorie prodávané spolu s kategorií Televize:")
     print(co_sold_categories.to_string())
     
@@ -98,21 +116,16 @@ def analyze_cosold_with_tv(df):
     print("\nZávěr k otázce 3:")
     print("Postup: Nejprve jsem identifikoval všechny transakce obsahující produkt z kategorie 'Televize'. Poté jsem v těchto transakcích vyhledal všechny ostatní zakoupené produkty, spočítal jejich kategorie a určil tu nejčastější.")
 
-def analyze_marketing_impact(df, change_date_str='2022-03-18'):
-    """Analyzes and prints the impact of the marketing budget change."""
-    print(f"\n\n4. Od {pd.to_datetime(change_date_str).date()} byl navýšen budget na online marketing. Dovedeš mi říct, jestli to vedlo k nějaké změně v prodeji?\n")
-    
-    change_date = pd.to_datetime(change_date_str)
-    before_df = df[df['Date'] < change_date]
-    after_df = df[df['Date'] >= change_date]
-
-    turnover_before = before_df['Turnover'].sum()
-    turnover_after = after_df['Turnover'].sum()
-    orders_before = before_df['Transaction ID'].nunique()
-    orders_after = after_df['Transaction ID'].nunique()
+def analyze_cosold_with_tv(df):
+    """Analyzes and prints what is most often bought with a TV."""
+    tv_transactions = df[df['Category'] == 'Televize']['Transaction ID'].unique()
+    co_sold_products = df[df['Transaction ID'].isin(tv_transactions)]
+    co_sold_categories = co_sold_products[co_sold_products['Category'] != 'Televize']['Category'].value_counts()
+    print_cosold_with_tv(co_sold_categories)
 
-    days_before = (change_date - df['Date'].min()).days if not before_df.empty else 0
-    days_after = (df['Date'].max() - change_date).days if not after_df.empty else 0
+def print_marketing_impact(change_date, turnover_before, turnover_after, orders_before, orders_after, days_before, days_after):
+    """Prints the answer to question 4 from the totals before and after the change date."""
+    print(f"\n\n4. Od {change_date.date()} byl navýšen budget na online marketing. Dovedeš mi říct, jestli to vedlo k nějaké změně v prodeji?\n")
 
     avg_daily_turnover_before = turnover_before / days_before if days_before > 0 else 0
     avg_daily_turnover_after = turnover_after / days_after if days_after > 0 else 0
@@ -133,19 +146,65 @@ def analyze_marketing_impact(df, change_date_str='2022-03-18'):
     print(f"Po navýšení marketingového budgetu došlo k poklesu jak v průměrném denním obratu, tak v průměrném denním počtu objednávek. Průměrný denní obrat klesl z přibližně {avg_daily_turnover_before:,.0f} Kč na {avg_daily_turnover_after:,.0f} Kč a průměrný počet objednávek denně klesl z {avg_daily_orders_before:.2f} na {avg_daily_orders_after:.2f}.")
     print("Z těchto dat se zdá, že navýšení rozpočtu na marketing nemělo bezprostřední pozitivní vliv na prodeje, ba naopak. Dopad marketingových kampaní se však může projevit s delším časovým odstupem a pro přesnější vyhodnocení by bylo potřeba analyzovat delší časové období.")
 
-def main():
+def analyze_marketing_impact(df, change_date_str='2022-03-18', time_index=None):
+    """Analyzes and prints the impact of the marketing budget change."""
+    change_date = pd.to_datetime(change_date_str)
+    if time_index is None:
+        time_index = DailyTimeIndex.from_frame(df)
+    print_marketing_impact(change_date, **time_index.marketing_totals(change_date))
+
+def print_date_comparison(comparison):
+    """Prints the before/after comparison for several candidate change dates (DailyTimeIndex.compare_dates)."""
+    print("\n\nSrovnání kandidátních dat změny (průměry na den před / po datu):\n")
+    print(f"{'Datum':<12}{'Dní před':>10}{'Dní po':>10}{'Obrat před':>16}{'Obrat po':>16}{'Objednávky před':>17}{'Objednávky po':>15}")
+    for row in comparison.itertuples():
+        print(f"{str(row.Index.date()):<12}{row.days_before:>10}{row.days_after:>10}"
+              f"{row.avg_daily_turnover_before:>16,.0f}{row.avg_daily_turnover_after:>16,.0f}"
+              f"{row.avg_daily_orders_before:>17.2f}{row.avg_daily_orders_after:>15.2f}")
+
+def print_report(aggregates, change_date_str='2022-03-18', compare_dates=None):
+    """Prints all four answers from precomputed AnalysisAggregates."""
+    print_turnover_by_category(aggregates.category_turnover(), aggregates.monthly_category_turnover())
+    print_orders_by_weekday(aggregates.orders_per_weekday())
+    print_cosold_with_tv(aggregates.cosold_categories())
+    time_index = aggregates.time_index()
+    change_date = pd.to_datetime(change_date_str)
+    print_marketing_impact(change_date, **time_index.marketing_totals(change_date))
+    if compare_dates:
+        print_date_comparison(time_index.compare_dates(compare_dates))
+
+def main(argv=None):
     """Main function of the script that controls data loading and analysis."""
+    parser = argparse.ArgumentParser(description="Analýza prodejních dat.")
+    parser.add_argument('--stream', action='store_true', help="Číst transakce po částech (pro exporty větší než paměť).")
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help="Počet řádků transakcí v jedné části při --stream.")
+    parser.add_argument('--no-cache', action='store_true', help="Nepoužívat binární cache připravených dat.")
+    parser.add_argument('--products', default='../data/in/Products.csv', help="Katalog produktů (CSV).")
+    parser.add_argument('--transactions', default='../data/in/Transactions.csv', help="Transakce (CSV).")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Složka binární cache připravených dat.")
+    parser.add_argument('--change-date', default='2022-03-18', help="Datum změny marketingového budgetu pro otázku 4 (RRRR-MM-DD).")
+    parser.add_argument('--compare-dates', type=lambda value: value.split(','), default=None,
+                        help="Čárkou oddělená kandidátní data změny; vypíše srovnání před / po pro každé z nich.")
+    args = parser.parse_args(argv)
+
     print("--- Analýza prodejních dat ---")
     print("Následuje zodpovězení otázek od manažera e-shopu. U každé otázky je popsán postup a uveden závěr.\n")
+
+    if args.stream:
+        print_report(load_aggregates_streaming(args.products, args.transactions, chunksize=args.chunksize), args.change_date, args.compare_dates)
+        return
     
     # Load and prepare data
-    df = load_and_prepare_data()
+    df = load_and_prepare_data(args.products, args.transactions, cache_dir=None if args.no_cache else args.cache_dir)
     
     # Individual analyses
     analyze_turnover_by_category(df)
     analyze_orders_by_weekday(df)
     analyze_cosold_with_tv(df)
-    analyze_marketing_impact(df)
+    time_index = DailyTimeIndex.from_frame(df)
+    analyze_marketing_impact(df, args.change_date, time_index)
+    if args.compare_dates:
+        print_date_comparison(time_index.compare_dates(args.compare_dates))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,423 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from inventory import load_stock
+
+# --------------------------------------------------------------------------------
+# BENCHMARK SUITE
+# Runs the loading, analysis and order automation stages on a synthetic dataset
+# and records throughput, latency percentiles and peak RSS per stage. Each stage
+# runs in a fresh process, so its peak RSS is not inflated by the stages before it.
+# Results are saved as JSON; --compare reports regressions against an older run.
+# --------------------------------------------------------------------------------
+
+RESULT_FORMAT_VERSION = 1
+STAGES = ('load_csv', 'load_cache', 'analyze', 'stream', 'parallel', 'orders_reference', 'orders_batch', 'order_state', 'cli_startup')
+PERCENTILES = (50, 95, 99)
+
+def _peak_rss_bytes():
+    """Peak resident set size of the current process."""
+    try:
+        import resource
+    except ImportError:
+        # Windows: no resource module, psutil reports the peak working set instead
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def latency_summary(samples):
+    """Percentiles, mean and maximum of latency samples in seconds."""
+    samples = np.asarray(samples, dtype=float)
+    if samples.size == 0:
+        return {}
+    summary = {f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES))}
+    summary.update(mean=float(samples.mean()), max=float(samples.max()), samples=int(samples.size))
+    return summary
+
+def _timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - started
+
+# --------------------------------------------------------------------------------
+# STAGES
+# A stage takes the benchmark configuration and returns
+# (units processed, unit name, latency samples in seconds, extra fields).
+# Data preparation a stage needs is done before its clock starts.
+# --------------------------------------------------------------------------------
+
+def _stage_load_csv(config):
+    from data_cache import load_prepared_data
+    seconds = [_timed(load_prepared_data, config['products_path'], config['transactions_path'], cache_dir=None)
+               for _ in range(config['repeat'])]
+    return config['lines'], 'lines', seconds, {}
+
+def _stage_load_cache(config):
+    from data_cache import load_prepared_data
+    cache_dir = config['cache_dir']
+    cold = _timed(load_prepared_data, config['products_path'], config['transactions_path'], cache_dir)
+    seconds = [_timed(load_prepared_data, config['products_path'], config['transactions_path'], cache_dir)
+               for _ in range(config['repeat'])]
+    return config['lines'], 'lines', seconds, {'cold_seconds': cold}
+
+def _stage_analyze(config):
+    import analysis
+    df = analysis.load_and_prepare_data(config['products_path'], config['transactions_path'])
+    functions = (analysis.analyze_turnover_by_category, analysis.analyze_orders_by_weekday,
+                 analysis.analyze_cosold_with_tv, analysis.analyze_marketing_impact)
+    parts = {function.__name__: [] for function in functions}
+    seconds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(config['repeat']):
+            for function in functions:
+                parts[function.__name__].append(_timed(function, df))
+            seconds.append(sum(times[-1] for times in parts.values()))
+    return len(df), 'lines', seconds, {'parts': {name: float(np.median(times)) for name, times in parts.items()}}
+
+def _stage_stream(config):
+    import analysis
+    seconds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(config['repeat']):
+            started = time.perf_counter()
+            aggregates = analysis.load_aggregates_streaming(config['products_path'], config['transactions_path'], config['chunksize'])
+            analysis.print_report(aggregates)
+            seconds.append(time.perf_counter() - started)
+    return config['lines'], 'lines', seconds, {'chunksize': config['chunksize']}
+
+def _stage_parallel(config):
+    from parallel_analysis import run_parallel
+    # The cache is built before the clock starts; the stage measures the map-reduce itself
+    run_parallel(config['products_path'], config['transactions_path'], config['cache_dir'], workers=1, partitions=1)
+    seconds = [_timed(run_parallel, config['products_path'], config['transactions_path'], config['cache_dir'], config['workers'])
+               for _ in range(config['repeat'])]
+    return config['lines'], 'lines', seconds, {'workers': config['workers'] or os.cpu_count()}
+
+@contextlib.contextmanager
+def _patched_order_automation(stock, insure_fn, insurance_latency):
+    """The per-order path looks the stock and the insurance call up at module level; they are restored afterwards."""
+    import order_automation
+    module_state = order_automation.MOCK_STOCK, order_automation.arrange_insurance, order_automation.INSURANCE_LATENCY_S
+    order_automation.MOCK_STOCK, order_automation.arrange_insurance = stock, insure_fn
+    order_automation.INSURANCE_LATENCY_S = insurance_latency
+    try:
+        yield
+    finally:
+        order_automation.MOCK_STOCK, order_automation.arrange_insurance, order_automation.INSURANCE_LATENCY_S = module_state
+
+def _run_orders(config, reference):
+    """
+    Processes the orders in micro-batches of config['order_batch'] orders. The latency of an
+    order is the time until its micro-batch is done. Each micro-batch gets only its own
+    transaction lines, as a pipeline feeding new orders would pass them.
+    """
+    import order_automation
+    from data_cache import load_prepared_data
+    from insurance import InsuranceDispatcher
+    from inventory import InventoryLedger
+    from metrics import PipelineMetrics
+
+    random.seed(config['seed'])
+    stock = load_stock(config['stock_path'])
+    transactions_df = load_prepared_data(config['products_path'], config['transactions_path'], config['cache_dir'])
+    orders_table = order_automation.build_orders_table(transactions_df)
+    if reference:
+        orders_table = orders_table.iloc[:config['reference_orders']]
+    transaction_ids = transactions_df['Transaction ID'].to_numpy()
+    order_ids = orders_table.index.to_numpy()
+    batches = [order_ids[start:start + config['order_batch']] for start in range(0, len(order_ids), config['order_batch'])]
+
+    insurance_seconds = []
+    arrange_insurance = order_automation.arrange_insurance
+
+    def timed_insurance(order_id, total_value):
+        started = time.perf_counter()
+        try:
+            return arrange_insurance(order_id, total_value)
+        finally:
+            insurance_seconds.append(time.perf_counter() - started)
+
+    batch_seconds = []
+    metrics = PipelineMetrics()
+    ledger = None if reference else InventoryLedger(stock)
+    catalog = order_automation.build_catalog(stock, pd.read_csv(config['products_path']))
+    with _patched_order_automation(stock, timed_insurance, config['insurance_latency']):
+        with contextlib.ExitStack() as stack:
+            insurance = None if reference else stack.enter_context(InsuranceDispatcher(
+                timed_insurance, max_in_flight=config['insurance_workers'], seed=config['seed']))
+            for batch_ids in batches:
+                first, last = np.searchsorted(transaction_ids, batch_ids[0], 'left'), np.searchsorted(transaction_ids, batch_ids[-1], 'right')
+                batch_orders = orders_table.loc[batch_ids].copy()
+                batch_lines = transactions_df.iloc[first:last]
+                started = time.perf_counter()
+                if reference:
+                    order_automation.process_orders(batch_orders, batch_lines, metrics=metrics)
+                else:
+                    order_automation.process_orders_batch(batch_orders, batch_lines, catalog, insurance=insurance, ledger=ledger, metrics=metrics)
+                batch_seconds.append(time.perf_counter() - started)
+
+    order_latencies = np.repeat(batch_seconds, [len(batch_ids) for batch_ids in batches])
+    snapshot = metrics.snapshot()
+    extra = {
+        'elapsed_seconds': float(sum(batch_seconds)),
+        'order_batch': config['order_batch'],
+        'insurance_latency_s': config['insurance_latency'],
+        'insurance_calls': latency_summary(insurance_seconds),
+        'statuses': snapshot['counters'].get('status', {}),
+        'pipeline_stages': {stage: {key: histogram[key] for key in ('count', 'p50', 'p95', 'p99')}
+                            for stage, histogram in snapshot['stages'].items()},
+    }
+    return len(order_ids), 'orders', order_latencies, extra
+
+def _stage_orders_reference(config):
+    return _run_orders(config, reference=True)
+
+def _stage_orders_batch(config):
+    return _run_orders(config, reference=False)
+
+def _stage_order_state(config):
+    """
+    Today's orders table against the encoded OrderState after processing the same orders:
+    memory of each layout and the latency of a status filter (the units are the orders filtered).
+    """
+    import order_automation
+    from data_cache import load_prepared_data
+    from order_state import OrderState, OrderStatus
+
+    stock = load_stock(config['stock_path'])
+    transactions_df = load_prepared_data(config['products_path'], config['transactions_path'], config['cache_dir'])
+    catalog = order_automation.build_catalog(stock, pd.read_csv(config['products_path']))
+    orders_df = order_automation.build_orders_table(transactions_df)
+    state = OrderState.from_frame(orders_df)
+    # The insurer answers at once and both layouts see the same random failures, so they end in the same state
+    with _patched_order_automation(stock, order_automation.arrange_insurance, 0.0):
+        random.seed(config['seed'])
+        order_automation.process_orders_batch(orders_df, transactions_df, catalog)
+        random.seed(config['seed'])
+        order_automation.process_order_state(state, transactions_df, catalog)
+
+    n_filters = config['repeat'] * 10
+    frame_seconds = [_timed(orders_df['status'].__eq__, 'čeká na naskladnění') for _ in range(n_filters)]
+    state_seconds = [_timed(state.status.__eq__, OrderStatus.WAITING_FOR_STOCK) for _ in range(n_filters)]
+    frame_bytes = int(orders_df.memory_usage(deep=True).sum())
+    return len(state), 'orders', state_seconds, {
+        'frame_bytes': frame_bytes,
+        'state_bytes': int(state.nbytes),
+        'memory_ratio': frame_bytes / state.nbytes,
+        'frame_filter_seconds': float(np.median(frame_seconds)),
+        'filter_speedup': float(np.median(frame_seconds) / np.median(state_seconds)),
+        'decode_seconds': _timed(state.to_frame),
+    }
+
+def _stage_cli_startup(config):
+    """Cold start of the quick CLI subcommands (a fresh interpreter per call) against a bare `import pandas`."""
+    import subprocess
+    cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    data_dir = os.path.dirname(config['products_path'])
+    cli = [sys.executable, cli_path, '--data-dir', data_dir, '--out-dir', data_dir, '--cache-dir', config['cache_dir'],
+           '--stock', config['stock_path']]
+    commands = {'catalog': cli + ['catalog'], 'status': cli + ['status'], 'import_pandas': [sys.executable, '-c', 'import pandas']}
+    # The first call builds the catalog snapshot; it is not part of the measurement
+    subprocess.run(commands['catalog'], check=True, stdout=subprocess.DEVNULL)
+    samples = {name: [] for name in commands}
+    for _ in range(config['repeat'] * 5):
+        for name, command in commands.items():
+            samples[name].append(_timed(subprocess.run, command, stdout=subprocess.DEVNULL))
+    seconds = samples['catalog'] + samples['status']
+    return len(seconds), 'calls', seconds, {'commands': {name: float(np.median(times)) for name, times in samples.items()}}
+
+STAGE_FUNCTIONS = {
+    'load_csv': _stage_load_csv,
+    'load_cache': _stage_load_cache,
+    'analyze': _stage_analyze,
+    'stream': _stage_stream,
+    'parallel': _stage_parallel,
+    'orders_reference': _stage_orders_reference,
+    'orders_batch': _stage_orders_batch,
+    'order_state': _stage_order_state,
+    'cli_startup': _stage_cli_startup,
+}
+
+def run_stage(name, config):
+    """Runs one stage in the current process and returns its measurements."""
+    logging.disable(logging.CRITICAL)
+    try:
+        units, unit_name, latencies, extra = STAGE_FUNCTIONS[name](config)
+    finally:
+        logging.disable(logging.NOTSET)
+    latencies = np.asarray(latencies, dtype=float)
+    # Order stages sum their micro-batches; other stages report the median repetition
+    seconds = extra.pop('elapsed_seconds', float(np.median(latencies)) if latencies.size else 0.0)
+    return {
+        'units': int(units),
+        'unit': unit_name,
+        'seconds': seconds,
+        'throughput': units / seconds if seconds > 0 else None,
+        'latency': latency_summary(latencies),
+        'peak_rss_bytes': int(_peak_rss_bytes()),
+        **extra,
+    }
+
+# --------------------------------------------------------------------------------
+# SUITE AND COMPARISON
+# --------------------------------------------------------------------------------
+
+def run_benchmarks(dataset, stages=STAGES, repeat=3, isolate=True, chunksize=250_000, workers=None, order_batch=1000,
+                   reference_orders=2000, insurance_latency=0.001, insurance_workers=8, cache_dir=None):
+    """
+    Runs the selected stages on a dataset from synthetic_data.generate_dataset.
+    With isolate=True every stage runs in a fresh (spawned) process; otherwise in this
+    one, where the reported peak RSS is the peak of the whole process so far.
+    Returns the result document that save_result writes as JSON.
+    """
+    paths = dataset['paths']
+    config = {
+        'products_path': paths['Products'], 'transactions_path': paths['Transactions'], 'stock_path': paths['Stock'],
+        'cache_dir': cache_dir or os.path.join(os.path.dirname(paths['Transactions']), 'cache'),
+        'lines': dataset['lines'], 'seed': dataset['seed'], 'repeat': repeat, 'chunksize': chunksize, 'workers': workers,
+        'order_batch': order_batch, 'reference_orders': reference_orders,
+        'insurance_latency': insurance_latency, 'insurance_workers': insurance_workers,
+    }
+
+    results = {}
+    for name in stages:
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results[name] = pool.submit(run_stage, name, config).result()
+        else:
+            results[name] = run_stage(name, config)
+
+    return {
+        'version': RESULT_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'pandas': pd.__version__, 'numpy': np.__version__,
+        },
+        'dataset': {key: value for key, value in dataset.items() if key != 'paths'},
+        'config': {key: value for key, value in config.items() if not key.endswith(('_path', '_dir'))},
+        'stages': results,
+    }
+
+def save_result(result, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+def load_result(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def compare_results(baseline, current, tolerance=0.10):
+    """
+    Compares the stages both results have in common.
+    Returns a list of (stage, metric, baseline value, current value, relative change, is_regression)
+    for throughput (higher is better), p95 latency and peak RSS (lower is better).
+    """
+    rows = []
+    for stage in (name for name in current['stages'] if name in baseline['stages']):
+        old, new = baseline['stages'][stage], current['stages'][stage]
+        metrics = (
+            ('throughput', old.get('throughput'), new.get('throughput'), True),
+            ('latency_p95', old['latency'].get('p95'), new['latency'].get('p95'), False),
+            ('peak_rss_bytes', old.get('peak_rss_bytes'), new.get('peak_rss_bytes'), False),
+        )
+        for metric, old_value, new_value, higher_is_better in metrics:
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            is_regression = change < -tolerance if higher_is_better else change > tolerance
+            rows.append((stage, metric, old_value, new_value, change, is_regression))
+    return rows
+
+def print_result(result):
+    print(f"{'Fáze':<18}{'jednotek':>12}{'čas [s]':>10}{'propustnost [/s]':>18}"
+          f"{'p50 [ms]':>10}{'p95 [ms]':>10}{'p99 [ms]':>10}{'špička RSS [MB]':>17}")
+    for name, stage in result['stages'].items():
+        latency = stage['latency']
+        print(f"{name:<18}{stage['units']:>12,}{stage['seconds']:>10.3f}{stage['throughput'] or 0:>18,.0f}"
+              f"{latency.get('p50', 0) * 1000:>10.1f}{latency.get('p95', 0) * 1000:>10.1f}{latency.get('p99', 0) * 1000:>10.1f}"
+              f"{stage['peak_rss_bytes'] / 2**20:>17.1f}")
+    layouts = result['stages'].get('order_state')
+    if layouts:
+        print(f"\nStav objednávek: tabulka {layouts['frame_bytes'] / 2**20:.1f} MB, kódovaný {layouts['state_bytes'] / 2**20:.1f} MB "
+              f"({layouts['memory_ratio']:.1f}x méně); filtr podle stavu {layouts['filter_speedup']:.1f}x rychlejší, "
+              f"export do textu {layouts['decode_seconds'] * 1000:.1f} ms")
+    startup = result['stages'].get('cli_startup')
+    if startup:
+        commands = startup['commands']
+        print(f"\nStudený start CLI: catalog {commands['catalog'] * 1000:.1f} ms, status {commands['status'] * 1000:.1f} ms "
+              f"(samotné import pandas {commands['import_pandas'] * 1000:.1f} ms)")
+
+def print_comparison(rows):
+    print(f"{'Fáze':<18}{'metrika':<16}{'předtím':>16}{'nyní':>16}{'změna':>10}")
+    for stage, metric, old_value, new_value, change, is_regression in rows:
+        flag = "  <-- ZHORŠENÍ" if is_regression else ""
+        print(f"{stage:<18}{metric:<16}{old_value:>16,.3f}{new_value:>16,.3f}{change:>+10.1%}{flag}")
+
+def main(argv=None):
+    """Generates (or reuses) a synthetic dataset, runs the benchmarks and saves the result."""
+    parser = argparse.ArgumentParser(description="Výkonnostní testy automatizace objednávek a analýzy.")
+    parser.add_argument('--lines', type=int, default=100_000, help="Počet řádků transakcí syntetických dat.")
+    parser.add_argument('--products', type=int, default=1000, help="Počet produktů v katalogu.")
+    parser.add_argument('--seed', type=int, default=42, help="Semínko generátoru dat.")
+    parser.add_argument('--bench-dir', default='../data/bench', help="Složka pro syntetická data a výsledky.")
+    parser.add_argument('--data-dir', default=None, help="Složka se syntetickými daty (výchozí: <bench-dir>/<počet řádků>).")
+    parser.add_argument('--stages', default=','.join(STAGES), help="Fáze oddělené čárkou.")
+    parser.add_argument('--repeat', type=int, default=3, help="Počet opakování fází analýzy a načítání.")
+    parser.add_argument('--order-batch', type=int, default=1000, help="Počet objednávek v jedné mikro-dávce.")
+    parser.add_argument('--reference-orders', type=int, default=2000, help="Počet objednávek pro původní (per-order) zpracování.")
+    parser.add_argument('--insurance-latency', type=float, default=0.001, help="Simulovaná latence API pojišťovny v sekundách.")
+    parser.add_argument('--workers', type=int, default=None, help="Počet procesů paralelní analýzy.")
+    parser.add_argument('--no-isolate', action='store_true', help="Spouštět fáze v jednom procesu (RSS pak není po fázích).")
+    parser.add_argument('--out', default=None, help="Cesta k výslednému JSON (výchozí: <bench-dir>/result-<čas>.json).")
+    parser.add_argument('--compare', default=None, help="Porovnat s dřívějším výsledkem (JSON).")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Povolená relativní odchylka před ohlášením zhoršení.")
+    args = parser.parse_args(argv)
+
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"neznámé fáze: {', '.join(sorted(unknown))}")
+
+    data_dir = args.data_dir or os.path.join(args.bench_dir, str(args.lines))
+    dataset_path = os.path.join(data_dir, 'dataset.json')
+    dataset = load_result(dataset_path) if os.path.exists(dataset_path) else None
+    if dataset is None or (dataset['lines'], dataset['products'], dataset['seed']) != (args.lines, args.products, args.seed):
+        print(f"Generuji syntetická data ({args.lines:,} řádků) do '{data_dir}'...", file=sys.stderr)
+        dataset = synthetic_data.generate_dataset(data_dir, args.lines, args.products, seed=args.seed)
+        save_result(dataset, dataset_path)
+
+    result = run_benchmarks(dataset, stages, repeat=args.repeat, isolate=not args.no_isolate, workers=args.workers,
+                            order_batch=args.order_batch, reference_orders=args.reference_orders,
+                            insurance_latency=args.insurance_latency)
+    out_path = args.out or os.path.join(args.bench_dir, f"result-{datetime.now():%Y%m%d-%H%M%S}.json")
+    save_result(result, out_path)
+    print_result(result)
+    print(f"\nVýsledek uložen do {out_path}")
+
+    if args.compare:
+        rows = compare_results(load_result(args.compare), result, args.tolerance)
+        print(f"\nPorovnání s {args.compare}:")
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+from catalog_snapshot import SNAPSHOT_PATH, load_snapshot
+
+# --------------------------------------------------------------------------------
+# INTEGER-INDEXED PRODUCT CATALOG
+# Every product gets a dense integer id (its position in Products.csv) and every
+# category a dense id (its position among the sorted category names). Price,
+# category, stock count and weight are parallel arrays indexed by the product id,
+# so looking them up for transaction lines is an array gather (take) instead of a
+# hash merge or a dict lookup per line. Names are hashed once, when transactions
+# are encoded; unknown products are collected in the same pass.
+# --------------------------------------------------------------------------------
+
+UNKNOWN_ID = -1
+ID_DTYPE = np.int32
+
+def gather(values, ids, fill):
+    """values[ids], with `fill` where the id is UNKNOWN_ID (the array is promoted only when needed)."""
+    ids = np.asarray(ids)
+    if len(values) == 0:
+        return np.full(len(ids), fill)
+    result = values.take(ids)
+    missing = ids < 0
+    return np.where(missing, fill, result) if missing.any() else result
+
+class ProductCatalog:
+    """
+    Products as parallel arrays; position i describes product product_names[i].
+    - category_ids: int32 category id per product (-1 without a category), category_names: labels by category id
+    - prices: price per product (NaN without a price)
+    - stock_counts (int64), weights_kg (float64), in_stock (bool): the stock system aligned with the product ids
+    The ids of a catalog built from a products table are the 'Product ID' of transactions prepared
+    from the same table; a stock-only catalog (from_stock) has its own ids and is used by name.
+    """
+
+    def __init__(self, product_names, categories, prices, stock=None):
+        self.product_names = np.asarray(product_names, dtype=object)
+        self.product_index = pd.Index(self.product_names)
+        if not self.product_index.is_unique:
+            duplicates = sorted(set(self.product_index[self.product_index.duplicated()]))
+            raise ValueError(f"Katalog produktů obsahuje duplicitní názvy: {duplicates}")
+        category_ids, category_names = pd.factorize(np.asarray(categories, dtype=object), sort=True)
+        self.category_ids = category_ids.astype(ID_DTYPE)
+        self.category_names = np.asarray(category_names, dtype=object)
+        self._category_labels = pd.Index(self.category_names)
+        self.prices = np.asarray(prices)
+        self.stock_counts = np.zeros(len(self.product_names), dtype=np.int64)
+        self.weights_kg = np.zeros(len(self.product_names), dtype=np.float64)
+        self.in_stock = np.zeros(len(self.product_names), dtype=bool)
+        self.stock_only = False
+        if stock:
+            self.set_stock(stock)
+
+    @classmethod
+    def from_products(cls, products_df, stock=None):
+        """Catalog of a products table with 'Product name', 'Category' and 'Price' columns."""
+        return cls(products_df['Product name'].to_numpy(), products_df['Category'].to_numpy(), products_df['Price'].to_numpy(), stock)
+
+    @classmethod
+    def from_stock(cls, stock):
+        """Catalog of the products of a {product: (stock_count, weight_kg)} stock, without categories and prices."""
+        catalog = cls(list(stock), [None] * len(stock), np.full(len(stock), np.nan), stock)
+        catalog.stock_only = True
+        return catalog
+
+    @classmethod
+    def load(cls, products_path='../data/in/Products.csv', stock_path=None, snapshot_path=SNAPSHOT_PATH):
+        """Catalog of Products.csv and a Stock.json (MOCK_STOCK without one), read from the precompiled snapshot when it is fresh."""
+        snapshot = load_snapshot(products_path, stock_path, snapshot_path)
+        return cls(snapshot.product_names, snapshot.categories, snapshot.prices, snapshot.stock)
+
+    def __len__(self):
+        return len(self.product_names)
+
+    def set_stock(self, stock):
+        """
+        Aligns a {product: (stock_count, weight_kg)} stock with the product ids. Catalog products
+        missing from the stock are not in stock. Returns the stock products the catalog does not know.
+        """
+        positions = self.product_index.get_indexer(list(stock))
+        values = np.array(list(stock.values()), dtype=np.float64).reshape(-1, 2)
+        known = positions >= 0
+        self.stock_counts[:] = 0
+        self.weights_kg[:] = 0.0
+        self.in_stock[:] = False
+        self.stock_counts[positions[known]] = values[known, 0].astype(np.int64)
+        self.weights_kg[positions[known]] = values[known, 1]
+        self.in_stock[positions[known]] = True
+        return [product for product, is_known in zip(stock, known) if not is_known]
+
+    def stock(self):
+        """The stock of the catalog products as a {product: (stock_count, weight_kg)} dict, the format of MOCK_STOCK."""
+        return {name: (int(count), float(weight)) for name, count, weight
+                in zip(self.product_names[self.in_stock], self.stock_counts[self.in_stock], self.weights_kg[self.in_stock])}
+
+    def encode(self, product_names):
+        """
+        Ids of the given product names (UNKNOWN_ID for names not in the catalog) in a single
+        hash pass over the names; for categorical names only the categories are looked up.
+        Returns (ids, unknown) where unknown lists the distinct unknown names in order of appearance.
+        """
+        names = product_names if isinstance(product_names, pd.Series) else pd.Series(product_names, dtype=object)
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            codes = names.cat.codes.to_numpy()
+            category_ids = self.product_index.get_indexer(names.cat.categories)
+            ids = np.where(codes >= 0, category_ids.take(codes) if len(category_ids) else UNKNOWN_ID, UNKNOWN_ID)
+        else:
+            ids = self.product_index.get_indexer(names)
+        ids = ids.astype(ID_DTYPE)
+        # Unknown lines are rare, so collecting their distinct names is cheap
+        unknown = [name for name in names[ids < 0].unique() if not pd.isna(name)]
+        return ids, unknown
+
+    def positions_in(self, index):
+        """Position of every catalog product in another product index (e.g. a ledger's), -1 where it is missing."""
+        return index.get_indexer(self.product_names)
+
+    # --- Gathers by product id ---
+
+    def prices_of(self, ids):
+        return gather(self.prices, ids, np.nan)
+
+    def category_ids_of(self, ids):
+        return gather(self.category_ids, ids, UNKNOWN_ID)
+
+    def categories_of(self, ids):
+        """Categories of the products as a Categorical over the sorted category names (NaN for unknown products)."""
+        return pd.Categorical.from_codes(self.category_ids_of(ids), self.category_names)
+
+    def stock_of(self, ids):
+        """(stock_count, weight_kg, in_stock) arrays of the products; unknown products are not in stock."""
+        return gather(self.stock_counts, ids, 0), gather(self.weights_kg, ids, 0.0), gather(self.in_stock, ids, False)
+
+    def join(self, transactions_df):
+        """
+        Adds 'Product ID', 'Category' and 'Price' to transactions with a 'Product name' column,
+        as a left merge with the products table would (NaN for unknown products), using gathers.
+        Returns (joined frame, unknown product names).
+        """
+        ids, unknown = self.encode(transactions_df['Product name'])
+        joined = transactions_df.copy(deep=False)
+        joined.insert(joined.columns.get_loc('Product name') + 1, 'Product ID', ids)
+        labels = self._category_labels.take(self.category_ids_of(ids), allow_fill=True, fill_value=np.nan)
+        joined['Category'] = pd.Series(labels, index=joined.index)
+        joined['Price'] = self.prices_of(ids)
+        return joined, unknown
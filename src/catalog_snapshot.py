@@ -0,0 +1,112 @@
+import csv
+import json
+import marshal
+import os
+import sys
+
+# --------------------------------------------------------------------------------
+# PRECOMPILED CATALOG SNAPSHOT
+# The product catalog (name, category, price) and the stock table (stock count,
+# weight) as one marshal file, so quick commands can read them without pandas
+# and without parsing CSV/JSON. Only the standard library is imported here.
+# The snapshot is tied to the size and mtime of its sources (and to the Python
+# version, since the marshal format may change) and is rebuilt when they change.
+# --------------------------------------------------------------------------------
+
+SNAPSHOT_PATH = '../data/cache/catalog.snapshot'
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Without a Stock.json the stock table is MOCK_STOCK, defined in this file
+BUILTIN_STOCK_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_stock.py')
+
+class CatalogSnapshot:
+    """Products as parallel lists (position i describes product_names[i]) and the stock as {product: (stock_count, weight_kg)}."""
+
+    def __init__(self, product_names, categories, prices, stock):
+        self.product_names = product_names
+        self.categories = categories
+        self.prices = prices
+        self.stock = stock
+        self._positions = {name: position for position, name in enumerate(product_names)}
+
+    def __len__(self):
+        return len(self.product_names)
+
+    def product(self, name):
+        """Category, price, stock count and weight of a product (None for fields the sources do not know); None for an unknown product."""
+        position = self._positions.get(name)
+        if position is None and name not in self.stock:
+            return None
+        stock_count, weight_kg = self.stock.get(name, (None, None))
+        return {
+            'category': None if position is None else self.categories[position],
+            'price': None if position is None else self.prices[position],
+            'stock_count': stock_count,
+            'weight_kg': weight_kg,
+        }
+
+def _number(text):
+    return float(text) if '.' in text else int(text)
+
+def read_products_csv(products_path):
+    """Reads Products.csv with the csv module; returns (names, categories, prices)."""
+    names, categories, prices = [], [], []
+    with open(products_path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            names.append(row['Product name'])
+            categories.append(row['Category'])
+            prices.append(_number(row['Price']))
+    return names, categories, prices
+
+def _read_stock(stock_path):
+    if stock_path is None:
+        # Imported only when the snapshot is rebuilt
+        from mock_stock import MOCK_STOCK
+        return dict(MOCK_STOCK)
+    with open(stock_path, encoding='utf-8') as f:
+        return {product: tuple(values) for product, values in json.load(f).items()}
+
+def _source_key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+def _sources(products_path, stock_path):
+    return {'products': _source_key(products_path), 'stock': _source_key(stock_path or BUILTIN_STOCK_SOURCE)}
+
+def build_snapshot(products_path='../data/in/Products.csv', stock_path=None, snapshot_path=SNAPSHOT_PATH):
+    """Reads the sources and writes the snapshot (atomically); with snapshot_path=None nothing is written."""
+    sources = _sources(products_path, stock_path)
+    names, categories, prices = read_products_csv(products_path)
+    snapshot = CatalogSnapshot(names, categories, prices, _read_stock(stock_path))
+    if snapshot_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+        payload = {
+            'version': SNAPSHOT_FORMAT_VERSION, 'python': tuple(sys.version_info[:2]), 'sources': sources,
+            'product_names': names, 'categories': categories, 'prices': prices, 'stock': snapshot.stock,
+        }
+        tmp_path = snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            marshal.dump(payload, f)
+        os.replace(tmp_path, snapshot_path)
+    return snapshot
+
+def _read_payload(snapshot_path):
+    try:
+        with open(snapshot_path, 'rb') as f:
+            payload = marshal.loads(f.read())
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('version') != SNAPSHOT_FORMAT_VERSION or payload.get('python') != tuple(sys.version_info[:2]):
+        return None
+    return payload
+
+def load_snapshot(products_path='../data/in/Products.csv', stock_path=None, snapshot_path=SNAPSHOT_PATH):
+    """
+    Returns the CatalogSnapshot of the given sources, from the snapshot file when it is fresh.
+    A missing or stale snapshot is rebuilt. Raises FileNotFoundError when a source file is missing.
+    """
+    if snapshot_path is not None:
+        payload = _read_payload(snapshot_path)
+        if payload is not None and payload['sources'] == _sources(products_path, stock_path):
+            return CatalogSnapshot(payload['product_names'], payload['categories'], payload['prices'], payload['stock'])
+    return build_snapshot(products_path, stock_path, snapshot_path)
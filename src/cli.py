@@ -0,0 +1,166 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+# --------------------------------------------------------------------------------
+# COMMAND LINE ENTRY POINT
+# One command for the analysis, the order automation, the delta export and the
+# benchmarks. Only the standard library is imported at start; a subcommand imports
+# the modules it needs (and with them pandas) when it runs. The quick subcommands
+# (status, catalog) never import pandas: they read the orders with csv/sqlite3
+# and the catalog from the precompiled marshal snapshot.
+# Paths are resolved against the repository, so the command works from any folder.
+# --------------------------------------------------------------------------------
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_DIR = os.path.join(REPO_DIR, 'data', 'in')
+DEFAULT_OUT_DIR = os.path.join(REPO_DIR, 'data', 'out')
+DEFAULT_CACHE_DIR = os.path.join(REPO_DIR, 'data', 'cache')
+DEFAULT_BENCH_DIR = os.path.join(REPO_DIR, 'data', 'bench')
+
+class Paths:
+    """Input, output and cache locations of one invocation."""
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR, out_dir=DEFAULT_OUT_DIR, cache_dir=DEFAULT_CACHE_DIR, stock=None):
+        self.products = os.path.join(data_dir, 'Products.csv')
+        self.transactions = os.path.join(data_dir, 'Transactions.csv')
+        self.stock = stock
+        self.cache_dir = cache_dir
+        self.snapshot = os.path.join(cache_dir, 'catalog.snapshot')
+        self.output = os.path.join(out_dir, 'output.csv')
+        self.delta = os.path.join(out_dir, 'output_delta.csv')
+        self.insurance_cache = os.path.join(cache_dir, 'insurance_decisions.sqlite')
+
+# --------------------------------------------------------------------------------
+# HEAVY SUBCOMMANDS
+# They run the main() of their script. The path options go first, so options
+# given on the command line after the subcommand override them.
+# --------------------------------------------------------------------------------
+
+def run_analyze(paths, argv):
+    import analysis
+    analysis.main(['--products', paths.products, '--transactions', paths.transactions, '--cache-dir', paths.cache_dir] + argv)
+
+def run_incremental(paths, argv):
+    import incremental
+    incremental.main(['--products', paths.products, '--transactions', paths.transactions,
+                      '--state', os.path.join(paths.cache_dir, 'analysis_state.json')] + argv)
+
+def run_process(paths, argv):
+    import order_automation
+    path_options = ['--products', paths.products, '--transactions', paths.transactions, '--cache-dir', paths.cache_dir,
+                    '--output', paths.output, '--delta-file', paths.delta, '--insurance-cache', paths.insurance_cache]
+    if paths.stock:
+        path_options += ['--stock', paths.stock]
+    order_automation.main(path_options + argv)
+
+def run_export(paths, argv):
+    import delta_export
+    delta_export.main(['--delta', paths.delta, '--snapshot', paths.output] + argv)
+
+def run_bench(paths, argv):
+    import benchmark
+    benchmark.main(['--bench-dir', DEFAULT_BENCH_DIR] + argv)
+
+HEAVY_COMMANDS = {
+    'analyze': (run_analyze, "Analýza prodejních dat (analysis.py)."),
+    'incremental': (run_incremental, "Inkrementální analýza nově připsaných transakcí (incremental.py)."),
+    'process': (run_process, "Automatizace zpracování objednávek (order_automation.py)."),
+    'export': (run_export, "Sloučení souboru změn do úplného exportu (delta_export.py)."),
+    'bench': (run_bench, "Výkonnostní testy (benchmark.py)."),
+}
+
+# --------------------------------------------------------------------------------
+# QUICK SUBCOMMANDS
+# --------------------------------------------------------------------------------
+
+def _count_rows(path):
+    """Number of lines after the header."""
+    with open(path, 'rb') as f:
+        lines = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b''))
+    return max(lines - 1, 0)
+
+def order_status_counts(output_path=None, store_path=None):
+    """Orders per status from an orders database (orders_store.SqliteOrdersStore) or from the output.csv export."""
+    if store_path is not None:
+        with sqlite3.connect(f"file:{store_path}?mode=ro", uri=True) as connection:
+            rows = connection.execute('SELECT status, COUNT(*) FROM orders GROUP BY status').fetchall()
+        return dict(rows)
+    counts = {}
+    with open(output_path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            counts[row['status']] = counts.get(row['status'], 0) + 1
+    return counts
+
+def run_status(paths, args):
+    source = args.store or paths.output
+    if not os.path.exists(source):
+        print(f"Stav objednávek není k dispozici: soubor '{source}' neexistuje.")
+        return 1
+    counts = order_status_counts(paths.output, args.store)
+    print(f"Objednávky v '{source}': {sum(counts.values()):,}")
+    for status, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {status:<30}{count:>10,}")
+    if os.path.exists(paths.delta):
+        print(f"Nesloučené změny v '{paths.delta}': {_count_rows(paths.delta):,}")
+    return 0
+
+def run_catalog(paths, args):
+    from catalog_snapshot import build_snapshot, load_snapshot
+    snapshot_path = None if args.no_snapshot else paths.snapshot
+    try:
+        if args.rebuild:
+            catalog = build_snapshot(paths.products, paths.stock, snapshot_path)
+        else:
+            catalog = load_snapshot(paths.products, paths.stock, snapshot_path)
+    except FileNotFoundError as e:
+        print(f"CHYBA: Vstupní soubor nebyl nalezen: {e}")
+        return 1
+    if not args.product:
+        print(f"Katalog: {len(catalog):,} produktů v {len(set(catalog.categories)):,} kategoriích, sklad: {len(catalog.stock):,} produktů.")
+        return 0
+    for name in args.product:
+        product = catalog.product(name)
+        if product is None:
+            print(f"{name}: nenalezen v katalogu ani ve skladu")
+            continue
+        print(f"{name}: kategorie {product['category'] or '-'}, cena {product['price'] if product['price'] is not None else '-'}, "
+              f"skladem {product['stock_count'] if product['stock_count'] is not None else '-'}, "
+              f"hmotnost {product['weight_kg'] if product['weight_kg'] is not None else '-'} kg")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Analýza prodejů a automatizace objednávek.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Složka s Products.csv a Transactions.csv.")
+    parser.add_argument('--out-dir', default=DEFAULT_OUT_DIR, help="Složka pro output.csv a soubor změn.")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Složka pro binární cache a snapshot katalogu.")
+    parser.add_argument('--stock', default=None, help="Stav skladu (Stock.json); výchozí je MOCK_STOCK z mock_stock.py.")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='příkaz')
+
+    # The heavy subcommands leave their options (including --help) to their script
+    for name, (_, help_text) in HEAVY_COMMANDS.items():
+        commands.add_parser(name, help=help_text, add_help=False)
+
+    status = commands.add_parser('status', help="Počty objednávek podle stavu (bez pandas).")
+    status.add_argument('--store', default=None, help="Databáze SQLite se stavem objednávek místo output.csv.")
+    catalog = commands.add_parser('catalog', help="Produkty z předkompilovaného snapshotu katalogu a skladu (bez pandas).")
+    catalog.add_argument('product', nargs='*', help="Názvy produktů k vypsání (bez nich jen souhrn).")
+    catalog.add_argument('--rebuild', action='store_true', help="Znovu sestavit snapshot ze zdrojových souborů.")
+    catalog.add_argument('--no-snapshot', action='store_true', help="Číst zdrojové soubory bez snapshotu.")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    paths = Paths(args.data_dir, args.out_dir, args.cache_dir, args.stock)
+    if args.command in HEAVY_COMMANDS:
+        run, _ = HEAVY_COMMANDS[args.command]
+        return run(paths, extra)
+    if extra:
+        parser.error(f"neznámé argumenty: {' '.join(extra)}")
+    return run_status(paths, args) if args.command == 'status' else run_catalog(paths, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from data_cache import CACHE_DIR, load_prepared_data
+
+# --------------------------------------------------------------------------------
+# BASKET CO-OCCURRENCE ENGINE
+# One sparse basket x item incidence matrix is built per item level (category or
+# product). Its product with itself gives the co-occurrence counts of all item
+# pairs at once; support and lift follow from the counts. No dense
+# basket x item or item x item intermediates are created.
+# --------------------------------------------------------------------------------
+
+class CooccurrenceEngine:
+    """
+    Co-purchase statistics of items (categories or products) over baskets (transactions).
+    - counts[i, j]: number of baskets containing both i and j; counts[i, i]: baskets containing i.
+    - support: share of baskets containing the item (pair).
+    - lift: pair support divided by the product of the item supports.
+    """
+
+    def __init__(self, basket_ids, items):
+        items = pd.Series(items)
+        basket_codes, self.baskets = pd.factorize(np.asarray(basket_ids))
+        item_codes, self.items = pd.factorize(items, sort=True)
+        self.items = self.items.rename(items.name)
+        self.n_baskets = len(self.baskets)
+
+        # Lines without an item (e.g. a product missing from the catalog) do not take part
+        known = item_codes >= 0
+        shape = (self.n_baskets, len(self.items))
+        # Number of lines of each item per basket; duplicate (basket, item) entries are summed
+        self.lines = sparse.csr_matrix(
+            (np.ones(known.sum(), dtype=np.int64), (basket_codes[known], item_codes[known])), shape=shape)
+        self.incidence = self.lines.copy()
+        self.incidence.data[:] = 1
+
+        # The single sparse product giving all pair counts
+        self.counts = (self.incidence.T @ self.incidence).tocsr()
+        self.item_baskets = self.counts.diagonal()
+
+    @classmethod
+    def from_frame(cls, df, level='Category'):
+        """Builds the engine from prepared transactions, with items at the given column ('Category' or 'Product name')."""
+        return cls(df['Transaction ID'].to_numpy(), df[level])
+
+    def support(self):
+        """Share of baskets containing each item."""
+        return pd.Series(self.item_baskets / self.n_baskets, index=self.items, name='support')
+
+    def pairs(self, min_count=1):
+        """
+        All pairs of distinct items bought together at least `min_count` times,
+        as a long table with count, support and lift (each unordered pair once).
+        """
+        counts = sparse.triu(self.counts, k=1).tocoo()
+        keep = counts.data >= min_count
+        rows, cols, data = counts.row[keep], counts.col[keep], counts.data[keep]
+        lift = data * self.n_baskets / (self.item_baskets[rows].astype(float) * self.item_baskets[cols])
+        return pd.DataFrame({
+            'item_a': self.items[rows],
+            'item_b': self.items[cols],
+            'count': data,
+            'support': data / self.n_baskets,
+            'lift': lift,
+        }).sort_values(['count', 'item_a', 'item_b'], ascending=[False, True, True], ignore_index=True)
+
+    def bought_together(self, item, k=5, by='count'):
+        """Top-k items most often bought together with `item`, ranked by 'count' or 'lift'."""
+        i = self.items.get_loc(item)
+        row = self.counts.getrow(i).tocoo()
+        others = row.col != i
+        cols, data = row.col[others], row.data[others]
+        result = pd.DataFrame({
+            'item': self.items[cols],
+            'count': data,
+            'support': data / self.n_baskets,
+            'lift': data * self.n_baskets / (float(self.item_baskets[i]) * self.item_baskets[cols]),
+        })
+        return result.sort_values([by, 'item'], ascending=[False, True]).head(k).reset_index(drop=True)
+
+    def cosold_line_counts(self, item):
+        """
+        Lines of other items in baskets containing `item`, most frequent first.
+        With categories and 'Televize' this is the answer of analyze_cosold_with_tv.
+        """
+        i = self.items.get_loc(item)
+        line_counts = (self.incidence[:, [i]].T @ self.lines).toarray().ravel()
+        line_counts[i] = 0
+        counts = pd.Series(line_counts, index=self.items, name='count')
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+def main(argv=None):
+    """Prints the top "bought together" items for every category or product."""
+    parser = argparse.ArgumentParser(description="Statistiky společných nákupů (co-occurrence).")
+    parser.add_argument('--level', choices=['category', 'product'], default='category', help="Úroveň položek: kategorie nebo produkty.")
+    parser.add_argument('--top', type=int, default=3, help="Počet nejčastěji společně kupovaných položek pro každou položku.")
+    parser.add_argument('--by', choices=['count', 'lift'], default='count', help="Řazení podle počtu košíků nebo liftu.")
+    args = parser.parse_args(argv)
+
+    try:
+        df = load_prepared_data(cache_dir=CACHE_DIR)
+    except FileNotFoundError as e:
+        print(f"Chyba: Súbor nebol nájdený. Uistite sa, že súbory sú v priečinku 'data/in'. Detaily: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    engine = CooccurrenceEngine.from_frame(df, 'Category' if args.level == 'category' else 'Product name')
+    print(f"Košíků: {engine.n_baskets}, položek: {len(engine.items)}\n")
+    for item, support in engine.support().items():
+        print(f"{item} (podpora {support:.1%}):")
+        together = engine.bought_together(item, k=args.top, by=args.by)
+        if together.empty:
+            print("  -")
+        for row in together.to_dict('records'):
+            print(f"  {row['item']:<30} košíků: {row['count']:>6}   podpora: {row['support']:6.1%}   lift: {row['lift']:5.2f}")
+
+if __name__ == '__main__':
+    main()
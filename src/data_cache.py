@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from catalog import ProductCatalog
+
+# --------------------------------------------------------------------------------
+# BINARY COLUMNAR CACHE OF THE PREPARED DATA
+# The merged products + transactions frame is stored as one .npy file per column
+# (memory-mappable), with text columns dictionary-encoded as integer codes.
+# The cache is tied to the size, mtime and content hash of the source CSVs and
+# is rebuilt transparently when any of them changes.
+# --------------------------------------------------------------------------------
+
+CACHE_DIR = '../data/cache'
+CACHE_FORMAT_VERSION = 2
+
+def prepare_transactions(products_df, transactions_df, catalog=None):
+    """
+    Prepares raw products and transactions the way both scripts use them.
+    - Renames the column with an extra space.
+    - Joins the products by their catalog id ('Product ID', -1 for unknown products).
+    - Converts the date column to the correct format.
+    - Calculates turnover.
+    A catalog already built from products_df can be passed to skip building it again.
+    """
+    transactions_df = transactions_df.rename(columns={'Product name ': 'Product name'})
+    catalog = catalog or ProductCatalog.from_products(products_df)
+    df, _ = catalog.join(transactions_df)
+    df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y')
+    df['Turnover'] = df['Quantity'] * df['Price']
+    return df
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _source_key(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash(path)}
+
+def _is_fresh(recorded, path):
+    """
+    Size and mtime decide in the common case; when only the mtime changed
+    (e.g. the file was touched or copied), the content hash decides.
+    """
+    stat = os.stat(path)
+    if os.path.abspath(path) != recorded['path'] or stat.st_size != recorded['size']:
+        return False
+    if stat.st_mtime_ns == recorded['mtime_ns']:
+        return True
+    if file_hash(path) != recorded['sha256']:
+        return False
+    recorded['mtime_ns'] = stat.st_mtime_ns
+    return True
+
+def _read_meta(cache_path):
+    try:
+        with open(os.path.join(cache_path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get('version') == CACHE_FORMAT_VERSION else None
+
+def _write_meta(cache_path, meta):
+    tmp_path = os.path.join(cache_path, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(cache_path, 'meta.json'))
+
+def write_columns(df, cache_path, sources):
+    """Stores a frame as one .npy file per column; text columns are dictionary-encoded."""
+    tmp_path = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        file_name = f"col{i}.npy"
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_dtype(series):
+            np.save(os.path.join(tmp_path, file_name), series.to_numpy())
+            columns.append({'name': name, 'file': file_name, 'dtype': str(series.dtype)})
+        else:
+            codes, dictionary = pd.factorize(series)
+            np.save(os.path.join(tmp_path, file_name), codes.astype(np.int32))
+            columns.append({'name': name, 'file': file_name, 'dtype': str(series.dtype), 'dictionary': [str(value) for value in dictionary]})
+
+    _write_meta(tmp_path, {'version': CACHE_FORMAT_VERSION, 'sources': sources, 'rows': len(df), 'columns': columns})
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+
+def open_columns(cache_path, meta):
+    """
+    Memory-maps the cached columns without decoding them.
+    Returns {name: (values, dictionary)}, with dictionary None for plain columns.
+    """
+    return {
+        column['name']: (np.load(os.path.join(cache_path, column['file']), mmap_mode='r'), column.get('dictionary'))
+        for column in meta['columns']
+    }
+
+def read_columns(cache_path, meta, categorical=False):
+    """
+    Loads a cached frame. Numeric columns are memory-mapped; dictionary-encoded columns
+    are decoded back to their original dtype, or kept as pandas categoricals.
+    """
+    dtypes = {column['name']: column['dtype'] for column in meta['columns']}
+    data = {}
+    for name, (values, dictionary) in open_columns(cache_path, meta).items():
+        if dictionary is not None:
+            values = pd.Categorical.from_codes(values, dictionary)
+            if not categorical:
+                values = pd.Series(values).astype(dtypes[name])
+        data[name] = values
+    return pd.DataFrame(data)
+
+def ensure_cache(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', cache_dir=CACHE_DIR):
+    """
+    Makes sure the cache of the prepared frame is fresh, rebuilding it from the CSVs if needed.
+    Returns (cache_path, meta, df) where df is the freshly prepared frame after a rebuild, otherwise None.
+    Raises FileNotFoundError when a source file is missing.
+    """
+    cache_path = os.path.join(cache_dir, 'prepared')
+    meta = _read_meta(cache_path)
+    if meta is not None:
+        recorded = meta['sources']
+        mtimes = (recorded['products']['mtime_ns'], recorded['transactions']['mtime_ns'])
+        if _is_fresh(recorded['products'], products_path) and _is_fresh(recorded['transactions'], transactions_path):
+            # Only the mtime changed and the hash matched: remember the new mtime to skip hashing next time
+            if mtimes != (recorded['products']['mtime_ns'], recorded['transactions']['mtime_ns']):
+                _write_meta(cache_path, meta)
+            return cache_path, meta, None
+
+    df = prepare_transactions(pd.read_csv(products_path), pd.read_csv(transactions_path))
+    sources = {'products': _source_key(products_path), 'transactions': _source_key(transactions_path)}
+    write_columns(df, cache_path, sources)
+    return cache_path, _read_meta(cache_path), df
+
+def load_prepared_data(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', cache_dir=CACHE_DIR, categorical=False):
+    """
+    Returns the prepared (merged) transactions frame, from the cache when it is fresh.
+    A missing or stale cache is rebuilt from the CSVs. With cache_dir=None the cache is bypassed.
+    Raises FileNotFoundError when a source file is missing.
+    """
+    if cache_dir is None:
+        return prepare_transactions(pd.read_csv(products_path), pd.read_csv(transactions_path))
+
+    cache_path, meta, df = ensure_cache(products_path, transactions_path, cache_dir)
+    if df is None or categorical:
+        return read_columns(cache_path, meta, categorical)
+    return df
+
+# --------------------------------------------------------------------------------
+# COLD VS. WARM LOAD BENCHMARK
+# --------------------------------------------------------------------------------
+
+def benchmark_cache(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', cache_dir=CACHE_DIR, repeat=5):
+    """Times loading from the CSVs, a cold load (cache rebuild) and warm loads from the cache."""
+    def timed(function):
+        started = time.perf_counter()
+        function()
+        return time.perf_counter() - started
+
+    csv_seconds = min(timed(lambda: load_prepared_data(products_path, transactions_path, cache_dir=None)) for _ in range(repeat))
+    shutil.rmtree(os.path.join(cache_dir, 'prepared'), ignore_errors=True)
+    cold_seconds = timed(lambda: load_prepared_data(products_path, transactions_path, cache_dir))
+    warm_seconds = min(timed(lambda: load_prepared_data(products_path, transactions_path, cache_dir)) for _ in range(repeat))
+    return {'csv_seconds': csv_seconds, 'cold_seconds': cold_seconds, 'warm_seconds': warm_seconds}
+
+if __name__ == '__main__':
+    paths = sys.argv[1:3] if len(sys.argv) >= 3 else ['../data/in/Products.csv', '../data/in/Transactions.csv']
+    result = benchmark_cache(*paths)
+    print("Načtení připravených dat:")
+    print(f"Z CSV (bez cache):        {result['csv_seconds'] * 1000:10.1f} ms")
+    print(f"Studený start (tvorba):   {result['cold_seconds'] * 1000:10.1f} ms")
+    print(f"Teplý start (z cache):    {result['warm_seconds'] * 1000:10.1f} ms")
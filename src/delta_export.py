@@ -0,0 +1,118 @@
+import argparse
+import datetime
+import os
+import pandas as pd
+
+from orders_store import ORDER_COLUMNS
+
+# --------------------------------------------------------------------------------
+# DELTA EXPORT OF ORDER STATES
+# Instead of rewriting the whole output.csv, a run appends only the orders whose
+# status changed to a delta file, with the change time and the previous status.
+# Compaction folds the delta file into the full snapshot (output.csv layout) and
+# starts a new, empty delta file.
+# --------------------------------------------------------------------------------
+
+DELTA_PATH = '../data/out/output_delta.csv'
+DELTA_COLUMNS = ['Transaction ID', 'changed_at', 'previous_status'] + ORDER_COLUMNS
+BUFFER_SIZE = 1 << 20
+
+# Empty notes stay empty strings; only a missing carrier is read as a missing value
+_READ_OPTIONS = {'dtype': {'notes': str}, 'keep_default_na': False, 'na_values': {'shipping_carrier': ['']}}
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+
+class DeltaWriter:
+    """
+    Appends changed orders to a delta CSV through a buffered file handle, so many small
+    batches of changes cost one write system call per buffer, not per row.
+    The header is written only when the file is new (or empty).
+    """
+
+    def __init__(self, path=DELTA_PATH, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8', newline='', buffering=buffer_size)
+        if self._file.tell() == 0:
+            self._file.write(','.join(DELTA_COLUMNS) + '\n')
+
+    def write_changes(self, previous_status, orders_df, changed_at=None):
+        """
+        Appends the orders of orders_df whose status differs from previous_status (a Series
+        indexed by Transaction ID, e.g. the status column before the run). Returns the number of rows written.
+        """
+        previous_status = previous_status.reindex(orders_df.index)
+        # Orders missing from previous_status are new, so they count as changed
+        changed = orders_df['status'].ne(previous_status).fillna(True).to_numpy(dtype=bool)
+        if not changed.any():
+            return 0
+        rows = orders_df.loc[changed, ORDER_COLUMNS]
+        rows.insert(0, 'previous_status', previous_status[changed])
+        rows.insert(0, 'changed_at', changed_at or _now())
+        rows.to_csv(self._file, header=False, lineterminator='\n')
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_latest_changes(delta_path, chunksize=1_000_000):
+    """The last recorded state of every order in the delta file, read in chunks. Indexed by Transaction ID."""
+    latest = [chunk[~chunk.index.duplicated(keep='last')]
+              for chunk in pd.read_csv(delta_path, index_col='Transaction ID', chunksize=chunksize, **_READ_OPTIONS)]
+    if not latest:
+        return pd.DataFrame(columns=DELTA_COLUMNS).set_index('Transaction ID')
+    changes = pd.concat(latest)
+    return changes[~changes.index.duplicated(keep='last')]
+
+def compact(delta_path, snapshot_path):
+    """
+    Folds the delta file into the snapshot and truncates the delta file.
+    The snapshot is replaced atomically before the delta is truncated, so a crash in between
+    only means the same changes are applied again by the next compaction.
+    Returns the number of orders updated in the snapshot.
+    """
+    if not os.path.exists(delta_path):
+        return 0
+    changes = read_latest_changes(delta_path)
+    if changes.empty:
+        return 0
+    if os.path.exists(snapshot_path):
+        snapshot = pd.read_csv(snapshot_path, index_col='Transaction ID', **_READ_OPTIONS)
+        snapshot = pd.concat([snapshot[~snapshot.index.isin(changes.index)], changes[ORDER_COLUMNS]]).sort_index()
+    else:
+        snapshot = changes[ORDER_COLUMNS].sort_index()
+
+    tmp_path = snapshot_path + '.tmp'
+    snapshot.to_csv(tmp_path, encoding='utf-8')
+    os.replace(tmp_path, snapshot_path)
+    with open(delta_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(DELTA_COLUMNS) + '\n')
+    return len(changes)
+
+def compact_if_needed(delta_path, snapshot_path, max_delta_bytes):
+    """Compacts once the delta file has grown over max_delta_bytes. Returns the number of orders updated (0 when not compacted)."""
+    if not os.path.exists(delta_path) or os.path.getsize(delta_path) <= max_delta_bytes:
+        return 0
+    return compact(delta_path, snapshot_path)
+
+def main(argv=None):
+    """Folds the delta file into the full snapshot from the command line."""
+    parser = argparse.ArgumentParser(description="Sloučení souboru změn objednávek do úplného exportu.")
+    parser.add_argument('--delta', default=DELTA_PATH, help="Soubor se změnami objednávek.")
+    parser.add_argument('--snapshot', default='../data/out/output.csv', help="Úplný export stavu objednávek.")
+    args = parser.parse_args(argv)
+
+    updated = compact(args.delta, args.snapshot)
+    print(f"Do souboru '{args.snapshot}' sloučeno {updated:,} změněných objednávek.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import pandas as pd
+
+from aggregates import AnalysisAggregates, TRANSACTION_DTYPES, fold_chunks
+from analysis import print_report
+from catalog import ProductCatalog
+from data_cache import CACHE_DIR, file_hash, load_prepared_data
+
+# --------------------------------------------------------------------------------
+# INCREMENTAL ANALYSIS
+# The aggregates of all transactions processed so far are persisted together with
+# a watermark (byte offset, last Transaction ID and date). A later run folds only
+# the lines appended to Transactions.csv since then and prints the same report.
+# The last order read may still get more lines appended, so it is not folded into
+# the persisted aggregates: its lines are re-read (from the byte offset where the
+# order starts) on the next run and kept aside as pending aggregates until then.
+# --------------------------------------------------------------------------------
+
+STATE_PATH = os.path.join(CACHE_DIR, 'analysis_state.json')
+STATE_FORMAT_VERSION = 2
+# Bytes before the end of the read lines kept to recognise that the file was only appended to
+TAIL_BYTES = 256
+
+class ByteRange(io.RawIOBase):
+    """Read-only view of an open binary file that ends at a fixed offset."""
+
+    def __init__(self, f, end):
+        self._f = f
+        self._end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._end - self._f.tell())
+        if size <= 0:
+            return 0
+        data = self._f.read(size)
+        buffer[:len(data)] = data
+        return len(data)
+
+def complete_lines_end(path):
+    """Offset just past the last newline, so a line still being written is left for the next run."""
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+def _read_bytes(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+def last_order_start(path, start, end, columns):
+    """
+    Offset of the first line of the last order between two byte offsets (lines of one order
+    are contiguous). Returns start when all the lines belong to one order.
+    """
+    id_position = columns.index('Transaction ID')
+    last_id = None
+    with open(path, 'rb') as f:
+        # buffer holds the bytes from buffer_start up to the lines already scanned
+        buffer_start, buffer = end, b''
+        line_end = end
+        while line_end > start:
+            relative_end = line_end - buffer_start
+            newline = buffer.rfind(b'\n', 0, relative_end - 1)
+            if newline < 0 and buffer_start > start:
+                block_start = max(start, buffer_start - 65536)
+                f.seek(block_start)
+                buffer = f.read(buffer_start - block_start) + buffer[:relative_end]
+                buffer_start = block_start
+                continue
+            line = buffer[newline + 1:relative_end]
+            if line.strip():
+                transaction_id = line.split(b',')[id_position].strip()
+                if last_id is None:
+                    last_id = transaction_id
+                elif transaction_id != last_id:
+                    return line_end
+            line_end = buffer_start + newline + 1
+    return start
+
+def _fold_range(aggregates, catalog, transactions_path, start, end, columns, last_transaction_id, chunksize):
+    """
+    Folds the transaction lines between two byte offsets into the aggregates.
+    Returns the highest Transaction ID seen.
+    """
+    if end <= start:
+        return last_transaction_id
+    with open(transactions_path, 'rb') as f:
+        f.seek(start)
+        reader = pd.read_csv(
+            io.BufferedReader(ByteRange(f, end)), encoding='utf-8-sig', dtype=TRANSACTION_DTYPES, chunksize=chunksize,
+            header=0 if start == 0 else None, names=None if start == 0 else columns,
+        )
+
+        def tracked(chunks):
+            nonlocal last_transaction_id
+            for chunk in chunks:
+                if not chunk.empty:
+                    last_transaction_id = max(last_transaction_id, int(chunk['Transaction ID'].max()))
+                yield chunk
+
+        with reader:
+            fold_chunks(aggregates, tracked(reader), catalog)
+    return last_transaction_id
+
+def current_aggregates(state):
+    """The persisted aggregates together with the pending last order, i.e. all lines read so far."""
+    return AnalysisAggregates.from_dict(state['aggregates']).merge(AnalysisAggregates.from_dict(state['pending']))
+
+def _advance(state, catalog, transactions_path, chunksize):
+    """
+    Folds the complete orders after the state's offset, re-reads the last (possibly incomplete)
+    order as pending and moves the watermark to the end of the file. Returns the number of new lines.
+    """
+    source = state['transactions']
+    end = complete_lines_end(transactions_path)
+    if end <= source['end']:
+        return 0
+
+    rows_before = state['aggregates']['rows'] + state['pending']['rows']
+    aggregates = AnalysisAggregates.from_dict(state['aggregates'])
+    order_start = last_order_start(transactions_path, source['offset'], end, source['columns'])
+    last_transaction_id = _fold_range(aggregates, catalog, transactions_path, source['offset'], order_start,
+                                      source['columns'], state['watermark']['transaction_id'], chunksize)
+    pending = AnalysisAggregates(aggregates.focus_category)
+    last_transaction_id = _fold_range(pending, catalog, transactions_path, order_start, end,
+                                      source['columns'], last_transaction_id, chunksize)
+
+    source['offset'] = order_start
+    source['end'] = end
+    source['tail'] = _read_bytes(transactions_path, max(0, end - TAIL_BYTES), end).hex()
+    state['aggregates'] = aggregates.to_dict()
+    state['pending'] = pending.to_dict()
+    daily_orders = current_aggregates(state).daily_orders
+    state['watermark'] = {
+        'transaction_id': last_transaction_id,
+        'date': max(daily_orders) if daily_orders else None,
+    }
+    return aggregates.rows + pending.rows - rows_before
+
+def _is_valid(state, products_path, transactions_path):
+    """The state can be continued when the products are unchanged and Transactions.csv was only appended to."""
+    if state is None or state.get('version') != STATE_FORMAT_VERSION:
+        return False
+    if state['products']['sha256'] != file_hash(products_path):
+        return False
+    source = state['transactions']
+    if os.path.abspath(transactions_path) != source['path'] or os.path.getsize(transactions_path) < source['end']:
+        return False
+    tail = bytes.fromhex(source['tail'])
+    return (_read_bytes(transactions_path, 0, len(source['header'].encode('utf-8'))).decode('utf-8', 'replace') == source['header']
+            and _read_bytes(transactions_path, source['end'] - len(tail), source['end']) == tail)
+
+def load_state(state_path=STATE_PATH):
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_state(state, state_path=STATE_PATH):
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+def rebuild_state(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', chunksize=1_000_000):
+    """Builds the state from scratch over the whole Transactions.csv."""
+    with open(transactions_path, 'rb') as f:
+        header = f.readline().decode('utf-8')
+    columns = [column.lstrip('\ufeff') for column in header.rstrip('\r\n').split(',')]
+    state = {
+        'version': STATE_FORMAT_VERSION,
+        'products': {'sha256': file_hash(products_path)},
+        'transactions': {'path': os.path.abspath(transactions_path), 'header': header, 'columns': columns,
+                         'offset': 0, 'end': 0, 'tail': ''},
+        'watermark': {'transaction_id': -1, 'date': None},
+        'aggregates': AnalysisAggregates().to_dict(),
+        'pending': AnalysisAggregates().to_dict(),
+    }
+    _advance(state, ProductCatalog.from_products(pd.read_csv(products_path)), transactions_path, chunksize)
+    return state
+
+def update_state(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', state_path=STATE_PATH, chunksize=1_000_000, rebuild=False):
+    """
+    Brings the persisted state up to date and saves it.
+    The state is rebuilt when requested, missing, or no longer valid for the input files.
+    Returns (state, number of newly folded lines).
+    """
+    state = None if rebuild else load_state(state_path)
+    if _is_valid(state, products_path, transactions_path):
+        new_rows = _advance(state, ProductCatalog.from_products(pd.read_csv(products_path)), transactions_path, chunksize)
+    else:
+        state = rebuild_state(products_path, transactions_path, chunksize)
+        new_rows = state['aggregates']['rows'] + state['pending']['rows']
+    save_state(state, state_path)
+    return state, new_rows
+
+def check_consistency(state, products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv'):
+    """
+    Compares the persisted aggregates (with the pending last order) with aggregates computed
+    by the batch path over the same lines. Returns a list of differences (empty when consistent).
+    """
+    with open(transactions_path, 'rb') as f:
+        prefix = f.read(state['transactions']['end'])
+    df = load_prepared_data(products_path, io.BytesIO(prefix), cache_dir=None)
+    expected = AnalysisAggregates(state['aggregates']['focus_category'])
+    expected.update(df)
+    actual = current_aggregates(state)
+
+    differences = []
+    for name in AnalysisAggregates.TABLES:
+        expected_table, actual_table = getattr(expected, name), getattr(actual, name)
+        for key in sorted(set(expected_table) | set(actual_table), key=str):
+            expected_value, actual_value = expected_table.get(key, 0), actual_table.get(key, 0)
+            if not math.isclose(expected_value, actual_value, rel_tol=1e-9):
+                differences.append(f"{name}[{key}]: dávkově {expected_value}, inkrementálně {actual_value}")
+    if expected.rows != actual.rows:
+        differences.append(f"rows: dávkově {expected.rows}, inkrementálně {actual.rows}")
+    return differences
+
+def main(argv=None):
+    """Updates the persisted analysis state with new transactions and prints the report."""
+    parser = argparse.ArgumentParser(description="Inkrementální analýza prodejních dat.")
+    parser.add_argument('--rebuild', action='store_true', help="Přepočítat stav z celé historie transakcí.")
+    parser.add_argument('--check', action='store_true', help="Ověřit uložený stav proti dávkovému výpočtu.")
+    parser.add_argument('--products', default='../data/in/Products.csv', help="Katalog produktů (CSV).")
+    parser.add_argument('--transactions', default='../data/in/Transactions.csv', help="Transakce (CSV), do kterých se jen připisuje.")
+    parser.add_argument('--state', default=STATE_PATH, help="Cesta k souboru se stavem.")
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help="Počet řádků transakcí v jedné části.")
+    args = parser.parse_args(argv)
+
+    try:
+        state, new_rows = update_state(args.products, args.transactions, args.state, chunksize=args.chunksize, rebuild=args.rebuild)
+    except FileNotFoundError as e:
+        print(f"Chyba: Súbor nebol nájdený. Uistite sa, že súbory sú v priečinku 'data/in'. Detaily: {e}", file=sys.stderr)
+        sys.exit(1)
+    watermark = state['watermark']
+    aggregates = current_aggregates(state)
+    print(f"Stav analýzy: {aggregates.rows} řádků transakcí, nově zpracováno {new_rows}, "
+          f"poslední transakce {watermark['transaction_id']} ({watermark['date']}).\n", file=sys.stderr)
+
+    if args.check:
+        differences = check_consistency(state, args.products, args.transactions)
+        if differences:
+            print("Inkrementální stav NENÍ konzistentní s dávkovým výpočtem:", file=sys.stderr)
+            for difference in differences:
+                print(f"  {difference}", file=sys.stderr)
+            sys.exit(1)
+        print("Inkrementální stav je konzistentní s dávkovým výpočtem.\n", file=sys.stderr)
+
+    print("--- Analýza prodejních dat ---")
+    print("Následuje zodpovězení otázek od manažera e-shopu. U každé otázky je popsán postup a uveden závěr.\n")
+    print_report(aggregates)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from metrics import NULL_METRICS
+
+# --------------------------------------------------------------------------------
+# CONCURRENT INSURANCE ARRANGEMENT
+# The insurer API is slow (network latency), so high-value orders are dispatched
+# to a bounded thread pool instead of being insured one after another.
+# A circuit breaker stops calling the API while it keeps failing, and a
+# persistent cache of successful decisions saves the call for orders that were
+# already insured in an earlier run.
+# --------------------------------------------------------------------------------
+
+DECISION_CACHE_PATH = '../data/cache/insurance_decisions.sqlite'
+
+class CircuitBreaker:
+    """
+    Circuit breaker of the insurer API.
+    - closed: calls go through; failure_threshold consecutive failures open the circuit.
+    - open: calls are rejected without calling the API, for reset_timeout seconds.
+    - half_open: up to half_open_max_calls probe calls go through; a success closes
+      the circuit, a failure opens it again.
+    Every transition is counted in metrics under 'insurance_breaker', labelled by the new state.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1, metrics=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.metrics = metrics or NULL_METRICS
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go through now (a probe call is counted as in flight)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+                self._probes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+            elif self.state == self.CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+
+    def _open(self):
+        self._opened_at = self.clock()
+        self._failures = 0
+        self._transition(self.OPEN)
+
+    def _transition(self, state):
+        self.state = state
+        self.metrics.count('insurance_breaker', state)
+        if state == self.OPEN:
+            logging.error("  -! Jistič API pojišťovny rozpojen na %.0f s, objednávky jdou bez volání k manuální kontrole.", self.reset_timeout)
+        elif state == self.HALF_OPEN:
+            logging.warning("  -! Jistič API pojišťovny: zkušební volání po %.0f s.", self.reset_timeout)
+        else:
+            logging.info("  -- Jistič API pojišťovny opět sepnut, API odpovídá.")
+
+class InsuranceDecisionCache:
+    """
+    Successful insurance decisions per order in a SQLite file, valid for ttl seconds.
+    A decision applies only to the same order value. Failures are not cached: such an
+    order goes to manual review and may be insured by a later run. Expired decisions
+    are deleted when the cache is opened. Safe to use from the dispatcher threads.
+    """
+
+    def __init__(self, path=DECISION_CACHE_PATH, ttl=30 * 24 * 3600, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS insurance_decisions (
+                    order_id INTEGER PRIMARY KEY,
+                    total_value REAL NOT NULL,
+                    insured_at REAL NOT NULL
+                )""")
+            self._connection.execute("DELETE FROM insurance_decisions WHERE insured_at <= ?", (self.clock() - self.ttl,))
+
+    def get(self, order_id, total_value):
+        """True when the order was insured for this value less than ttl seconds ago."""
+        with self._lock:
+            row = self._connection.execute("SELECT total_value, insured_at FROM insurance_decisions WHERE order_id = ?",
+                                           (int(order_id),)).fetchone()
+        return row is not None and row[0] == float(total_value) and self.clock() - row[1] < self.ttl
+
+    def put(self, order_id, total_value):
+        """Records a successful decision; committed at once, so it survives a crash of the run."""
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO insurance_decisions (order_id, total_value, insured_at) VALUES (?, ?, ?)",
+                                     (int(order_id), float(total_value), self.clock()))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class InsuranceDispatcher:
+    """
+    Runs insurance calls concurrently with a limited number of calls in flight.
+    Each attempt has its own timeout, counted from the moment the call starts. Time spent
+    queued for a free call worker (e.g. behind hung calls) does not count, but is bounded by
+    queue_timeout (the call timeout by default): a call still queued then is cancelled before it
+    reaches the insurer and the attempt fails. A call that already started cannot be stopped; after
+    its timeout it keeps running in its worker and its result is ignored, so the insurer may still
+    see it while the retry runs. Failures (False, exception, timeout or no free worker) are
+    retried with jittered exponential backoff; the future resolves to False only
+    when all attempts failed.
+    With an InsuranceDecisionCache passed as `cache`, an order insured before resolves
+    to True without a call (counted as 'hit'/'miss' under 'insurance_cache' in metrics).
+    With a CircuitBreaker passed as `breaker`, every attempt reports its outcome to the
+    breaker, and while the circuit is open the order fails at once, without retries
+    (counted as 'rejected' under 'insurance_breaker').
+    With max_in_flight=0 the dispatcher is serial: the engines call insure(), which arranges
+    insurance for one order in the calling thread, with the same cache, breaker, timeout and retries.
+    """
+
+    def __init__(self, insure_fn, max_in_flight=8, timeout=5.0, max_retries=2, backoff_base=0.2, backoff_max=2.0, seed=None,
+                 breaker=None, cache=None, metrics=None, queue_timeout=None):
+        self.insure_fn = insure_fn
+        self.breaker = breaker
+        self.cache = cache
+        self.metrics = metrics or NULL_METRICS
+        self.timeout = timeout
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Separate generator, so the jitter does not consume the global random state
+        self._jitter = random.Random(seed)
+        self._jitter_lock = threading.Lock()
+        # Retry loops and the calls themselves run in separate pools, so a loop can stop waiting on a timed-out call.
+        # A running call cannot be interrupted; it keeps its worker until it returns. The call pool has room for the
+        # abandoned attempts of every loop, so a retry does not queue behind the attempts it replaces.
+        self.serial = max_in_flight == 0
+        self._loops = None if self.serial else ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='insurance-retry')
+        self._calls = ThreadPoolExecutor(max_workers=max(max_in_flight, 1) * (max_retries + 1), thread_name_prefix='insurance-call')
+
+    def submit(self, order_id, total_value):
+        """Dispatches insurance for one order. Returns a Future resolving to True/False."""
+        if self.serial:
+            future = Future()
+            future.set_result(self.insure(order_id, total_value))
+            return future
+        return self._loops.submit(self._insure_with_retries, order_id, total_value)
+
+    def insure(self, order_id, total_value):
+        """Arranges insurance for one order in the calling thread. Returns True/False."""
+        return self._insure_with_retries(order_id, total_value)
+
+    def _backoff_delay(self, attempt):
+        """Full jitter: a random delay between 0 and the capped exponential backoff."""
+        with self._jitter_lock:
+            return self._jitter.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, started, order_id, total_value):
+        started.set()
+        return self.insure_fn(order_id, total_value)
+
+    def _insure_with_retries(self, order_id, total_value):
+        if self.cache is not None:
+            if self.cache.get(order_id, total_value):
+                self.metrics.count('insurance_cache', 'hit')
+                logging.info("  -- Pojištění objednávky %s je již sjednáno (uložené rozhodnutí).", order_id)
+                return True
+            self.metrics.count('insurance_cache', 'miss')
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                delay = self._backoff_delay(attempt - 1)
+                logging.warning("  -! Opakuji sjednání pojištění pro objednávku %s (pokus %d) za %.2f s.", order_id, attempt + 1, delay)
+                time.sleep(delay)
+            if self.breaker is not None and not self.breaker.allow():
+                self.metrics.count('insurance_breaker', 'rejected')
+                logging.warning("  -! Jistič API pojišťovny je rozpojen, objednávka %s se nepojistí.", order_id)
+                return False
+            started = threading.Event()
+            call = self._calls.submit(self._call, started, order_id, total_value)
+            is_insured = False
+            try:
+                # Waiting for a free call worker is not part of the call's timeout, but it is bounded;
+                # a call cancelled while still queued never runs
+                if not started.wait(self.queue_timeout) and call.cancel():
+                    logging.error("  -! CHYBA: Na volání API pojišťovny nebylo volno do %.1f s (objednávka %s).", self.queue_timeout, order_id)
+                else:
+                    is_insured = call.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                logging.error("  -! CHYBA: API pojišťovny neodpovědělo do %.1f s (objednávka %s).", self.timeout, order_id)
+            except Exception as e:
+                logging.error("  -! CHYBA: Volání API pojišťovny selhalo (objednávka %s): %s", order_id, e)
+            if is_insured:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                if self.cache is not None:
+                    self.cache.put(order_id, total_value)
+                return True
+            if self.breaker is not None:
+                self.breaker.record_failure()
+        return False
+
+    def close(self):
+        """Waits for the dispatched orders and shuts the pools down."""
+        if self._loops is not None:
+            self._loops.shutdown(wait=True)
+        self._calls.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,214 @@
+import itertools
+import json
+import logging
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------------
+# INVENTORY RESERVATION LEDGER
+# Stock counts and weights live in arrays indexed by product position. An order
+# reserves all of its lines or none of them; the reservation is later committed
+# (goods leave the warehouse) or released (e.g. when insurance fails).
+# --------------------------------------------------------------------------------
+
+class InventoryLedger:
+    """
+    Thread-safe stock ledger with atomic multi-line reservations.
+    Products are guarded by striped locks (product position modulo the number of
+    stripes), so workers reserving different products rarely wait on each other.
+    Locks of one reservation are always taken in ascending stripe order, which
+    rules out deadlocks between multi-line reservations.
+    """
+
+    def __init__(self, stock, n_stripes=16):
+        """`stock` maps product name to (stock_count, weight_kg), as MOCK_STOCK does."""
+        self.product_names = list(stock)
+        self.product_index = pd.Index(self.product_names)
+        self.on_hand = np.array([stock[name][0] for name in self.product_names], dtype=np.int64)
+        self.reserved = np.zeros(len(self.product_names), dtype=np.int64)
+        self.weight_kg = np.array([stock[name][1] for name in self.product_names], dtype=np.float64)
+        # Bumped on every restock, so callers can tell when waiting orders are worth re-evaluating
+        self.version = 0
+
+        self._n_stripes = max(1, n_stripes)
+        self._stripes = [threading.Lock() for _ in range(self._n_stripes)]
+        self._reservations = {}
+        self._reservations_lock = threading.Lock()
+        self._reservation_ids = itertools.count(1)
+
+    def encode(self, product_names):
+        """Returns the positions of the given products (-1 for products unknown to the ledger)."""
+        return self.product_index.get_indexer(list(product_names))
+
+    def available(self, product):
+        """Quantity of a product that is on hand and not reserved."""
+        position = self.product_index.get_loc(product)
+        with self._stripes[position % self._n_stripes]:
+            return int(self.on_hand[position] - self.reserved[position])
+
+    def _locked(self, positions):
+        """Acquires the stripe locks of the given positions in ascending order."""
+        stripes = sorted({int(position) % self._n_stripes for position in positions})
+        for stripe in stripes:
+            self._stripes[stripe].acquire()
+        return stripes
+
+    def _unlock(self, stripes):
+        for stripe in reversed(stripes):
+            self._stripes[stripe].release()
+
+    def reserve_positions(self, positions, quantities):
+        """
+        Reserves all lines of one order given as product positions and quantities.
+        Returns (reservation_id, total_weight), or (None, 0) if any line cannot be reserved.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        if (positions < 0).any():
+            return None, 0
+        # Lines repeating a product are checked against the stock together
+        unique_positions, inverse = np.unique(positions, return_inverse=True)
+        if len(unique_positions) < len(positions):
+            quantities = np.bincount(inverse, weights=quantities).astype(np.int64)
+            positions = unique_positions
+
+        stripes = self._locked(positions)
+        try:
+            if (self.on_hand[positions] - self.reserved[positions] < quantities).any():
+                return None, 0
+            self.reserved[positions] += quantities
+        finally:
+            self._unlock(stripes)
+
+        with self._reservations_lock:
+            reservation_id = next(self._reservation_ids)
+            self._reservations[reservation_id] = (positions, quantities)
+        return reservation_id, float(self.weight_kg[positions] @ quantities)
+
+    def reserve(self, products_in_order):
+        """
+        Reserves a {product: quantity} order, logging the same validation messages
+        as check_stock_availability. Returns (reservation_id, total_weight) or (None, 0).
+        """
+        positions = self.encode(products_in_order)
+        for product, position in zip(products_in_order, positions):
+            if position < 0:
+                logging.error("  -! VALIDATION ERROR: Produkt '%s' nenalezen v MOCK_STOCK.", product)
+                return None, 0
+
+        quantities = list(products_in_order.values())
+        reservation_id, total_weight = self.reserve_positions(positions, quantities)
+        if reservation_id is None:
+            for product, position, required_quantity in zip(products_in_order, positions, quantities):
+                available_quantity = self.on_hand[position] - self.reserved[position]
+                if available_quantity < required_quantity:
+                    logging.warning("  -! CHYBA: Nedostatek zboží '%s'. Požadováno: %s, Skladem: %s", product, required_quantity, available_quantity)
+                    break
+        return reservation_id, total_weight
+
+    def _pop(self, reservation_id):
+        with self._reservations_lock:
+            return self._reservations.pop(reservation_id)
+
+    def commit(self, reservation_id):
+        """The reserved goods leave the warehouse."""
+        positions, quantities = self._pop(reservation_id)
+        stripes = self._locked(positions)
+        try:
+            self.on_hand[positions] -= quantities
+            self.reserved[positions] -= quantities
+        finally:
+            self._unlock(stripes)
+
+    def release(self, reservation_id):
+        """The reserved goods become available again."""
+        positions, quantities = self._pop(reservation_id)
+        stripes = self._locked(positions)
+        try:
+            self.reserved[positions] -= quantities
+        finally:
+            self._unlock(stripes)
+
+    def restock(self, product, quantity):
+        """Adds goods to the warehouse."""
+        position = self.product_index.get_loc(product)
+        with self._stripes[position % self._n_stripes]:
+            self.on_hand[position] += quantity
+        with self._reservations_lock:
+            self.version += 1
+
+    def snapshot(self):
+        """Stock on hand as {product: (stock_count, weight_kg)}, the format the constructor takes."""
+        return {name: (int(count), float(weight)) for name, count, weight in zip(self.product_names, self.on_hand, self.weight_kg)}
+
+    def open_reservations(self):
+        with self._reservations_lock:
+            return len(self._reservations)
+
+def save_stock(stock, path):
+    """Writes a {product: (stock_count, weight_kg)} stock as JSON (the Stock.json format)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(stock, f, ensure_ascii=False)
+
+def load_stock(path):
+    """Loads a Stock.json as a {product: (stock_count, weight_kg)} dict, the format of MOCK_STOCK."""
+    with open(path, encoding='utf-8') as f:
+        return {product: tuple(values) for product, values in json.load(f).items()}
+
+# --------------------------------------------------------------------------------
+# THROUGHPUT BENCHMARK UNDER CONTENTION
+# --------------------------------------------------------------------------------
+
+def benchmark_contention(n_threads=8, orders_per_thread=20000, n_products=1000, lines_per_order=3, hot_products=10, n_stripes=64, seed=42):
+    """
+    Measures reserve+commit/release throughput with many threads. Half of the
+    lines hit a small set of "hot" products to create contention.
+    Returns a dict with the throughput and the final consistency check.
+    """
+    rng = np.random.default_rng(seed)
+    stock = {f"Product {i}": (10**9, 1.0) for i in range(n_products)}
+    ledger = InventoryLedger(stock, n_stripes=n_stripes)
+
+    n_orders = n_threads * orders_per_thread
+    hot = rng.integers(0, hot_products, size=(n_orders, lines_per_order))
+    cold = rng.integers(0, n_products, size=(n_orders, lines_per_order))
+    positions = np.where(rng.random((n_orders, lines_per_order)) < 0.5, hot, cold)
+    quantities = rng.integers(1, 4, size=(n_orders, lines_per_order))
+    commit = rng.random(n_orders) < 0.9
+
+    def worker(start):
+        for i in range(start, start + orders_per_thread):
+            reservation_id, _ = ledger.reserve_positions(positions[i], quantities[i])
+            if commit[i]:
+                ledger.commit(reservation_id)
+            else:
+                ledger.release(reservation_id)
+
+    threads = [threading.Thread(target=worker, args=(t * orders_per_thread,)) for t in range(n_threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    expected = np.full(n_products, 10**9, dtype=np.int64)
+    np.subtract.at(expected, positions[commit].ravel(), quantities[commit].ravel())
+    return {
+        'threads': n_threads,
+        'stripes': n_stripes,
+        'orders': n_orders,
+        'seconds': elapsed,
+        'orders_per_second': n_orders / elapsed,
+        'consistent': bool((ledger.on_hand == expected).all() and (ledger.reserved == 0).all()),
+    }
+
+if __name__ == '__main__':
+    print("Propustnost rezervací skladu (reserve + commit/release):")
+    for n_threads in (1, 4, 8):
+        for n_stripes in (1, 64):
+            result = benchmark_contention(n_threads=n_threads, orders_per_thread=80000 // n_threads, n_stripes=n_stripes)
+            print(f"vlákna: {result['threads']:>2}, zámky: {result['stripes']:>3}, "
+                  f"{result['orders_per_second']:>10,.0f} objednávek/s, konzistentní: {result['consistent']}")
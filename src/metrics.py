@@ -0,0 +1,205 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+# --------------------------------------------------------------------------------
+# ORDER PIPELINE METRICS
+# Per-stage latency histograms (stock check, shipping, insurance, status write),
+# counters per outcome status and per carrier, and the order throughput.
+# A snapshot is written as JSON or in the Prometheus text format, at the end of
+# a run and optionally every few seconds while it runs.
+# --------------------------------------------------------------------------------
+
+# Upper bounds of the latency buckets in seconds (Prometheus style, the last bucket is +Inf)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_PREFIX = 'order_pipeline'
+# Prometheus HELP text of the known counters; other counters get a generic one
+COUNTER_HELP = {
+    'status': 'Processed orders by final status.',
+    'carrier': 'Shipped orders by carrier.',
+    'insurance_breaker': 'Circuit breaker transitions of the insurance API and orders rejected while it was open.',
+    'insurance_cache': 'Insured orders found in (hit) or missing from (miss) the insurance decision cache.',
+}
+
+class Histogram:
+    """Latency histogram with fixed buckets. Not thread-safe on its own; PipelineMetrics locks around it."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def observe(self, value, n=1):
+        self.bucket_counts[bisect.bisect_left(self.bounds, value)] += n
+        self.count += n
+        self.sum += value * n
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimated quantile, interpolated linearly within its bucket and kept within the observed range."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = max(self.bounds[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(self.bounds[i] if i < len(self.bounds) else self.max, self.max)
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(self.bounds + ('+Inf',), self.bucket_counts)},
+        }
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class PipelineMetrics:
+    """
+    Thread-safe metrics of one order processing run.
+    - observe/time: latency of a pipeline stage.
+    - count: counters with one label, e.g. count('status', 'schváleno - k expedici').
+    Orders per second are the orders counted by status divided by the time since the metrics were created.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.started = time.perf_counter()
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, n=1):
+        """Records the latency of a stage (n observations of the same value, e.g. for a whole batch)."""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds, n)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def count(self, name, label, n=1):
+        with self._lock:
+            counter = self.counters.setdefault(name, {})
+            counter[label] = counter.get(label, 0) + n
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def orders_per_second(self):
+        orders = sum(self.counters.get('status', {}).values())
+        elapsed = self.elapsed()
+        return orders / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'elapsed_seconds': self.elapsed(),
+                'orders': sum(self.counters.get('status', {}).values()),
+                'orders_per_second': self.orders_per_second(),
+                'stages': {stage: histogram.to_dict() for stage, histogram in self.histograms.items()},
+                'counters': {name: dict(counter) for name, counter in self.counters.items()},
+            }
+
+    def to_prometheus(self):
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        name = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        lines = [f"# HELP {name} Latency of the order pipeline stages.", f"# TYPE {name} histogram"]
+        with self._lock:
+            histograms = list(self.histograms.items())
+            for stage, histogram in histograms:
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.bounds + ('+Inf',), histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{_escape_label(stage)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{_escape_label(stage)}"}} {histogram.sum!r}')
+                lines.append(f'{name}_count{{stage="{_escape_label(stage)}"}} {histogram.count}')
+        for counter_name, counter in snapshot['counters'].items():
+            name = f"{PROMETHEUS_PREFIX}_{counter_name}_total"
+            help_text = COUNTER_HELP.get(counter_name, f"Order pipeline events by {counter_name}.")
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{{counter_name}="{_escape_label(label)}"}} {n}' for label, n in counter.items()]
+        for gauge, value, help_text in (('orders_per_second', snapshot['orders_per_second'], 'Order throughput of the run.'),
+                                        ('elapsed_seconds', snapshot['elapsed_seconds'], 'Duration of the run so far.')):
+            name = f"{PROMETHEUS_PREFIX}_{gauge}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value!r}"]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Writes the snapshot atomically; a '.prom' path gets the Prometheus text format, anything else JSON."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+class NullMetrics:
+    """Stand-in used when no metrics are collected; every call is a no-op."""
+
+    def observe(self, stage, seconds, n=1):
+        pass
+
+    def time(self, stage):
+        return contextlib.nullcontext()
+
+    def count(self, name, label, n=1):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+class PeriodicWriter:
+    """Writes the metrics to a file every `interval` seconds in a background thread, and once more on close."""
+
+    def __init__(self, metrics, path, interval):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        if interval and interval > 0:
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.metrics.write(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
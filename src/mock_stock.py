@@ -0,0 +1,22 @@
+# --------------------------------------------------------------------------------
+# MOCK STOCK
+# The simulated inventory system used when no Stock.json is given. It lives in
+# this small module, without imports, so the catalog snapshot can read it (and
+# tie its cache to this file) without importing order_automation and pandas.
+# --------------------------------------------------------------------------------
+
+MOCK_STOCK = {
+    # product: (stock_count, weight_kg)
+    'JBL Charge 4': (10, 0.96),
+    'Bose QuietComfort Earbuds': (5, 0.08),
+    'Sony WH-1000XM4': (0, 0.25),  # Example of an out-of-stock product
+    'LG OLED55CX': (3, 23.0),
+    'Samsung QN55Q80T': (4, 24.1),
+    'LG 75NANO81': (1, 35.4),
+    'Apple iPhone 12 Pro': (8, 0.18),
+    'Samsung Galaxy S21 Ultra': (2, 0.22),
+    'Xiaomi Poco X3 Pro': (15, 0.21),
+    'Apple iPad Air': (6, 0.45),
+    'Samsung Galaxy Tab S7+': (0, 0.57), # Another example of an out-of-stock product
+    'Lenovo Tab P11 Pro': (7, 0.49),
+}
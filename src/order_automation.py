@@ -1,8 +1,22 @@
+import argparse
+import functools
+import os
+import numpy as np
 import pandas as pd
 import random
 import time
 import logging
 
+from catalog import UNKNOWN_ID, ProductCatalog, gather
+from data_cache import CACHE_DIR, load_prepared_data
+from delta_export import DELTA_PATH, DeltaWriter, compact, compact_if_needed
+from insurance import DECISION_CACHE_PATH, CircuitBreaker, InsuranceDecisionCache, InsuranceDispatcher
+from inventory import InventoryLedger
+from metrics import NULL_METRICS, PeriodicWriter, PipelineMetrics
+from mock_stock import MOCK_STOCK
+from order_state import CARRIER_LABELS, CODE_DTYPE, NOTE_LABELS, STATUS_LABELS, STATUS_NOTES, Carrier, OrderState, OrderStatus, decode
+from orders_store import SqliteOrdersStore
+
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler()])
 
@@ -11,21 +25,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # In a real-world scenario, these would be network requests to other services.
 # --------------------------------------------------------------------------------
 
-MOCK_STOCK = {
-    # product: (stock_count, weight_kg)
-    'JBL Charge 4': (10, 0.96),
-    'Bose QuietComfort Earbuds': (5, 0.08),
-    'Sony WH-1000XM4': (0, 0.25),  # Example of an out-of-stock product
-    'LG OLED55CX': (3, 23.0),
-    'Samsung QN55Q80T': (4, 24.1),
-    'LG 75NANO81': (1, 35.4),
-    'Apple iPhone 12 Pro': (8, 0.18),
-    'Samsung Galaxy S21 Ultra': (2, 0.22),
-    'Xiaomi Poco X3 Pro': (15, 0.21),
-    'Apple iPad Air': (6, 0.45),
-    'Samsung Galaxy Tab S7+': (0, 0.57), # Another example of an out-of-stock product
-    'Lenovo Tab P11 Pro': (7, 0.49),
-}
+# MOCK_STOCK (the simulated inventory system) is defined in mock_stock.py
 
 def check_stock_availability(products_in_order):
     """Simulates a query to the inventory system (via API)."""
@@ -35,12 +35,12 @@ def check_stock_availability(products_in_order):
         stock_info = MOCK_STOCK.get(product)
         # Data validation: check if product exists in our stock system
         if stock_info is None:
-            logging.error(f"  -! VALIDATION ERROR: Produkt '{product}' nenalezen v MOCK_STOCK.")
+            logging.error("  -! VALIDATION ERROR: Produkt '%s' nenalezen v MOCK_STOCK.", product)
             return False, 0
             
         if stock_info[0] < required_quantity:
             available_quantity = stock_info[0]
-            logging.warning(f"  -! CHYBA: Nedostatek zboží '{product}'. Požadováno: {required_quantity}, Skladem: {available_quantity}")
+            logging.warning("  -! CHYBA: Nedostatek zboží '%s'. Požadováno: %s, Skladem: %s", product, required_quantity, available_quantity)
             return False, 0
         total_weight += stock_info[1] * required_quantity
     logging.info("  -- Zboží je dostupné.")
@@ -48,7 +48,7 @@ def check_stock_availability(products_in_order):
 
 def assign_shipping(order_id, total_weight):
     """Simulates selecting a carrier and assigning shipping costs based on weight."""
-    logging.info(f"  -> Přiřazuji dopravu pro objednávku {order_id} (hmotnost: {total_weight:.2f} kg)...")
+    logging.info("  -> Přiřazuji dopravu pro objednávku %s (hmotnost: %.2f kg)...", order_id, total_weight)
     if total_weight > 50:
         carrier = "PPL 'Nadměrná zásilka'"
         cost = 500
@@ -58,15 +58,37 @@ def assign_shipping(order_id, total_weight):
     else:
         carrier = "Zásilkovna"
         cost = 89
-    logging.info(f"  -- Dopravce: {carrier}, Cena: {cost} Kč.")
+    logging.info("  -- Dopravce: %s, Cena: %s Kč.", carrier, cost)
     return carrier, cost
 
+# Weight tiers used by assign_shipping, as arrays for the batch engine.
+# A weight falls into tier i when SHIPPING_WEIGHT_LIMITS[i-1] < weight <= SHIPPING_WEIGHT_LIMITS[i].
+SHIPPING_WEIGHT_LIMITS = np.array([20, 50])
+SHIPPING_CARRIERS = np.array(["Zásilkovna", "DPD", "PPL 'Nadměrná zásilka'"], dtype=object)
+SHIPPING_COSTS = np.array([89, 180, 500])
+SHIPPING_CARRIER_CODES = np.array([Carrier.ZASILKOVNA, Carrier.DPD, Carrier.PPL_OVERSIZE], dtype=CODE_DTYPE)
+
+def shipping_tier(total_weights):
+    """Index of the shipping tier of every weight."""
+    return np.searchsorted(SHIPPING_WEIGHT_LIMITS, np.asarray(total_weights, dtype=float), side='left')
+
+def assign_shipping_batch(total_weights):
+    """Vectorized counterpart of assign_shipping. Returns (carriers, costs) arrays."""
+    tier = shipping_tier(total_weights)
+    return SHIPPING_CARRIERS[tier], SHIPPING_COSTS[tier]
+
+# Simulated insurer API behaviour (benchmarks replace the latency with a short stub)
+INSURANCE_LATENCY_S = 1.0
+INSURANCE_FAILURE_RATE = 0.1
+
 def arrange_insurance(order_id, total_value):
     """Simulates arranging insurance via an external insurance company's API."""
-    logging.info(f"  -> Sjednávám pojištění pro objednávku {order_id} (hodnota: {total_value:,.0f} Kč)...")
-    time.sleep(1) # Simulate network latency
+    # The thousands separator has no %-style equivalent, so the message is only formatted when it is logged
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info(f"  -> Sjednávám pojištění pro objednávku {order_id} (hodnota: {total_value:,.0f} Kč)...")
+    time.sleep(INSURANCE_LATENCY_S) # Simulate network latency
     # Simulate a random failure of the insurance API (e.g., in 10% of cases)
-    if random.random() < 0.1:
+    if random.random() < INSURANCE_FAILURE_RATE:
         logging.error("  -! CHYBA: API pojišťovny vrátilo chybu. Nelze pojistit.")
         return False
     logging.info("  -- Pojištění úspěšně sjednáno.")
@@ -76,118 +98,660 @@ def arrange_insurance(order_id, total_value):
 # PART 2: MAIN LOGIC OF THE AUTOMATION SCRIPT
 # --------------------------------------------------------------------------------
 
-def process_orders(orders_df, transactions_df):
+def _apply_insurance_result(results, order_id, is_insurance_ok, ledger=None, reservation_id=None, metrics=NULL_METRICS):
     """
-    Main function that processes all new orders with the 'pending approval' status.
+    Records the final status of an order that went through the insurance step.
+    A stock reservation is committed for approved orders and released otherwise.
     """
-    # Filter only the orders that need processing
-    new_orders_to_process = orders_df[orders_df['status'] == 'čeká na schválení']
+    with metrics.time('status_write'):
+        if ledger is not None and reservation_id is not None:
+            if is_insurance_ok:
+                ledger.commit(reservation_id)
+            else:
+                ledger.release(reservation_id)
+        if is_insurance_ok:
+            status, notes = 'schváleno - k expedici', 'Objednávka byla automaticky schválena.'
+        else:
+            status, notes = 'vyžaduje manuální kontrolu', 'Nepodařilo se sjednat pojištění pro zásilku.'
+        results.set_status(order_id, status, notes)
+    metrics.count('status', status)
+    if not is_insurance_ok:
+        logging.info("--- Objednávka č. %s přesunuta do stavu 'vyžaduje manuální kontrolu' ---", order_id)
+        return
+    logging.info("--- Objednávka č. %s SCHVÁLENA ---", order_id)
 
-    if new_orders_to_process.empty:
-        logging.info("Žádné nové objednávky ke zpracování.")
-        return orders_df
+def _insure(order_id, total_value, metrics, insurance=None):
+    """Arranges insurance synchronously (through a serial InsuranceDispatcher if given), timing the call."""
+    with metrics.time('insurance'):
+        if insurance is not None:
+            return insurance.insure(order_id, total_value)
+        return arrange_insurance(order_id, total_value)
+
+def _submit_insurance(insurance, order_id, total_value, metrics):
+    """Dispatches insurance; its latency (including retries) is recorded when the future resolves."""
+    started = time.perf_counter()
+    future = insurance.submit(order_id, total_value)
+    future.add_done_callback(lambda _: metrics.observe('insurance', time.perf_counter() - started))
+    return future
+
+def _observe_batch(metrics, stage, started, n_orders):
+    """Records a batch stage once per order: every order of the batch waited for the whole stage."""
+    metrics.observe(stage, time.perf_counter() - started, n_orders)
+
+class _OrderResults:
+    """
+    Results of the per-order path, collected per column and written to the orders table
+    at the end with one bulk assignment per column instead of up to four cell writes per order.
+    """
+
+    def __init__(self):
+        self.status = {}
+        self.notes = {}
+        self.shipping_carrier = {}
+        self.shipping_cost = {}
 
-    logging.info(f"Nalezeno {len(new_orders_to_process)} nových objednávek ke zpracování.")
+    def set_status(self, order_id, status, notes):
+        self.status[order_id] = status
+        self.notes[order_id] = notes
 
+    def set_shipping(self, order_id, carrier, cost):
+        self.shipping_carrier[order_id] = carrier
+        self.shipping_cost[order_id] = cost
+
+    def write(self, orders_df):
+        for column in ('status', 'notes', 'shipping_carrier', 'shipping_cost'):
+            values = getattr(self, column)
+            if values:
+                orders_df.loc[list(values), column] = list(values.values())
+
+def _products_in_order(order_id, transactions_df):
+    """All products in the given order, as {product: quantity}."""
+    return {
+        row['Product name']: row['Quantity']
+        for _, row in transactions_df[transactions_df['Transaction ID'] == order_id].iterrows()
+    }
+
+def _set_waiting_for_stock(results, order_id, metrics):
+    """Records an order that cannot be shipped from the current stock."""
+    with metrics.time('status_write'):
+        results.set_status(order_id, 'čeká na naskladnění', 'Jeden nebo více produktů není skladem.')
+    metrics.count('status', 'čeká na naskladnění')
+    logging.info("--- Objednávka č. %s přesunuta do stavu 'čeká na naskladnění' ---", order_id)
+
+def _assign_order_shipping(results, order_id, total_weight, metrics):
+    """Assigns the carrier of an order that has its goods."""
+    with metrics.time('shipping'):
+        carrier, shipping_cost = assign_shipping(order_id, total_weight)
+        results.set_shipping(order_id, carrier, shipping_cost)
+    metrics.count('carrier', carrier)
+
+def _insure_orders(indices, order_ids, total_values, insurance, metrics):
+    """Insurance results of the orders at the given indices, in the order of the indices."""
+    if insurance is None or insurance.serial:
+        return [_insure(order_ids[i], total_values[i], metrics, insurance) for i in indices]
+    futures = [_submit_insurance(insurance, order_ids[i], total_values[i], metrics) for i in indices]
+    return [future.result() for future in futures]
+
+def _insurance_rounds(needs_insurance, is_stock_ok, reservation_ids, ledger, reserve, insure):
+    """
+    Insures the orders that have stock and need insurance, for orders that were all reserved before
+    any insurance result was known. The serial path gives the goods of an order that failed insurance
+    back before the next order is checked; here the orders after the first failed one are reserved
+    again instead, with the failed orders releasing at once, and the newly reserved ones are insured,
+    until no such order is left.
+    `reserve(indices, give_back)` reserves the orders at the indices again, in order, updating is_stock_ok
+    and reservation_ids; `insure(indices)` returns their insurance results. Returns {index: is_insurance_ok}.
+    """
+    insurance_ok = {}
+    while True:
+        to_insure = [i for i in np.flatnonzero(is_stock_ok & needs_insurance) if i not in insurance_ok]
+        if not to_insure:
+            return insurance_ok
+        insurance_ok.update(zip(to_insure, insure(to_insure)))
+        failed = [i for i in to_insure if not insurance_ok[i]]
+        if ledger is None or not failed:
+            return insurance_ok
+        first_failed = min(failed)
+        for i in range(first_failed, len(is_stock_ok)):
+            if reservation_ids[i] is not None:
+                ledger.release(reservation_ids[i])
+        reserve(range(first_failed, len(is_stock_ok)), {i for i, is_insurance_ok in insurance_ok.items() if not is_insurance_ok})
+
+def _process_orders_serially(orders, transactions_df, insurance, ledger, results, metrics):
+    """The steps of process_orders one order after another, each decided before the next one is checked."""
     # Process each order individually
-    for order_id, order_details in new_orders_to_process.iterrows():
-        logging.info(f"--- Zpracovávám objednávku č. {order_id} ---")
+    for order_id, order_details in orders.iterrows():
+        logging.info("--- Zpracovávám objednávku č. %s ---", order_id)
 
         # Get all products in the given order
-        products_in_order = {
-            row['Product name']: row['Quantity']
-            for _, row in transactions_df[transactions_df['Transaction ID'] == order_id].iterrows()
-        }
+        products_in_order = _products_in_order(order_id, transactions_df)
 
         # STEP 1: Check stock availability and calculate total weight
-        is_stock_ok, total_weight = check_stock_availability(products_in_order)
+        reservation_id = None
+        with metrics.time('stock_check'):
+            if ledger is not None:
+                reservation_id, total_weight = ledger.reserve(products_in_order)
+                is_stock_ok = reservation_id is not None
+            else:
+                is_stock_ok, total_weight = check_stock_availability(products_in_order)
         if not is_stock_ok:
-            orders_df.loc[order_id, 'status'] = 'čeká na naskladnění'
-            orders_df.loc[order_id, 'notes'] = 'Jeden nebo více produktů není skladem.'
-            logging.info(f"--- Objednávka č. {order_id} přesunuta do stavu 'čeká na naskladnění' ---")
+            _set_waiting_for_stock(results, order_id, metrics)
             continue
 
         # STEP 2: Assign shipping based on weight
-        carrier, shipping_cost = assign_shipping(order_id, total_weight)
-        orders_df.loc[order_id, 'shipping_carrier'] = carrier
-        orders_df.loc[order_id, 'shipping_cost'] = shipping_cost
+        _assign_order_shipping(results, order_id, total_weight, metrics)
 
         # STEP 3: Check value limit and arrange insurance
         total_value = order_details['total_value']
         insurance_needed = total_value > 100000
 
         if insurance_needed:
-            is_insurance_ok = arrange_insurance(order_id, total_value)
+            is_insurance_ok = _insure(order_id, total_value, metrics, insurance)
             if not is_insurance_ok:
-                orders_df.loc[order_id, 'status'] = 'vyžaduje manuální kontrolu'
-                orders_df.loc[order_id, 'notes'] = 'Nepodařilo se sjednat pojištění pro zásilku.'
-                logging.info(f"--- Objednávka č. {order_id} přesunuta do stavu 'vyžaduje manuální kontrolu' ---")
+                _apply_insurance_result(results, order_id, False, ledger, reservation_id, metrics)
                 continue
         
         # STEP 4: All checks passed, the order is approved
-        orders_df.loc[order_id, 'status'] = 'schváleno - k expedici'
-        orders_df.loc[order_id, 'notes'] = 'Objednávka byla automaticky schválena.'
-        logging.info(f"--- Objednávka č. {order_id} SCHVÁLENA ---")
+        _apply_insurance_result(results, order_id, True, ledger, reservation_id, metrics)
+
+def _process_orders_concurrently(orders, transactions_df, insurance, ledger, results, metrics):
+    """
+    The steps of process_orders with insurance dispatched concurrently. All orders are checked
+    first, keeping their reservations, then the high-value orders with stock are insured at once
+    (in rounds, see _insurance_rounds), and the statuses are decided once every result is known.
+    """
+    order_ids = orders.index
+    total_values = orders['total_value'].to_numpy()
+    products = [_products_in_order(order_id, transactions_df) for order_id in order_ids]
+    is_stock_ok = np.zeros(len(order_ids), dtype=bool)
+    total_weight = np.zeros(len(order_ids), dtype=float)
+    reservation_ids = np.full(len(order_ids), None, dtype=object)
+
+    def check_stock(indices, give_back=()):
+        for i in indices:
+            logging.info("--- Zpracovávám objednávku č. %s ---", order_ids[i])
+            with metrics.time('stock_check'):
+                if ledger is None:
+                    is_stock_ok[i], total_weight[i] = check_stock_availability(products[i])
+                    continue
+                reservation_ids[i], total_weight[i] = ledger.reserve(products[i])
+                is_stock_ok[i] = reservation_ids[i] is not None
+                if is_stock_ok[i] and i in give_back:
+                    ledger.release(reservation_ids[i])
+                    reservation_ids[i] = None
+
+    check_stock(range(len(order_ids)))
+    insurance_ok = _insurance_rounds(total_values > 100000, is_stock_ok, reservation_ids, ledger, check_stock,
+                                     lambda indices: _insure_orders(indices, order_ids, total_values, insurance, metrics))
+    for i, order_id in enumerate(order_ids):
+        if not is_stock_ok[i]:
+            _set_waiting_for_stock(results, order_id, metrics)
+            continue
+        _assign_order_shipping(results, order_id, total_weight[i], metrics)
+        _apply_insurance_result(results, order_id, insurance_ok.get(i, True), ledger, reservation_ids[i], metrics)
 
+def process_orders(orders_df, transactions_df, insurance=None, ledger=None, metrics=None):
+    """
+    Main function that processes all new orders with the 'pending approval' status.
+    With an InsuranceDispatcher passed as `insurance`, high-value orders are insured
+    concurrently and the orders are decided once their insurance is known; an order that
+    failed insurance still gives its goods back to the orders after it (a serial dispatcher
+    insures each order before the next one, like the plain call).
+    With an InventoryLedger passed as `ledger`, stock is reserved per order instead
+    of only being read, so two orders can never take the same last piece.
+    With PipelineMetrics passed as `metrics`, the latency of every stage and the
+    outcome of every order are recorded.
+    """
+    metrics = metrics or NULL_METRICS
+    # Filter only the orders that need processing
+    new_orders_to_process = orders_df[orders_df['status'] == 'čeká na schválení']
+
+    if new_orders_to_process.empty:
+        logging.info("Žádné nové objednávky ke zpracování.")
+        return orders_df
+
+    logging.info("Nalezeno %d nových objednávek ke zpracování.", len(new_orders_to_process))
+    results = _OrderResults()
+    if insurance is not None and not insurance.serial:
+        _process_orders_concurrently(new_orders_to_process, transactions_df, insurance, ledger, results, metrics)
+    else:
+        _process_orders_serially(new_orders_to_process, transactions_df, insurance, ledger, results, metrics)
+
+    started = time.perf_counter()
+    results.write(orders_df)
+    _observe_batch(metrics, 'table_write', started, len(new_orders_to_process))
     return orders_df
 
-if __name__ == '__main__':
-    # --- SIMULATION SETUP ---
-    # Load source data
-    try:
-        products_df = pd.read_csv('../data/in/Products.csv')
-        transactions_df_raw = pd.read_csv('../data/in/Transactions.csv')
-    except FileNotFoundError as e:
-        logging.error(f"CHYBA: Vstupní soubor nebyl nalezen. Ujistěte se, že soubory jsou v 'data/in'. Detail: {e}")
-        exit()
-        
-    transactions_df_raw.rename(columns={'Product name ': 'Product name'}, inplace=True)
-    
-    # +++ Data Validation: Check for products in transactions that are not in the product catalog +++
-    products_in_catalog = set(products_df['Product name'])
-    products_in_transactions = set(transactions_df_raw['Product name'])
-    missing_products = products_in_transactions - products_in_catalog
-    if missing_products:
-        logging.warning(f"Následující produkty z transakcí nebyly nalezeny v katalogu produktů: {missing_products}")
-        # Optional: filter out transactions with missing products
-        # transactions_df_raw = transactions_df_raw[~transactions_df_raw['Product name'].isin(missing_products)]
+# Store state key of the stock left after the orders processed so far
+STOCK_STATE_KEY = 'stock'
+
+# --------------------------------------------------------------------------------
+# PART 3: BATCH ENGINE
+# Same decisions as process_orders, computed with array operations over all
+# pending orders at once. process_orders stays as the reference implementation.
+# --------------------------------------------------------------------------------
+
+def build_catalog(stock=None, products_df=None):
+    """
+    Returns the ProductCatalog the batch engine resolves stock and weight against.
+    With the products table, the ids are those of transactions prepared from it ('Product ID');
+    without it, the catalog holds only the products of the stock (MOCK_STOCK by default).
+    """
+    stock = MOCK_STOCK if stock is None else stock
+    return ProductCatalog.from_stock(stock) if products_df is None else ProductCatalog.from_products(products_df, stock)
+
+def _order_lines(order_ids, transactions_df):
+    """Transaction lines of the given orders, deduplicated the way the per-order path sees them."""
+    columns = ['Transaction ID', 'Product name', 'Quantity'] + (['Product ID'] if 'Product ID' in transactions_df else [])
+    lines = transactions_df.loc[transactions_df['Transaction ID'].isin(order_ids), columns]
+    # The per-order path collects lines into a {product: quantity} dict, so a repeated product keeps its last quantity.
+    # Integer ids are compared instead of names unless unknown products (which all share id -1) are present.
+    product_key = 'Product ID' if 'Product ID' in lines and (lines['Product ID'].to_numpy() >= 0).all() else 'Product name'
+    return lines.drop_duplicates(subset=['Transaction ID', product_key], keep='last')
 
-    # Join data to get prices and categories
-    full_transactions_df = pd.merge(transactions_df_raw, products_df, on='Product name', how='left')
-    full_transactions_df['Turnover'] = full_transactions_df['Quantity'] * full_transactions_df['Price']
+def _line_product_ids(lines, catalog):
+    """Catalog ids of the lines: the 'Product ID' of transactions prepared from the catalog's products table, otherwise encoded by name."""
+    if 'Product ID' in lines and not catalog.stock_only:
+        return lines['Product ID'].to_numpy()
+    return catalog.encode(lines['Product name'])[0]
 
-    # Create a "mock" orders table (in a real scenario, this would be a DB table)
+def check_stock_availability_batch(order_ids, transactions_df, catalog=None):
+    """
+    Vectorized counterpart of check_stock_availability for many orders.
+    Stock and weight are gathered from the catalog arrays by product id.
+    Returns (is_stock_ok, total_weight) arrays aligned with order_ids.
+    """
+    order_ids = pd.Index(order_ids)
+    lines = _order_lines(order_ids, transactions_df)
+
+    if catalog is None:
+        catalog = build_catalog()
+    stock_count, weight, is_known = catalog.stock_of(_line_product_ids(lines, catalog))
+    quantity = lines['Quantity'].to_numpy()
+
+    per_line = pd.DataFrame({
+        'Transaction ID': lines['Transaction ID'].to_numpy(),
+        'line_ok': is_known & (stock_count >= quantity),
+        'line_weight': weight * quantity,
+    })
+    per_order = per_line.groupby('Transaction ID', sort=False).agg(
+        is_stock_ok=('line_ok', 'all'),
+        total_weight=('line_weight', 'sum'),
+    )
+
+    # Orders without any transaction lines pass the check with zero weight, as in the per-order path
+    per_order = per_order.reindex(order_ids)
+    is_stock_ok = per_order['is_stock_ok'].fillna(True).to_numpy(dtype=bool)
+    total_weight = np.where(is_stock_ok, per_order['total_weight'].fillna(0.0).to_numpy(dtype=float), 0.0)
+    return is_stock_ok, total_weight
+
+def _reservation_lines(order_ids, transactions_df, ledger, catalog=None):
+    """Ledger positions and quantities of the lines of the given orders, with the line rows of every order."""
+    lines = _order_lines(order_ids, transactions_df)
+    if catalog is not None:
+        positions = gather(catalog.positions_in(ledger.product_index), _line_product_ids(lines, catalog), UNKNOWN_ID)
+    else:
+        positions = ledger.encode(lines['Product name'])
+    return positions, lines['Quantity'].to_numpy(), lines.groupby('Transaction ID', sort=False).indices
+
+def _reserve_orders(ledger, reservation_lines, order_ids, indices, is_stock_ok, total_weight, reservation_ids, give_back=()):
+    """
+    Reserves stock for the orders at the given indices, one after another, filling the result arrays in place.
+    Orders in `give_back` (insurance already failed) release their goods right after the check.
+    """
+    positions, quantities, lines_by_order = reservation_lines
+    no_lines = np.array([], dtype=np.int64)
+    for i in indices:
+        rows = lines_by_order.get(order_ids[i], no_lines)
+        reservation_ids[i], total_weight[i] = ledger.reserve_positions(positions[rows], quantities[rows])
+        is_stock_ok[i] = reservation_ids[i] is not None
+        if is_stock_ok[i] and i in give_back:
+            ledger.release(reservation_ids[i])
+            reservation_ids[i] = None
+
+def reserve_stock_batch(order_ids, transactions_df, ledger, catalog=None):
+    """
+    Reserves stock for many orders in the ledger. Reservations are made in the
+    order of order_ids, so an earlier order takes precedence as in the per-order path.
+    With a catalog, the ledger positions are gathered by product id instead of looking up every line's name.
+    Returns (is_stock_ok, total_weight, reservation_ids) arrays aligned with order_ids.
+    """
+    is_stock_ok = np.zeros(len(order_ids), dtype=bool)
+    total_weight = np.zeros(len(order_ids), dtype=float)
+    reservation_ids = np.full(len(order_ids), None, dtype=object)
+    _reserve_orders(ledger, _reservation_lines(order_ids, transactions_df, ledger, catalog), order_ids, range(len(order_ids)),
+                    is_stock_ok, total_weight, reservation_ids)
+    return is_stock_ok, total_weight, reservation_ids
+
+def _decide_batch(order_ids, total_values, transactions_df, catalog=None, insurance=None, ledger=None, metrics=NULL_METRICS):
+    """
+    Decisions of the batch engine for pending orders, as order_state codes.
+    Returns (status, carrier, shipping_cost, reservation_ids) arrays aligned with order_ids;
+    orders that were not shipped have Carrier.NONE and a zero cost, orders whose reservation
+    was already given back have no reservation id.
+    """
+    # STEP 1: Stock availability and total weight for all orders
+    started = time.perf_counter()
+    if ledger is not None:
+        reservation_lines = _reservation_lines(order_ids, transactions_df, ledger, catalog)
+        is_stock_ok = np.zeros(len(order_ids), dtype=bool)
+        total_weight = np.zeros(len(order_ids), dtype=float)
+        reservation_ids = np.full(len(order_ids), None, dtype=object)
+        _reserve_orders(ledger, reservation_lines, order_ids, range(len(order_ids)), is_stock_ok, total_weight, reservation_ids)
+    else:
+        is_stock_ok, total_weight = check_stock_availability_batch(order_ids, transactions_df, catalog)
+        reservation_ids = np.full(len(order_ids), None, dtype=object)
+    _observe_batch(metrics, 'stock_check', started, len(order_ids))
+
+    # STEP 2: Insurance stays a per-order external call, made in the same order as the per-order path
+    def reserve_again(indices, give_back):
+        started = time.perf_counter()
+        _reserve_orders(ledger, reservation_lines, order_ids, indices, is_stock_ok, total_weight, reservation_ids, give_back)
+        _observe_batch(metrics, 'stock_check', started, len(indices))
+
+    insurance_ok = _insurance_rounds(total_values > 100000, is_stock_ok, reservation_ids, ledger, reserve_again,
+                                     lambda indices: _insure_orders(indices, order_ids, total_values, insurance, metrics))
+
+    # STEP 3: Shipping tiers as a vectorized lookup, over the final reservations
+    started = time.perf_counter()
+    tier = shipping_tier(total_weight)
+    carrier = np.where(is_stock_ok, SHIPPING_CARRIER_CODES[tier], Carrier.NONE).astype(CODE_DTYPE)
+    shipping_cost = np.where(is_stock_ok, SHIPPING_COSTS[tier], 0)
+    _observe_batch(metrics, 'shipping', started, int(is_stock_ok.sum()))
+
+    status = np.where(is_stock_ok, OrderStatus.APPROVED, OrderStatus.WAITING_FOR_STOCK).astype(CODE_DTYPE)
+    for i, is_insurance_ok in insurance_ok.items():
+        if is_stock_ok[i] and not is_insurance_ok:
+            status[i] = OrderStatus.MANUAL_REVIEW
+    return status, carrier, shipping_cost, reservation_ids
+
+def _settle_reservations(ledger, status, carrier, reservation_ids):
+    """Approved orders take the reserved goods, orders sent to manual review give them back."""
+    if ledger is None:
+        return
+    for i in np.flatnonzero(carrier != Carrier.NONE):
+        if reservation_ids[i] is None:
+            continue
+        if status[i] == OrderStatus.APPROVED:
+            ledger.commit(reservation_ids[i])
+        else:
+            ledger.release(reservation_ids[i])
+
+def _record_outcomes(metrics, status, carrier):
+    """Counts the outcomes of a batch per status and carrier, and logs the summary."""
+    status_counts = np.bincount(status, minlength=len(STATUS_LABELS))
+    for code, n in enumerate(status_counts):
+        if n:
+            metrics.count('status', STATUS_LABELS[code], int(n))
+    for code, n in enumerate(np.bincount(carrier, minlength=len(CARRIER_LABELS))):
+        if n and code != Carrier.NONE:
+            metrics.count('carrier', CARRIER_LABELS[code], int(n))
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info("Dávkově zpracováno %d objednávek: %s", len(status), ", ".join(
+            f"{STATUS_LABELS[code]}: {n}" for code, n in sorted(enumerate(status_counts), key=lambda item: -item[1]) if n))
+
+def process_orders_batch(orders_df, transactions_df, catalog=None, insurance=None, ledger=None, metrics=None):
+    """
+    Batch version of process_orders with identical results.
+    Transaction lines are grouped once, stock and weight are gathered from the
+    ProductCatalog by product id and statuses are written back in bulk.
+    With an InsuranceDispatcher passed as `insurance`, all insurance calls are dispatched at once.
+    With an InventoryLedger passed as `ledger`, stock is reserved order by order
+    (the only sequential step, since each order depends on the earlier ones).
+    With PipelineMetrics passed as `metrics`, stage latencies are recorded per batch
+    (insurance per call) and outcomes per order.
+    """
+    metrics = metrics or NULL_METRICS
+    pending_mask = (orders_df['status'] == 'čeká na schválení').to_numpy()
+    if not pending_mask.any():
+        logging.info("Žádné nové objednávky ke zpracování.")
+        return orders_df
+
+    order_ids = orders_df.index[pending_mask]
+    logging.info("Nalezeno %d nových objednávek ke zpracování (dávkový režim).", len(order_ids))
+    total_values = orders_df['total_value'].to_numpy()[pending_mask]
+    status, carrier, shipping_cost, reservation_ids = _decide_batch(order_ids, total_values, transactions_df, catalog, insurance, ledger, metrics)
+
+    # STEP 4: Bulk write of the results, decoded to the labels of the orders table
+    started = time.perf_counter()
+    _settle_reservations(ledger, status, carrier, reservation_ids)
+    orders_df.loc[order_ids, 'status'] = decode(status, STATUS_LABELS)
+    orders_df.loc[order_ids, 'notes'] = decode(STATUS_NOTES[status], NOTE_LABELS)
+    shipped = carrier != Carrier.NONE
+    orders_df.loc[order_ids[shipped], 'shipping_carrier'] = decode(carrier[shipped], CARRIER_LABELS)
+    orders_df.loc[order_ids[shipped], 'shipping_cost'] = shipping_cost[shipped]
+    _observe_batch(metrics, 'status_write', started, len(order_ids))
+    _record_outcomes(metrics, status, carrier)
+    return orders_df
+
+def process_order_state(state, transactions_df, catalog=None, insurance=None, ledger=None, metrics=None):
+    """
+    The batch engine over an encoded OrderState: the pending orders are found by comparing
+    status codes and the results are written as codes, without building any strings.
+    Same decisions and options as process_orders_batch.
+    """
+    metrics = metrics or NULL_METRICS
+    positions = state.positions(OrderStatus.PENDING)
+    if len(positions) == 0:
+        logging.info("Žádné nové objednávky ke zpracování.")
+        return state
+
+    order_ids = state.order_ids[positions]
+    logging.info("Nalezeno %d nových objednávek ke zpracování (dávkový režim, kódovaný stav).", len(order_ids))
+    status, carrier, shipping_cost, reservation_ids = _decide_batch(order_ids, state.total_value[positions], transactions_df,
+                                                                    catalog, insurance, ledger, metrics)
+    started = time.perf_counter()
+    _settle_reservations(ledger, status, carrier, reservation_ids)
+    state.set_results(positions, status, carrier, shipping_cost)
+    _observe_batch(metrics, 'status_write', started, len(order_ids))
+    _record_outcomes(metrics, status, carrier)
+    return state
+
+def process_orders_store(store, transactions_df, process=process_orders, page_size=10000, insurance=None, ledger=None, metrics=None, delta=None):
+    """
+    Processes the pending orders of an OrdersStore page by page with either engine.
+    Each page is processed as an orders table and its results are written back to the
+    store in one batched transaction, so at most page_size orders are held in memory.
+    The transaction lines are grouped by order once; every page gets only the lines of its orders.
+    With an InventoryLedger passed as `ledger`, the stock left after each page is saved in the
+    store (STOCK_STATE_KEY) in the same transaction as the page's results.
+    With a DeltaWriter passed as `delta`, the orders of each page that changed status are appended to it.
+    Returns the number of orders processed.
+    """
+    metrics = metrics or NULL_METRICS
+    lines_by_order = transactions_df.groupby('Transaction ID', sort=False).indices
+    no_lines = np.array([], dtype=np.int64)
+    processed = 0
+    for page in store.pending_pages(page_size):
+        rows = np.sort(np.concatenate([lines_by_order.get(order_id, no_lines) for order_id in page.index.tolist()]))
+        page_lines = transactions_df.iloc[rows]
+        # The engines update the page in place
+        previous_status = page['status'].copy()
+        result = process(page, page_lines, insurance=insurance, ledger=ledger, metrics=metrics)
+        started = time.perf_counter()
+        with store.transaction():
+            store.apply_updates(result)
+            if ledger is not None:
+                store.set_state(STOCK_STATE_KEY, ledger.snapshot())
+        _observe_batch(metrics, 'store_write', started, len(page))
+        if delta is not None:
+            started = time.perf_counter()
+            delta.write_changes(previous_status, result)
+            _observe_batch(metrics, 'delta_write', started, len(page))
+        processed += len(page)
+    if processed == 0:
+        logging.info("Žádné nové objednávky ke zpracování.")
+    return processed
+
+def stored_stock(store, stock):
+    """The stock saved in the store by an earlier run ({product: (stock_count, weight_kg)}), or `stock` when there is none."""
+    saved = store.get_state(STOCK_STATE_KEY)
+    if saved is None:
+        return stock
+    logging.info("Stav skladu načten z databáze objednávek (zboží odeslané v předchozích bězích je odečteno).")
+    return {product: tuple(values) for product, values in saved.items()}
+
+def build_orders_table(full_transactions_df, first_position=0):
+    """
+    Creates a "mock" orders table (in a real scenario, this would be a DB table).
+    `first_position` is the number of orders created before, so tables built batch by batch
+    mark the same high-value orders as one table built from all transactions.
+    """
     orders_table = full_transactions_df.groupby('Transaction ID').agg(
         total_value=('Turnover', 'sum')
     )
     
     # Set every 4th order as a high-value one to test the insurance for the simulation
-    order_ids = orders_table.index.to_list()
-    for i, order_id in enumerate(order_ids):
-        if i > 0 and i % 4 == 0:
-            orders_table.loc[order_id, 'total_value'] *= 2.5
+    position = first_position + np.arange(len(orders_table))
+    scaled = orders_table['total_value'] * np.where((position > 0) & (position % 4 == 0), 2.5, 1)
+    # Whole values stay integers, as they did with per-order in-place assignments
+    orders_table['total_value'] = scaled.astype(orders_table['total_value'].dtype) if (scaled % 1 == 0).all() else scaled
     
     # Set initial statuses for all orders
     orders_table['status'] = 'čeká na schválení'  # type: ignore
     orders_table['notes'] = ''  # type: ignore
     orders_table['shipping_carrier'] = None  # type: ignore
     orders_table['shipping_cost'] = 0  # type: ignore
+    return orders_table
+
+def main(argv=None):
+    """Runs the order automation simulation and exports the final state to CSV."""
+    parser = argparse.ArgumentParser(description="Automatizace zpracování objednávek.")
+    parser.add_argument('--batch', action='store_true', help="Zpracovat objednávky dávkovým (vektorizovaným) enginem.")
+    parser.add_argument('--insurance-workers', type=int, default=8, help="Počet souběžných volání API pojišťovny (0 = sériově).")
+    parser.add_argument('--insurance-timeout', type=float, default=5.0, help="Časový limit jednoho volání API pojišťovny v sekundách.")
+    parser.add_argument('--insurance-retries', type=int, default=2, help="Počet opakování při selhání API pojišťovny.")
+    parser.add_argument('--insurance-cache', default=DECISION_CACHE_PATH, help="Databáze uložených rozhodnutí o pojištění (opakovaný běh už API nevolá).")
+    parser.add_argument('--insurance-cache-ttl', type=float, default=30.0, help="Platnost uloženého rozhodnutí o pojištění ve dnech.")
+    parser.add_argument('--no-insurance-cache', action='store_true', help="Nepoužívat uložená rozhodnutí o pojištění.")
+    parser.add_argument('--breaker-threshold', type=int, default=5, help="Počet chyb API pojišťovny v řadě, po kterém se jistič rozpojí (0 = bez jističe).")
+    parser.add_argument('--breaker-reset', type=float, default=30.0, help="Doba v sekundách, po které rozpojený jistič zkusí API znovu.")
+    parser.add_argument('--no-cache', action='store_true', help="Nepoužívat binární cache připravených dat.")
+    parser.add_argument('--no-reservations', action='store_true', help="Pouze číst stav skladu bez rezervace zboží (původní chování).")
+    parser.add_argument('--metrics', default=None, help="Soubor pro metriky běhu (.json, nebo .prom pro formát Prometheus).")
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help="Interval průběžného zápisu metrik v sekundách (0 = jen na konci).")
+    parser.add_argument('--compact-state', action='store_true', help="Držet stav objednávek v kódované podobě (jen s --batch, bez --store).")
+    parser.add_argument('--store', default=None, help="Databáze SQLite se stavem objednávek (trvalý stav; opakovaný běh zpracuje jen nové objednávky).")
+    parser.add_argument('--page-size', type=int, default=10000, help="Počet objednávek načtených z databáze najednou.")
+    parser.add_argument('--export', default='full', choices=['full', 'delta'], help="Export: celý output.csv, nebo jen změněné objednávky do souboru změn.")
+    parser.add_argument('--delta-file', default=DELTA_PATH, help="Soubor změn pro --export delta.")
+    parser.add_argument('--compact-size', type=float, default=64.0, help="Velikost souboru změn v MB, nad kterou se sloučí do output.csv.")
+    parser.add_argument('--products', default='../data/in/Products.csv', help="Katalog produktů (CSV).")
+    parser.add_argument('--transactions', default='../data/in/Transactions.csv', help="Transakce (CSV).")
+    parser.add_argument('--stock', default=None, help="Stav skladu (Stock.json); výchozí je MOCK_STOCK. Načítá se z předkompilovaného snapshotu katalogu.")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Složka binární cache připravených dat a snapshotu katalogu.")
+    parser.add_argument('--output', default='../data/out/output.csv', help="Úplný export stavu objednávek (CSV).")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="Úroveň logování.")
+    args = parser.parse_args(argv)
+    if args.compact_state and (not args.batch or args.store):
+        parser.error("--compact-state lze použít jen s --batch a bez --store")
+    if args.stock and args.no_reservations and not args.batch:
+        parser.error("--stock nelze použít s --no-reservations bez --batch (původní engine čte jen MOCK_STOCK)")
+    logging.getLogger().setLevel(args.log_level)
+
+    # --- SIMULATION SETUP ---
+    # Load source data, joined with the products to get prices and categories (from the binary cache when it is fresh)
+    try:
+        full_transactions_df = load_prepared_data(args.products, args.transactions, cache_dir=None if args.no_cache else args.cache_dir)
+        # Product ids, prices and the stock as parallel arrays (from the precompiled snapshot when it is fresh)
+        catalog = ProductCatalog.load(args.products, args.stock, None if args.no_cache else os.path.join(args.cache_dir, 'catalog.snapshot'))
+        if args.stock is None:
+            catalog.set_stock(MOCK_STOCK)
+    except FileNotFoundError as e:
+        logging.error(f"CHYBA: Vstupní soubor nebyl nalezen. Ujistěte se, že soubory jsou v 'data/in'. Detail: {e}")
+        exit()
+    
+    # +++ Data Validation: Check for products in transactions that are not in the product catalog +++
+    # They were flagged when the transactions were encoded against the catalog: their product id is -1
+    missing_products = set(full_transactions_df.loc[full_transactions_df['Product ID'].to_numpy() == UNKNOWN_ID, 'Product name'])
+    if missing_products:
+        logging.warning(f"Následující produkty z transakcí nebyly nalezeny v katalogu produktů: {missing_products}")
+        # Optional: filter out transactions with missing products
+        # full_transactions_df = full_transactions_df[~full_transactions_df['Product name'].isin(missing_products)]
+
+    orders_table = build_orders_table(full_transactions_df)
 
     logging.info("--- Počáteční stav tabulky objednávek ---")
-    logging.info(f"\n{orders_table.head()}")
+    logging.info("\n%s", orders_table.head())
     
     # --- RUN AUTOMATION ---
-    final_state_df = process_orders(orders_table.copy(), full_transactions_df) # Use copy to avoid SettingWithCopyWarning
+    stock = MOCK_STOCK if args.stock is None else catalog.stock()
+    store = SqliteOrdersStore(args.store) if args.store else None
+    if store is not None:
+        logging.info("Do databáze %s přidáno %d nových objednávek.", args.store, store.add_orders(orders_table))
+        # The reservations of earlier runs stay committed: their stock continues from the database
+        stock = stored_stock(store, stock)
+    ledger = None if args.no_reservations else InventoryLedger(stock)
+    process = functools.partial(process_orders_batch, catalog=catalog) if args.batch else process_orders
+    metrics = PipelineMetrics()
+    writer = PeriodicWriter(metrics, args.metrics, args.metrics_interval) if args.metrics else None
+    delta = DeltaWriter(args.delta_file) if args.export == 'delta' else None
+
+    def run(insurance=None):
+        if store is not None:
+            process_orders_store(store, full_transactions_df, process, args.page_size, insurance=insurance, ledger=ledger, metrics=metrics, delta=delta)
+            if delta is not None:
+                # The delta export does not need the whole table, only a summary is logged
+                logging.info("Stav objednávek v databázi: %s", store.status_counts())
+                return None
+            return store.to_frame()
+        if args.compact_state:
+            state = process_order_state(OrderState.from_frame(orders_table), full_transactions_df, catalog, insurance=insurance, ledger=ledger, metrics=metrics)
+            # The labels are only built here, for the export
+            final_state_df = state.to_frame()
+        else:
+            final_state_df = process(orders_table.copy(), full_transactions_df, insurance=insurance, ledger=ledger, metrics=metrics) # Use copy to avoid SettingWithCopyWarning
+        if delta is not None:
+            delta.write_changes(orders_table['status'], final_state_df)
+        return final_state_df
+
+    # The circuit breaker and the decision cache work through the dispatcher, a serial one with --insurance-workers 0
+    breaker = CircuitBreaker(args.breaker_threshold, args.breaker_reset, metrics=metrics) if args.breaker_threshold > 0 else None
+    decision_cache = None if args.no_insurance_cache else InsuranceDecisionCache(args.insurance_cache, args.insurance_cache_ttl * 24 * 3600)
+    try:
+        with InsuranceDispatcher(arrange_insurance, max_in_flight=args.insurance_workers, timeout=args.insurance_timeout,
+                                 max_retries=args.insurance_retries, breaker=breaker, cache=decision_cache, metrics=metrics) as insurance:
+            final_state_df = run(insurance)
+    finally:
+        if writer is not None:
+            writer.close()
+        if decision_cache is not None:
+            decision_cache.close()
+        if store is not None:
+            store.close()
+        if delta is not None:
+            delta.close()
+    snapshot = metrics.snapshot()
+    logging.info("Zpracováno %d objednávek za %.2f s (%.1f objednávek/s).", snapshot['orders'], snapshot['elapsed_seconds'], snapshot['orders_per_second'])
+    cache_counts = snapshot['counters'].get('insurance_cache')
+    if cache_counts:
+        logging.info("Pojištění: %d objednávek podle uložených rozhodnutí, %d objednávek přes API pojišťovny.", cache_counts.get('hit', 0), cache_counts.get('miss', 0))
+    if args.metrics:
+        logging.info("Metriky byly uloženy do souboru %s", args.metrics)
     
-    logging.info("--- Finální stav tabulky objednávek po zpracování ---")
-    logging.info(f"\n{final_state_df}")
+    if final_state_df is not None:
+        logging.info("--- Finální stav tabulky objednávek po zpracování ---")
+        logging.info("\n%s", final_state_df)
 
     # +++ Export to CSV +++
     try:
-        output_path = "../data/out/output.csv"
-        final_state_df.to_csv(output_path, encoding="utf-8")
-        logging.info(f"Výsledky byly úspěšně uloženy do souboru {output_path}")
+        output_path = args.output
+        if delta is None:
+            final_state_df.to_csv(output_path, encoding="utf-8")
+            logging.info("Výsledky byly úspěšně uloženy do souboru %s", output_path)
+        else:
+            logging.info("Do souboru změn %s zapsáno %d změněných objednávek.", args.delta_file, delta.rows_written)
+            # The first delta run creates the full snapshot; later ones fold the delta in once it has grown large
+            if not os.path.exists(output_path):
+                updated = compact(args.delta_file, output_path)
+            else:
+                updated = compact_if_needed(args.delta_file, output_path, args.compact_size * 2**20)
+            if updated:
+                logging.info("Soubor změn sloučen do %s (%d objednávek).", output_path, updated)
     except Exception as e:
         logging.error(f"Nepodařilo se uložit výsledky do CSV: {e}")
     
-    logging.info("Skript na automatizaci dokončen.") 
\ No newline at end of file
+    logging.info("Skript na automatizaci dokončen.")
+
+if __name__ == '__main__':
+    main()
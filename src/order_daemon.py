@@ -0,0 +1,478 @@
+import argparse
+import fnmatch
+import io
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+import order_automation
+from aggregates import TRANSACTION_DTYPES
+from data_cache import prepare_transactions
+from incremental import ByteRange, complete_lines_end
+from insurance import DECISION_CACHE_PATH, CircuitBreaker, InsuranceDecisionCache, InsuranceDispatcher
+from inventory import InventoryLedger, load_stock
+from metrics import PeriodicWriter, PipelineMetrics
+from orders_store import SqliteOrdersStore
+
+# --------------------------------------------------------------------------------
+# CONTINUOUS ORDER PROCESSING
+# Follows an append-only transactions source (a growing CSV or a directory of
+# drop files), assembles complete orders and processes them in micro-batches
+# bounded by size and by time. The orders live in a SQLite orders store; every
+# step writes only the orders it touched, together with a small checkpoint (the
+# source position, the lines not processed yet and the stock), in one transaction,
+# so a restart resumes where it stopped. Orders waiting for stock are re-evaluated
+# whenever the stock changes.
+# --------------------------------------------------------------------------------
+
+CHECKPOINT_PATH = '../data/cache/daemon_checkpoint.sqlite'
+CHECKPOINT_FORMAT_VERSION = 2
+LINE_COLUMNS = ['Transaction ID', 'Date', 'Product name', 'Quantity']
+ORDER_COLUMNS = ['total_value', 'status', 'notes', 'shipping_carrier', 'shipping_cost']
+WAITING_STATUS = 'čeká na naskladnění'
+# Largest number of ids in one SQL IN (...) list
+SQL_BATCH = 500
+# Orders waiting for stock re-evaluated in one engine call
+REEVALUATE_PAGE_SIZE = 10000
+
+def _empty_lines():
+    return pd.DataFrame({
+        'Transaction ID': pd.Series(dtype='int64'), 'Date': pd.Series(dtype=object),
+        'Product name': pd.Series(dtype=object), 'Quantity': pd.Series(dtype='int64'),
+    })
+
+def _read_lines(f, columns=None):
+    """Reads transaction lines as raw columns (the date stays text until the lines are prepared)."""
+    lines = pd.read_csv(f, encoding='utf-8-sig', dtype={**TRANSACTION_DTYPES, 'Date': str, 'Product name ': str, 'Product name': str},
+                        header=0 if columns is None else None, names=columns)
+    return lines.rename(columns={'Product name ': 'Product name'})[LINE_COLUMNS].astype({'Transaction ID': 'int64', 'Quantity': 'int64'})
+
+def _lines_to_json(lines):
+    return {column: lines[column].tolist() for column in LINE_COLUMNS}
+
+def _lines_from_json(data):
+    return pd.concat([_empty_lines(), pd.DataFrame(data, columns=LINE_COLUMNS)], ignore_index=True).astype(_empty_lines().dtypes)
+
+def _lines_from_rows(rows):
+    return pd.concat([_empty_lines(), pd.DataFrame.from_records(rows, columns=LINE_COLUMNS)], ignore_index=True).astype(_empty_lines().dtypes)
+
+class CsvTailSource:
+    """A growing Transactions.csv. The position is the offset after the last complete line read."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return {'kind': 'csv', 'path': os.path.abspath(self.path)}
+
+    def initial_position(self):
+        return {'offset': 0, 'columns': None}
+
+    def read(self, position):
+        """Returns (new lines, new position). A line still being written is left for the next read."""
+        end = complete_lines_end(self.path)
+        if end < position['offset']:
+            raise ValueError(f"Soubor {self.path} se zkrátil pod uloženou pozici {position['offset']}; nejde o soubor, do kterého se jen připisuje.")
+        if end == position['offset']:
+            return _empty_lines(), position
+        with open(self.path, 'rb') as f:
+            f.seek(position['offset'])
+            data = io.BufferedReader(ByteRange(f, end))
+            if position['columns'] is None:
+                columns = [column.lstrip('\ufeff') for column in data.readline().decode('utf-8').rstrip('\r\n').split(',')]
+            else:
+                columns = position['columns']
+            lines = _read_lines(data, columns) if data.peek(1) else _empty_lines()
+        return lines, {'offset': end, 'columns': columns}
+
+class DropDirectorySource:
+    """
+    A directory into which CSV files with transaction lines are dropped, processed in name order.
+    The position is the list of files already read. Writers should create a file under another
+    name (e.g. '.tmp') and rename it when complete, so a half-written file is never read.
+    """
+
+    def __init__(self, directory, pattern='*.csv'):
+        self.directory = directory
+        self.pattern = pattern
+
+    def describe(self):
+        return {'kind': 'directory', 'path': os.path.abspath(self.directory), 'pattern': self.pattern}
+
+    def initial_position(self):
+        return {'files': []}
+
+    def read(self, position):
+        done = set(position['files'])
+        new_files = sorted(name for name in os.listdir(self.directory) if fnmatch.fnmatch(name, self.pattern) and name not in done)
+        if not new_files:
+            return _empty_lines(), position
+        frames = [_empty_lines()]
+        for name in new_files:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                frames.append(_read_lines(f))
+        return pd.concat(frames, ignore_index=True), {'files': sorted(done.union(new_files))}
+
+def open_source(path):
+    """A directory is read as drop files, anything else as a growing CSV."""
+    return DropDirectorySource(path) if os.path.isdir(path) else CsvTailSource(path)
+
+class DaemonStore(SqliteOrdersStore):
+    """
+    The daemon's SQLite orders store. Besides the orders and the checkpoint (store state) it keeps
+    the transaction lines of the orders waiting for stock, which are needed to evaluate them again.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        with self.transaction():
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS waiting_lines (
+                    order_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    product_name TEXT,
+                    quantity INTEGER NOT NULL
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS waiting_lines_order ON waiting_lines (order_id)")
+
+    def _select_in(self, query, ids):
+        """Rows of a query with one IN (...) placeholder list, run over the ids in slices."""
+        ids = [int(order_id) for order_id in ids]
+        rows = []
+        for start in range(0, len(ids), SQL_BATCH):
+            batch = ids[start:start + SQL_BATCH]
+            rows += self.connection.execute(query.format(', '.join('?' * len(batch))), batch).fetchall()
+        return rows
+
+    def known_ids(self, order_ids):
+        """The given order ids that are in the store."""
+        return {row[0] for row in self._select_in("SELECT order_id FROM orders WHERE order_id IN ({})", order_ids)}
+
+    def add_waiting_lines(self, lines):
+        rows = zip(lines['Transaction ID'].tolist(), lines['Date'].tolist(),
+                   lines['Product name'].astype(object).where(lines['Product name'].notna(), None).tolist(), lines['Quantity'].tolist())
+        with self.transaction():
+            self.connection.executemany("INSERT INTO waiting_lines (order_id, date, product_name, quantity) VALUES (?, ?, ?, ?)", rows)
+
+    def waiting_lines(self, order_ids):
+        rows = self._select_in("SELECT order_id, date, product_name, quantity FROM waiting_lines WHERE order_id IN ({}) ORDER BY rowid", order_ids)
+        return _lines_from_rows(rows)
+
+    def drop_waiting_lines(self, order_ids):
+        ids = [(int(order_id),) for order_id in order_ids]
+        with self.transaction():
+            self.connection.executemany("DELETE FROM waiting_lines WHERE order_id = ?", ids)
+
+    def count_waiting_lines(self):
+        return self.connection.execute("SELECT COUNT(*) FROM waiting_lines").fetchone()[0]
+
+class OrderDaemon:
+    """
+    Long-running order processing over an append-only transactions source.
+    - Lines are buffered until their order is complete: a line of another order arrived,
+      or the source has been quiet for max_delay seconds.
+    - Complete orders are processed in micro-batches of at most batch_size orders, as soon
+      as batch_size orders are ready or the oldest buffered line waited max_delay seconds.
+    - Orders in 'čeká na naskladnění' are processed again whenever the ledger version
+      changes: a restock in the ledger, or a change of the stock file when stock_path is
+      watched (the difference between its previous and new counts is restocked, so goods
+      the daemon already shipped are not counted again).
+    Every step that changed the state writes the orders it touched and the checkpoint
+    to the DaemonStore at checkpoint_path in one transaction.
+    """
+
+    def __init__(self, source, products_df, checkpoint_path=CHECKPOINT_PATH, stock=None, stock_path=None,
+                 batch_size=1000, max_delay=5.0, engine=None, insurance=None, metrics=None, clock=time.monotonic):
+        self.source = source
+        self.products_df = products_df
+        self.checkpoint_path = checkpoint_path
+        self.stock_path = stock_path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.engine = engine or order_automation.process_orders
+        self.insurance = insurance
+        self.metrics = metrics
+        self.clock = clock
+
+        self.store = DaemonStore(checkpoint_path)
+        self.position = source.initial_position()
+        self.pending_lines = _empty_lines()
+        self.orders_seen = 0
+        self.stock_mtime_ns = None
+        self.stock_file = None
+        if stock is None:
+            stock = load_stock(stock_path) if stock_path else order_automation.MOCK_STOCK
+        self.ledger = InventoryLedger(stock)
+        self.load_checkpoint()
+        self.evaluated_version = self.ledger.version
+        self.last_data_at = self.pending_since = self.clock()
+
+    # --- checkpoint ---
+
+    def load_checkpoint(self):
+        """Restores the state saved by save_checkpoint, if there is one. Returns True when a checkpoint was loaded."""
+        state = self.store.get_state('checkpoint')
+        if state is None or state.get('version') != CHECKPOINT_FORMAT_VERSION:
+            return False
+        if state['source'] != self.source.describe():
+            raise ValueError(f"Kontrolní bod {self.checkpoint_path} patří k jinému zdroji transakcí ({state['source']['path']}).")
+
+        self.position = state['position']
+        self.orders_seen = state['orders_seen']
+        self.pending_lines = _lines_from_json(state['pending_lines'])
+        self.stock_mtime_ns = state['stock_mtime_ns']
+        self.stock_file = state['stock_file']
+        self.ledger = InventoryLedger({product: tuple(values) for product, values in state['stock'].items()})
+        status_counts = self.store.status_counts()
+        logging.info("Obnoven kontrolní bod: %d objednávek, %d čeká na naskladnění, %d řádků ke zpracování.",
+                     sum(status_counts.values()), status_counts.get(WAITING_STATUS, 0), len(self.pending_lines))
+        return True
+
+    def save_checkpoint(self):
+        """
+        Saves the source position, the lines not processed yet and the stock. Called inside the
+        step's store transaction, so the checkpoint is committed together with the orders of the step.
+        """
+        self.store.set_state('checkpoint', {
+            'version': CHECKPOINT_FORMAT_VERSION,
+            'source': self.source.describe(),
+            'position': self.position,
+            'orders_seen': self.orders_seen,
+            'pending_lines': _lines_to_json(self.pending_lines),
+            'stock': self.ledger.snapshot(),
+            'stock_mtime_ns': self.stock_mtime_ns,
+            'stock_file': self.stock_file,
+        })
+
+    def _step_state(self):
+        """The in-memory state a step changes; the store side of a failed step is rolled back by its transaction."""
+        return {
+            'position': self.position,
+            'pending_lines': self.pending_lines,
+            'orders_seen': self.orders_seen,
+            'stock': self.ledger.snapshot(),
+            'reevaluate': self.ledger.version != self.evaluated_version,
+            'stock_mtime_ns': self.stock_mtime_ns,
+            'stock_file': self.stock_file,
+            'last_data_at': self.last_data_at,
+            'pending_since': self.pending_since,
+        }
+
+    def _restore_step_state(self, state):
+        """Puts back the state saved by _step_state before a step that failed."""
+        self.position = state['position']
+        self.pending_lines = state['pending_lines']
+        self.orders_seen = state['orders_seen']
+        # A fresh ledger drops the reservations of the failed step; a restock not evaluated yet stays due
+        self.ledger = InventoryLedger(state['stock'])
+        self.evaluated_version = self.ledger.version - 1 if state['reevaluate'] else self.ledger.version
+        self.stock_mtime_ns = state['stock_mtime_ns']
+        self.stock_file = state['stock_file']
+        self.last_data_at = state['last_data_at']
+        self.pending_since = state['pending_since']
+
+    # --- stock ---
+
+    def apply_stock_changes(self, previous, current):
+        """Restocks the difference between two versions of the stock counts ({product: stock_count})."""
+        # A product removed from the stock file has no stock left
+        for product in dict.fromkeys([*previous, *current]):
+            change = current.get(product, 0) - previous.get(product, 0)
+            if change == 0:
+                continue
+            if self.ledger.product_index.get_indexer([product])[0] < 0:
+                logging.warning("Produkt '%s' ze skladových dat není v evidenci skladu, ignoruji ho.", product)
+                continue
+            self.ledger.restock(product, change)
+
+    def _check_stock_file(self):
+        if self.stock_path is None:
+            return False
+        mtime_ns = os.stat(self.stock_path).st_mtime_ns
+        if mtime_ns == self.stock_mtime_ns:
+            return False
+        self.stock_mtime_ns = mtime_ns
+        counts = {product: count for product, (count, _) in load_stock(self.stock_path).items()}
+        # The first version seen is the baseline the ledger was created from
+        if self.stock_file is not None:
+            self.apply_stock_changes(self.stock_file, counts)
+        self.stock_file = counts
+        return True
+
+    # --- processing ---
+
+    def _run_engine(self, orders, raw_lines):
+        """Processes orders (all in 'čeká na schválení') and stores the lines of those left waiting for stock."""
+        result = self.engine(orders, prepare_transactions(self.products_df, raw_lines),
+                             insurance=self.insurance, ledger=self.ledger, metrics=self.metrics)
+        waiting_ids = result.index[result['status'] == WAITING_STATUS]
+        self.store.add_waiting_lines(raw_lines[raw_lines['Transaction ID'].isin(waiting_ids)])
+        return result
+
+    def _reevaluate_waiting(self):
+        """Processes the orders waiting for stock again, once the stock has changed since they were evaluated."""
+        if self.ledger.version == self.evaluated_version:
+            return 0
+        self.evaluated_version = self.ledger.version
+        processed = 0
+        # Keyset pages in ascending id: orders still waiting after their page are not read again
+        for orders in self.store.pending_pages(REEVALUATE_PAGE_SIZE, status=WAITING_STATUS):
+            if processed == 0:
+                logging.info("Změna skladu: znovu vyhodnocuji objednávky čekající na naskladnění.")
+            raw_lines = self.store.waiting_lines(orders.index)
+            self.store.drop_waiting_lines(orders.index)
+            orders['status'] = 'čeká na schválení'
+            orders['notes'] = ''
+            result = self._run_engine(orders, raw_lines)
+            self.store.apply_updates(result)
+            processed += len(orders)
+        return processed
+
+    def _process_batch(self, order_ids):
+        in_batch = self.pending_lines['Transaction ID'].isin(order_ids)
+        raw_lines = self.pending_lines[in_batch]
+        self.pending_lines = self.pending_lines[~in_batch].reset_index(drop=True)
+        orders = order_automation.build_orders_table(prepare_transactions(self.products_df, raw_lines), self.orders_seen)
+        self.orders_seen += len(orders)
+        result = self._run_engine(orders, raw_lines)
+        self.store.add_orders(result[ORDER_COLUMNS])
+        return len(orders)
+
+    def _process_due_batches(self, now, flush):
+        """Processes micro-batches while one is due. Returns the number of orders processed."""
+        processed = 0
+        while not self.pending_lines.empty:
+            line_ids = self.pending_lines['Transaction ID'].to_numpy()
+            order_ids = np.unique(line_ids)
+            # The order of the last line read may still be growing, unless the source has been quiet long enough
+            # (ids need not arrive in ascending order, so it is not necessarily the highest one)
+            if not flush and now - self.last_data_at < self.max_delay:
+                order_ids = order_ids[order_ids != line_ids[-1]]
+            if len(order_ids) == 0:
+                break
+            if not flush and len(order_ids) < self.batch_size and now - self.pending_since < self.max_delay:
+                break
+            processed += self._process_batch(order_ids[:self.batch_size])
+            self.pending_since = now
+        return processed
+
+    def poll(self, flush=False):
+        """
+        One step: reads new lines, applies stock changes, re-evaluates waiting orders and
+        processes the micro-batches that are due. With flush=True everything read so far is
+        processed at once (used before shutting down). Returns the number of orders processed.
+        """
+        now = self.clock()
+        saved = self._step_state()
+        try:
+            # A failure inside the step rolls the store back to the previous checkpoint
+            with self.store.transaction():
+                lines, position = self.source.read(self.position)
+                changed = position != self.position
+                self.position = position
+                if not lines.empty:
+                    # Lines of an order processed before (e.g. a file dropped twice) must not create it again
+                    known = lines['Transaction ID'].isin(self.store.known_ids(lines['Transaction ID'].unique()))
+                    if known.any():
+                        logging.warning("Ignoruji %d řádků již zpracovaných objednávek.", int(known.sum()))
+                    if self.pending_lines.empty:
+                        self.pending_since = now
+                    self.pending_lines = pd.concat([self.pending_lines, lines[~known]], ignore_index=True)
+                    self.last_data_at = now
+
+                changed |= self._check_stock_file()
+                processed = self._reevaluate_waiting()
+                processed += self._process_due_batches(now, flush)
+                if changed or processed:
+                    self.save_checkpoint()
+        except BaseException:
+            # ... and the in-memory state with it, so the next step starts from that checkpoint too
+            self._restore_step_state(saved)
+            raise
+        return processed
+
+    def run(self, poll_interval=1.0, stop_event=None):
+        """Polls until stop_event is set, then processes whatever was read and checkpoints."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.poll()
+            stop_event.wait(poll_interval)
+        self.poll(flush=True)
+
+    def export(self, path):
+        """Writes the order states in the format of the one-shot script's output.csv. Returns the number of orders."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        orders = self.store.to_frame()
+        orders.to_csv(path, encoding='utf-8')
+        return len(orders)
+
+    def close(self):
+        self.store.close()
+
+def main(argv=None):
+    """Runs the continuous order processing until interrupted (or once, with --once)."""
+    parser = argparse.ArgumentParser(description="Průběžné zpracování objednávek v mikro-dávkách.")
+    parser.add_argument('--source', default='../data/in/Transactions.csv', help="Rostoucí CSV s transakcemi nebo složka s CSV soubory.")
+    parser.add_argument('--products', default='../data/in/Products.csv', help="Katalog produktů.")
+    parser.add_argument('--stock', default=None, help="JSON se stavem skladu; při jeho změně se znovu vyhodnotí čekající objednávky.")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help="Soubor s kontrolním bodem.")
+    parser.add_argument('--output', default='../data/out/daemon_output.csv', help="Export stavu objednávek při ukončení.")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Nejvyšší počet objednávek v mikro-dávce.")
+    parser.add_argument('--max-delay', type=float, default=5.0, help="Nejdelší čekání na doplnění dávky v sekundách.")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Interval kontroly nových transakcí v sekundách.")
+    parser.add_argument('--batch', action='store_true', help="Zpracovat mikro-dávky dávkovým (vektorizovaným) enginem.")
+    parser.add_argument('--insurance-workers', type=int, default=8, help="Počet souběžných volání API pojišťovny (0 = sériově).")
+    parser.add_argument('--insurance-cache', default=DECISION_CACHE_PATH, help="Databáze uložených rozhodnutí o pojištění.")
+    parser.add_argument('--insurance-cache-ttl', type=float, default=30.0, help="Platnost uloženého rozhodnutí o pojištění ve dnech.")
+    parser.add_argument('--no-insurance-cache', action='store_true', help="Nepoužívat uložená rozhodnutí o pojištění.")
+    parser.add_argument('--breaker-threshold', type=int, default=5, help="Počet chyb API pojišťovny v řadě, po kterém se jistič rozpojí (0 = bez jističe).")
+    parser.add_argument('--breaker-reset', type=float, default=30.0, help="Doba v sekundách, po které rozpojený jistič zkusí API znovu.")
+    parser.add_argument('--metrics', default=None, help="Soubor pro metriky běhu (.json, nebo .prom pro formát Prometheus).")
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help="Interval průběžného zápisu metrik v sekundách.")
+    parser.add_argument('--once', action='store_true', help="Zpracovat dostupné transakce a skončit.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="Úroveň logování.")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+
+    try:
+        products_df = pd.read_csv(args.products)
+        source = open_source(args.source)
+    except FileNotFoundError as e:
+        logging.error("CHYBA: Vstupní soubor nebyl nalezen. Detail: %s", e)
+        exit()
+
+    metrics = PipelineMetrics()
+    writer = PeriodicWriter(metrics, args.metrics, args.metrics_interval) if args.metrics else None
+    # With --insurance-workers 0 the dispatcher is serial, still with the circuit breaker and the decision cache
+    breaker = CircuitBreaker(args.breaker_threshold, args.breaker_reset, metrics=metrics) if args.breaker_threshold > 0 else None
+    decision_cache = None if args.no_insurance_cache else InsuranceDecisionCache(args.insurance_cache, args.insurance_cache_ttl * 24 * 3600)
+    insurance = InsuranceDispatcher(order_automation.arrange_insurance, max_in_flight=args.insurance_workers,
+                                    breaker=breaker, cache=decision_cache, metrics=metrics)
+    daemon = OrderDaemon(source, products_df, args.checkpoint, stock_path=args.stock, batch_size=args.batch_size, max_delay=args.max_delay,
+                         engine=order_automation.process_orders_batch if args.batch else order_automation.process_orders,
+                         insurance=insurance, metrics=metrics)
+    try:
+        if args.once:
+            daemon.poll(flush=True)
+        else:
+            logging.info("Sleduji %s (Ctrl+C ukončí zpracování).", args.source)
+            daemon.run(args.poll_interval)
+    except KeyboardInterrupt:
+        # An interrupted step was rolled back; the lines read before it are in the checkpoint for the next start
+        logging.info("Ukončuji, nezpracované transakce zůstávají v kontrolním bodu pro další spuštění.")
+    finally:
+        insurance.close()
+        if decision_cache is not None:
+            decision_cache.close()
+        if writer is not None:
+            writer.close()
+
+    n_orders = daemon.export(args.output)
+    daemon.close()
+    logging.info("Stav %d objednávek uložen do souboru %s", n_orders, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import enum
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------------
+# COMPACT ORDER STATE
+# The orders table as parallel fixed-width arrays: status, carrier and note are
+# small integer codes instead of repeated Czech strings per row, the shipping cost
+# is an int32. Filtering by status compares one byte per order. The strings are
+# produced only when the state is decoded for export (to_frame).
+# --------------------------------------------------------------------------------
+
+class OrderStatus(enum.IntEnum):
+    PENDING = 0
+    APPROVED = 1
+    WAITING_FOR_STOCK = 2
+    MANUAL_REVIEW = 3
+
+class Carrier(enum.IntEnum):
+    NONE = 0
+    ZASILKOVNA = 1
+    DPD = 2
+    PPL_OVERSIZE = 3
+
+class Note(enum.IntEnum):
+    NONE = 0
+    AUTO_APPROVED = 1
+    OUT_OF_STOCK = 2
+    INSURANCE_FAILED = 3
+
+# Labels indexed by code, as they appear in the orders table and in output.csv
+STATUS_LABELS = np.array(['čeká na schválení', 'schváleno - k expedici', 'čeká na naskladnění', 'vyžaduje manuální kontrolu'], dtype=object)
+CARRIER_LABELS = np.array([None, 'Zásilkovna', 'DPD', "PPL 'Nadměrná zásilka'"], dtype=object)
+NOTE_LABELS = np.array(['', 'Objednávka byla automaticky schválena.', 'Jeden nebo více produktů není skladem.',
+                        'Nepodařilo se sjednat pojištění pro zásilku.'], dtype=object)
+
+# The note template the engines write with each status
+STATUS_NOTES = np.array([Note.NONE, Note.AUTO_APPROVED, Note.OUT_OF_STOCK, Note.INSURANCE_FAILED], dtype=np.uint8)
+
+CODE_DTYPE = np.uint8
+COST_DTYPE = np.int32
+
+def encode(values, labels, column):
+    """
+    Codes of the given labels. When labels[0] is None, code 0 stands for a missing value
+    (a carrier that was not assigned). Raises ValueError for values that have no code.
+    """
+    values = pd.Series(values, dtype=object)
+    missing = values.isna().to_numpy()
+    has_missing_code = labels[0] is None
+    if missing.any() and not has_missing_code:
+        raise ValueError(f"Sloupec '{column}' nesmí obsahovat prázdné hodnoty.")
+    codes = np.zeros(len(values), dtype=CODE_DTYPE)
+    found = pd.Index(labels[1:] if has_missing_code else labels).get_indexer(values[~missing])
+    if (found < 0).any():
+        raise ValueError(f"Neznámé hodnoty ve sloupci '{column}': {sorted(set(values[~missing][found < 0]))}")
+    codes[~missing] = found + has_missing_code
+    return codes
+
+def decode(codes, labels):
+    return labels.take(codes)
+
+class OrderState:
+    """
+    Orders table as parallel arrays; position i describes order order_ids[i].
+    - status, carrier, note: uint8 codes (OrderStatus, Carrier, Note)
+    - shipping_cost: int32, total_value: the numeric dtype of the orders table
+    """
+
+    def __init__(self, order_ids, total_value, status=None, carrier=None, note=None, shipping_cost=None):
+        n = len(order_ids)
+        self.order_ids = np.asarray(order_ids, dtype=np.int64)
+        self.total_value = np.asarray(total_value)
+        self.status = np.zeros(n, dtype=CODE_DTYPE) if status is None else np.asarray(status, dtype=CODE_DTYPE)
+        self.carrier = np.zeros(n, dtype=CODE_DTYPE) if carrier is None else np.asarray(carrier, dtype=CODE_DTYPE)
+        self.note = np.zeros(n, dtype=CODE_DTYPE) if note is None else np.asarray(note, dtype=CODE_DTYPE)
+        self.shipping_cost = np.zeros(n, dtype=COST_DTYPE) if shipping_cost is None else np.asarray(shipping_cost, dtype=COST_DTYPE)
+
+    @classmethod
+    def from_frame(cls, orders_df):
+        """Encodes an orders table in the layout of build_orders_table."""
+        return cls(orders_df.index.to_numpy(), orders_df['total_value'].to_numpy(),
+                   encode(orders_df['status'], STATUS_LABELS, 'status'),
+                   encode(orders_df['shipping_carrier'], CARRIER_LABELS, 'shipping_carrier'),
+                   encode(orders_df['notes'], NOTE_LABELS, 'notes'),
+                   orders_df['shipping_cost'].to_numpy())
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.order_ids, self.total_value, self.status, self.carrier, self.note, self.shipping_cost))
+
+    def positions(self, status):
+        """Positions of the orders in the given status."""
+        return np.flatnonzero(self.status == status)
+
+    def set_results(self, positions, status, carrier, shipping_cost):
+        """
+        Writes the results of processed orders. Every order gets the note of its status;
+        the carrier and the cost are written only for orders that were shipped (carrier != NONE).
+        """
+        status = np.asarray(status, dtype=CODE_DTYPE)
+        self.status[positions] = status
+        self.note[positions] = STATUS_NOTES[status]
+        shipped = np.asarray(carrier) != Carrier.NONE
+        self.carrier[positions[shipped]] = np.asarray(carrier)[shipped]
+        self.shipping_cost[positions[shipped]] = np.asarray(shipping_cost)[shipped]
+
+    def status_counts(self):
+        counts = np.bincount(self.status, minlength=len(STATUS_LABELS))
+        return {STATUS_LABELS[code]: int(n) for code, n in enumerate(counts) if n}
+
+    def to_frame(self):
+        """Decodes the state into the orders table layout (the only place the strings are built)."""
+        return pd.DataFrame({
+            'total_value': self.total_value,
+            'status': decode(self.status, STATUS_LABELS),
+            'notes': decode(self.note, NOTE_LABELS),
+            'shipping_carrier': decode(self.carrier, CARRIER_LABELS),
+            'shipping_cost': self.shipping_cost.astype(np.int64),
+        }, index=pd.Index(self.order_ids, name='Transaction ID'))
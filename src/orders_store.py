@@ -0,0 +1,209 @@
+import abc
+import contextlib
+import json
+import os
+import sqlite3
+import pandas as pd
+
+# --------------------------------------------------------------------------------
+# ORDERS STORE
+# The orders table behind a small interface: add new orders, fetch pending orders
+# page by page and write the results of a page back in one batched transaction.
+# SqliteOrdersStore keeps the state in a local database file (durable between
+# runs); DataFrameOrdersStore keeps it in memory (tests, one-off runs). Small
+# JSON state (e.g. a checkpoint) can be kept next to the orders and written in
+# the same transaction.
+# --------------------------------------------------------------------------------
+
+STATE_COLUMNS = ['status', 'notes', 'shipping_carrier', 'shipping_cost']
+ORDER_COLUMNS = ['total_value'] + STATE_COLUMNS
+PENDING_STATUS = 'čeká na schválení'
+
+class OrdersStore(abc.ABC):
+    """
+    Interface of an orders store. Orders are identified by their Transaction ID and
+    have the columns of build_orders_table (ORDER_COLUMNS).
+    """
+
+    @abc.abstractmethod
+    def add_orders(self, orders_df):
+        """Adds orders that are not in the store yet; orders already stored keep their state. Returns the number added."""
+
+    @abc.abstractmethod
+    def pending_pages(self, page_size=10000, status=PENDING_STATUS):
+        """Yields the orders in `status` in pages of at most page_size orders, in ascending Transaction ID."""
+
+    @abc.abstractmethod
+    def apply_updates(self, updates_df):
+        """Writes the state columns (STATE_COLUMNS) of the given orders, indexed by Transaction ID, in one batch."""
+
+    @abc.abstractmethod
+    def status_counts(self):
+        """Number of orders per status."""
+
+    @abc.abstractmethod
+    def to_frame(self):
+        """The whole table, in the layout of build_orders_table."""
+
+    @abc.abstractmethod
+    def get_state(self, key, default=None):
+        """A JSON value saved with set_state, or default."""
+
+    @abc.abstractmethod
+    def set_state(self, key, value):
+        """Saves a JSON-serializable value under a key, replacing the previous one."""
+
+    def transaction(self):
+        """Groups the writes inside the block into one transaction (nested blocks join the outer one)."""
+        return contextlib.nullcontext()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class DataFrameOrdersStore(OrdersStore):
+    """In-memory store over a DataFrame indexed by Transaction ID."""
+
+    def __init__(self, orders_df=None):
+        self.orders = pd.DataFrame(columns=ORDER_COLUMNS, index=pd.Index([], name='Transaction ID'))
+        self.state = {}
+        if orders_df is not None:
+            self.add_orders(orders_df)
+
+    def add_orders(self, orders_df):
+        new_orders = orders_df.loc[~orders_df.index.isin(self.orders.index), ORDER_COLUMNS]
+        if not new_orders.empty:
+            self.orders = pd.concat([self.orders, new_orders]) if not self.orders.empty else new_orders.copy()
+        return len(new_orders)
+
+    def pending_pages(self, page_size=10000, status=PENDING_STATUS):
+        last_id = None
+        while True:
+            mask = self.orders['status'] == status
+            if last_id is not None:
+                mask &= self.orders.index > last_id
+            page = self.orders[mask].sort_index().head(page_size)
+            if page.empty:
+                return
+            last_id = page.index[-1]
+            yield page.copy()
+
+    def apply_updates(self, updates_df):
+        for column in STATE_COLUMNS:
+            self.orders.loc[updates_df.index, column] = updates_df[column].to_numpy()
+
+    def status_counts(self):
+        return self.orders['status'].value_counts().to_dict()
+
+    def to_frame(self):
+        return self.orders.copy()
+
+    def get_state(self, key, default=None):
+        return json.loads(self.state[key]) if key in self.state else default
+
+    def set_state(self, key, value):
+        self.state[key] = json.dumps(value, ensure_ascii=False)
+
+class SqliteOrdersStore(OrdersStore):
+    """
+    Orders in a SQLite database file, in WAL mode (readers, e.g. a status check, do not
+    block the writer). Pending orders are read with keyset pagination over an index on
+    (status, order_id), and the updates of a page are written with executemany inside
+    one transaction instead of one write per cell.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self._in_transaction = False
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only skips the fsync of every commit; the database stays consistent after a crash
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            # NUMERIC keeps whole values as integers, like the total_value column of the DataFrame
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS orders (
+                    order_id INTEGER PRIMARY KEY,
+                    total_value NUMERIC NOT NULL,
+                    status TEXT NOT NULL,
+                    notes TEXT NOT NULL DEFAULT '',
+                    shipping_carrier TEXT,
+                    shipping_cost INTEGER NOT NULL DEFAULT 0
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS orders_status ON orders (status, order_id)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS store_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        if self._in_transaction:
+            yield
+            return
+        self._in_transaction = True
+        try:
+            with self.connection:
+                yield
+        finally:
+            self._in_transaction = False
+
+    def add_orders(self, orders_df):
+        rows = zip(orders_df.index.tolist(), *(orders_df[column].astype(object).where(orders_df[column].notna(), None).tolist()
+                                               for column in ORDER_COLUMNS))
+        with self.transaction():
+            before = self.connection.total_changes
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO orders (order_id, total_value, status, notes, shipping_carrier, shipping_cost) VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+            return self.connection.total_changes - before
+
+    def pending_pages(self, page_size=10000, status=PENDING_STATUS):
+        last_id = None
+        while True:
+            # Keyset pagination: each page starts after the last id of the previous one, so it is an index seek
+            # and stays correct while the orders of earlier pages are being updated
+            page = self._read(
+                "SELECT * FROM orders WHERE status = ? AND order_id > ? ORDER BY order_id LIMIT ?",
+                (status, -1 if last_id is None else last_id, page_size))
+            if page.empty:
+                return
+            last_id = int(page.index[-1])
+            yield page
+
+    def apply_updates(self, updates_df):
+        rows = zip(*(updates_df[column].astype(object).where(updates_df[column].notna(), None).tolist() for column in STATE_COLUMNS),
+                   updates_df.index.tolist())
+        with self.transaction():
+            self.connection.executemany(
+                "UPDATE orders SET status = ?, notes = ?, shipping_carrier = ?, shipping_cost = ? WHERE order_id = ?", rows)
+
+    def status_counts(self):
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM orders GROUP BY status").fetchall())
+
+    def to_frame(self):
+        return self._read("SELECT * FROM orders ORDER BY order_id")
+
+    def get_state(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM store_state WHERE key = ?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_state(self, key, value):
+        with self.transaction():
+            self.connection.execute("INSERT OR REPLACE INTO store_state (key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+
+    def _read(self, query, params=()):
+        cursor = self.connection.execute(query, params)
+        orders = pd.DataFrame.from_records(cursor.fetchall(), columns=['Transaction ID'] + ORDER_COLUMNS)
+        return orders.set_index('Transaction ID')
+
+    def close(self):
+        self.connection.close()
+
+def open_store(path):
+    """A SQLite store for a file path, an in-memory DataFrame store for None."""
+    return DataFrameOrdersStore() if path is None else SqliteOrdersStore(path)
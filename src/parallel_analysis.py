@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from aggregates import AnalysisAggregates
+from analysis import print_report
+from data_cache import CACHE_DIR, ensure_cache, open_columns
+
+# --------------------------------------------------------------------------------
+# PARALLEL MAP-REDUCE RUNNER FOR THE ANALYSIS
+# Lines of one order are contiguous, so the transactions are cut into contiguous
+# row ranges at order boundaries: all lines of an order land in the same range
+# and distinct order counts can simply be added. Workers memory-map the columnar
+# cache themselves (only paths and row ranges are sent to them), compute
+# AnalysisAggregates for their range and the parent merges them.
+# --------------------------------------------------------------------------------
+
+# Columns the aggregates need
+ANALYSIS_COLUMNS = ('Transaction ID', 'Date', 'Category', 'Turnover')
+
+def _next_order_start(transaction_ids, position):
+    """First row at or after position that starts a new order (len(transaction_ids) if there is none)."""
+    window = 1024
+    while 0 < position < len(transaction_ids):
+        stop = min(len(transaction_ids), position + window)
+        changes = np.flatnonzero(transaction_ids[position:stop] != transaction_ids[position - 1:stop - 1])
+        if len(changes):
+            return position + int(changes[0])
+        position, window = stop, window * 2
+    return min(position, len(transaction_ids))
+
+def partition_bounds(transaction_ids, n_partitions):
+    """
+    (start, stop) row ranges of about equal size, cut at order boundaries.
+    Only the rows around the cuts are read. Ranges may be empty when orders are long.
+    """
+    n_rows = len(transaction_ids)
+    cuts = [0] + [_next_order_start(transaction_ids, n_rows * k // n_partitions) for k in range(1, n_partitions)] + [n_rows]
+    cuts = np.maximum.accumulate(cuts)
+    return [(int(start), int(stop)) for start, stop in zip(cuts[:-1], cuts[1:])]
+
+def aggregate_partition(cache_path, meta, start, stop):
+    """Worker: computes the aggregates of one row range straight from the memory-mapped cache."""
+    columns = open_columns(cache_path, meta)
+
+    data = {}
+    for name in ANALYSIS_COLUMNS:
+        values, dictionary = columns[name]
+        values = values[start:stop]
+        data[name] = pd.Categorical.from_codes(values, dictionary) if dictionary is not None else values
+
+    aggregates = AnalysisAggregates()
+    aggregates.update(pd.DataFrame(data))
+    return aggregates
+
+def run_parallel(products_path='../data/in/Products.csv', transactions_path='../data/in/Transactions.csv', cache_dir=CACHE_DIR, workers=None, partitions=None):
+    """
+    Computes the aggregates of all transactions on a process pool.
+    Returns the merged AnalysisAggregates.
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers
+    cache_path, meta, _ = ensure_cache(products_path, transactions_path, cache_dir)
+    transaction_ids, _ = open_columns(cache_path, meta)['Transaction ID']
+    starts, stops = zip(*partition_bounds(transaction_ids, partitions))
+
+    if workers == 1:
+        partials = [aggregate_partition(cache_path, meta, start, stop) for start, stop in zip(starts, stops)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(aggregate_partition, [cache_path] * partitions, [meta] * partitions, starts, stops))
+
+    result = AnalysisAggregates()
+    for partial in partials:
+        result.merge(partial)
+    return result
+
+def main(argv=None):
+    """Runs the analysis on all cores and prints the usual report."""
+    parser = argparse.ArgumentParser(description="Paralelní analýza prodejních dat.")
+    parser.add_argument('--workers', type=int, default=None, help="Počet procesů (výchozí: počet jader).")
+    parser.add_argument('--partitions', type=int, default=None, help="Počet úseků dat (výchozí: počet procesů).")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        aggregates = run_parallel(workers=args.workers, partitions=args.partitions)
+    except FileNotFoundError as e:
+        print(f"Chyba: Súbor nebol nájdený. Uistite sa, že súbory sú v priečinku 'data/in'. Detaily: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Agregace {aggregates.rows} řádků trvala {time.perf_counter() - started:.2f} s.\n", file=sys.stderr)
+
+    print("--- Analýza prodejních dat ---")
+    print("Následuje zodpovězení otázek od manažera e-shopu. U každé otázky je popsán postup a uveden závěr.\n")
+    print_report(aggregates)
+
+if __name__ == '__main__':
+    main()
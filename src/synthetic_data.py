@@ -0,0 +1,150 @@
+import argparse
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from inventory import save_stock
+
+# --------------------------------------------------------------------------------
+# SYNTHETIC DATA GENERATOR
+# Deterministic Products.csv / Transactions.csv shaped data of any size, plus the
+# matching stock system (Stock.json), for benchmarks at scale. The same seed and
+# parameters always give byte-identical files. Transactions are written in chunks,
+# so even 10^8 lines never need to be held in memory at once.
+# --------------------------------------------------------------------------------
+
+# Category: (min price, max price, min weight kg, max weight kg), modelled on the real catalog
+CATEGORIES = {
+    'Audio': (1990, 11990, 0.05, 1.5),
+    'Televize': (14990, 59990, 12.0, 40.0),
+    'Mobilní telefony': (4990, 34990, 0.15, 0.25),
+    'Tablety': (5990, 29990, 0.4, 0.7),
+}
+
+# Quantity of a transaction line and its probability
+QUANTITIES = np.array([1, 2, 3])
+QUANTITY_WEIGHTS = np.array([0.85, 0.13, 0.02])
+
+def generate_products(n_products, out_of_stock_ratio=0.1, seed=42):
+    """
+    Generates the product catalog and the stock system.
+    Returns (products_df, stock) where stock maps product name to (stock_count, weight_kg) like MOCK_STOCK.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"Produkt {i:06d}" for i in range(1, n_products + 1)]
+    category_names = list(CATEGORIES)
+    category_codes = np.arange(n_products) % len(category_names)
+    ranges = np.array([CATEGORIES[name] for name in category_names])[category_codes]
+
+    # Prices end in 90 like the real ones, so they stay whole numbers through the x2.5 high-value simulation
+    prices = np.round(rng.uniform(ranges[:, 0], ranges[:, 1]) / 100).astype(np.int64) * 100 - 10
+    weights = np.round(rng.uniform(ranges[:, 2], ranges[:, 3]), 2)
+    stock_counts = np.where(rng.random(n_products) < out_of_stock_ratio, 0, rng.integers(1, 50, n_products))
+
+    products_df = pd.DataFrame({
+        'Product name': names,
+        'Category': np.array(category_names, dtype=object)[category_codes],
+        'Price': prices,
+    })
+    stock = {name: (int(count), float(weight)) for name, count, weight in zip(names, stock_counts, weights)}
+    return products_df, stock
+
+def _date_labels(start_date, days):
+    """Dates in the m/d/YYYY format of Transactions.csv (no leading zeros)."""
+    return np.array([f"{d.month}/{d.day}/{d.year}" for d in pd.date_range(start_date, periods=days)], dtype=object)
+
+def write_transactions(path, product_names, n_lines, start_date='2022-01-01', days=365, mean_basket_size=1.8,
+                       unknown_ratio=0.0, seed=42, chunk_lines=1_000_000):
+    """
+    Writes exactly n_lines transaction lines, ordered by Transaction ID and date.
+    - Basket sizes are 1 + Poisson(mean_basket_size - 1) (mostly one or two products, as in the real data).
+    - Product popularity follows a Zipf-like distribution.
+    - Orders are spread evenly over `days` days starting at start_date.
+    - A share of `unknown_ratio` lines refers to products missing from the catalog.
+    Returns the number of orders written.
+    """
+    rng = np.random.default_rng(seed)
+    product_names = np.asarray(product_names, dtype=object)
+    popularity = 1.0 / np.arange(1, len(product_names) + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    date_labels = _date_labels(start_date, days)
+    expected_orders = max(1, math.ceil(n_lines / mean_basket_size))
+
+    next_order_id = 1
+    written = 0
+    # utf-8-sig writes the byte order mark once, at the start of the file, like the original export
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write("Transaction ID,Date,Product name,Quantity\n")
+        while written < n_lines:
+            n = min(chunk_lines, n_lines - written)
+            basket_sizes = 1 + rng.poisson(mean_basket_size - 1, size=n)
+            ends = np.cumsum(basket_sizes)
+            n_orders = int(np.searchsorted(ends, n)) + 1
+            # The last basket of the chunk is cut to hit the line count exactly
+            basket_sizes = basket_sizes[:n_orders]
+            basket_sizes[-1] -= ends[n_orders - 1] - n
+
+            order_ids = np.arange(next_order_id, next_order_id + n_orders)
+            day = np.minimum((order_ids - 1) * days // expected_orders, days - 1)
+            products = product_names[rng.choice(len(product_names), size=n, p=popularity)].copy()
+            if unknown_ratio > 0:
+                unknown = np.flatnonzero(rng.random(n) < unknown_ratio)
+                products[unknown] = [f"Neznámý produkt {i % 100:02d}" for i in unknown]
+
+            pd.DataFrame({
+                'Transaction ID': np.repeat(order_ids, basket_sizes),
+                'Date': np.repeat(date_labels[day], basket_sizes),
+                'Product name': products,
+                'Quantity': rng.choice(QUANTITIES, size=n, p=QUANTITY_WEIGHTS),
+            }).to_csv(f, header=False, index=False, lineterminator='\n')
+
+            next_order_id += n_orders
+            written += n
+    return next_order_id - 1
+
+def generate_dataset(out_dir, n_lines, n_products=1000, out_of_stock_ratio=0.1, unknown_ratio=0.001, start_date='2022-01-01',
+                     days=365, mean_basket_size=1.8, seed=42, chunk_lines=1_000_000):
+    """
+    Writes Products.csv, Transactions.csv and Stock.json into out_dir.
+    Returns a description of the dataset (parameters, paths and the number of orders).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {name: os.path.join(out_dir, f"{name}.{extension}")
+             for name, extension in (('Products', 'csv'), ('Transactions', 'csv'), ('Stock', 'json'))}
+
+    products_df, stock = generate_products(n_products, out_of_stock_ratio, seed)
+    products_df.to_csv(paths['Products'], index=False, encoding='utf-8-sig', lineterminator='\n')
+    save_stock(stock, paths['Stock'])
+    # A derived seed, so the transactions do not repeat the random stream of the catalog
+    n_orders = write_transactions(paths['Transactions'], products_df['Product name'], n_lines, start_date, days,
+                                  mean_basket_size, unknown_ratio, seed + 1, chunk_lines)
+    return {
+        'lines': n_lines, 'orders': n_orders, 'products': n_products, 'out_of_stock_ratio': out_of_stock_ratio,
+        'unknown_ratio': unknown_ratio, 'start_date': start_date, 'days': days, 'mean_basket_size': mean_basket_size,
+        'seed': seed, 'paths': paths,
+    }
+
+def main(argv=None):
+    """Generates a synthetic dataset from the command line."""
+    parser = argparse.ArgumentParser(description="Generátor syntetických prodejních dat.")
+    parser.add_argument('--lines', type=int, default=100_000, help="Počet řádků transakcí.")
+    parser.add_argument('--products', type=int, default=1000, help="Počet produktů v katalogu.")
+    parser.add_argument('--out', default='../data/synthetic', help="Výstupní složka.")
+    parser.add_argument('--out-of-stock', type=float, default=0.1, help="Podíl produktů, které nejsou skladem.")
+    parser.add_argument('--unknown', type=float, default=0.001, help="Podíl řádků s produktem mimo katalog.")
+    parser.add_argument('--start-date', default='2022-01-01', help="Datum první objednávky.")
+    parser.add_argument('--days', type=int, default=365, help="Počet dní, přes které se objednávky rozprostřou.")
+    parser.add_argument('--basket', type=float, default=1.8, help="Průměrný počet produktů v objednávce.")
+    parser.add_argument('--seed', type=int, default=42, help="Semínko generátoru (stejné semínko = stejná data).")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    dataset = generate_dataset(args.out, args.lines, args.products, args.out_of_stock, args.unknown, args.start_date,
+                               args.days, args.basket, args.seed)
+    print(f"Vygenerováno {dataset['lines']:,} řádků ({dataset['orders']:,} objednávek, {dataset['products']:,} produktů) "
+          f"do '{args.out}' za {time.perf_counter() - started:.1f} s.")
+
+if __name__ == '__main__':
+    main()
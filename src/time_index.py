@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------------
+# DAILY TIME INDEX
+# Daily turnover and distinct orders, sorted by day, with cumulative sums. The
+# total of any date range is the difference of two cumulative sums found by binary
+# search, so before/after splits and window averages cost O(log n) per query
+# instead of a scan over all transaction lines.
+# --------------------------------------------------------------------------------
+
+class DailyTimeIndex:
+    """
+    Prefix sums over daily totals. Ranges are half-open: [start, end).
+    A distinct order is counted on the day of its lines, so the distinct orders of a
+    range are the sum of the daily distinct orders (as in analyze_marketing_impact).
+    """
+
+    def __init__(self, days, turnover, orders):
+        days = pd.DatetimeIndex(days)
+        order = np.argsort(days.asi8, kind='stable')
+        self.days = days[order]
+        turnover = np.asarray(turnover)[order]
+        orders = np.asarray(orders, dtype=np.int64)[order]
+        # A leading zero, so the total of positions [i, j) is cumsum[j] - cumsum[i]
+        self.turnover_cumsum = np.concatenate([np.zeros(1, dtype=turnover.dtype), np.cumsum(turnover)])
+        self.orders_cumsum = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(orders)])
+
+    @classmethod
+    def from_frame(cls, df):
+        """Builds the index from prepared transactions (Transaction ID, Date, Turnover)."""
+        by_date = df.groupby('Date')
+        turnover = by_date['Turnover'].sum()
+        return cls(turnover.index, turnover.to_numpy(), by_date['Transaction ID'].nunique().to_numpy())
+
+    def __len__(self):
+        return len(self.days)
+
+    def _positions(self, dates):
+        return self.days.searchsorted(pd.DatetimeIndex(pd.to_datetime(dates)), side='left')
+
+    def split(self, change_dates):
+        """
+        Totals before and on/after each change date, as arrays aligned with change_dates.
+        The days of a period run from the first day to the change date, and from the change
+        date to the last day (0 for an empty period), as in the original comparison.
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(change_dates))
+        positions = self._positions(dates)
+        turnover_before = self.turnover_cumsum[positions]
+        orders_before = self.orders_cumsum[positions]
+        if len(self.days) == 0:
+            no_days = np.zeros(len(dates), dtype=np.int64)
+            days_before = days_after = no_days
+        else:
+            days_before = np.where(positions > 0, np.asarray((dates - self.days[0]).days), 0)
+            days_after = np.where(positions < len(self.days), np.asarray((self.days[-1] - dates).days), 0)
+        return {
+            'turnover_before': turnover_before,
+            'turnover_after': self.turnover_cumsum[-1] - turnover_before,
+            'orders_before': orders_before,
+            'orders_after': self.orders_cumsum[-1] - orders_before,
+            'days_before': days_before,
+            'days_after': days_after,
+        }
+
+    def marketing_totals(self, change_date):
+        """Turnover, distinct orders and number of days before and after one change date (the arguments of print_marketing_impact)."""
+        totals = self.split([change_date])
+        return {
+            'turnover_before': totals['turnover_before'][0],
+            'turnover_after': totals['turnover_after'][0],
+            'orders_before': int(totals['orders_before'][0]),
+            'orders_after': int(totals['orders_after'][0]),
+            'days_before': int(totals['days_before'][0]),
+            'days_after': int(totals['days_after'][0]),
+        }
+
+    def compare_dates(self, change_dates):
+        """
+        The before/after comparison for many candidate change dates in one call.
+        Returns a table indexed by the change date with the totals, the number of days
+        and the average daily turnover and orders of both periods.
+        """
+        totals = self.split(change_dates)
+        table = pd.DataFrame(totals, index=pd.DatetimeIndex(pd.to_datetime(change_dates), name='change_date'))
+        for period in ('before', 'after'):
+            days = table[f'days_{period}'].to_numpy()
+            table[f'avg_daily_turnover_{period}'] = _per_day(table[f'turnover_{period}'].to_numpy(), days)
+            table[f'avg_daily_orders_{period}'] = _per_day(table[f'orders_{period}'].to_numpy(), days)
+        return table
+
+    def windows(self, starts, ends):
+        """Totals and daily averages of the windows [starts[i], ends[i]); the days of a window are its calendar days."""
+        starts = pd.DatetimeIndex(pd.to_datetime(starts))
+        ends = pd.DatetimeIndex(pd.to_datetime(ends))
+        first, last = self._positions(starts), self._positions(ends)
+        days = np.asarray((ends - starts).days)
+        turnover = self.turnover_cumsum[last] - self.turnover_cumsum[first]
+        orders = self.orders_cumsum[last] - self.orders_cumsum[first]
+        return pd.DataFrame({
+            'start': starts, 'end': ends, 'days': days, 'turnover': turnover, 'orders': orders,
+            'avg_daily_turnover': _per_day(turnover, days), 'avg_daily_orders': _per_day(orders, days),
+        })
+
+    def rolling(self, window_days):
+        """Windows of window_days calendar days ending on every day of the data (the first full window onwards), indexed by the last day."""
+        if len(self.days) == 0:
+            return self.windows([], []).set_index(pd.DatetimeIndex([], name='day'))
+        last_days = pd.date_range(self.days[0] + pd.Timedelta(days=window_days - 1), self.days[-1], freq='D', name='day')
+        table = self.windows(last_days - pd.Timedelta(days=window_days - 1), last_days + pd.Timedelta(days=1))
+        return table.set_index(last_days)
+
+def _per_day(totals, days):
+    return np.divide(totals, days, out=np.zeros(len(days), dtype=float), where=days > 0)
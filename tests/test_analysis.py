@@ -0,0 +1,136 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import analysis
+import parallel_analysis
+from cooccurrence import CooccurrenceEngine
+from time_index import DailyTimeIndex
+
+PRODUCTS_CSV = """Product name,Category,Price
+TV A,Televize,20000
+TV B,Televize,30000
+Phone,Mobilní telefony,10000
+Headphones,Audio,2000
+"""
+
+# Order 5 contains a product missing from the catalog, so turnover sums become floats as in the batch path
+TRANSACTIONS_CSV = """Transaction ID,Date,Product name ,Quantity
+1,3/14/2022,TV A,1
+1,3/14/2022,Headphones,2
+2,3/15/2022,Phone,1
+3,3/16/2022,TV B,1
+3,3/16/2022,Phone,1
+3,3/16/2022,Headphones,1
+4,3/18/2022,Headphones,3
+5,3/19/2022,Unknown,1
+5,3/19/2022,TV A,1
+6,4/2/2022,Phone,2
+6,4/2/2022,TV B,1
+"""
+
+def capture(function, *args, **kwargs):
+    """Runs a function and returns what it printed."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        function(*args, **kwargs)
+    return output.getvalue()
+
+class TestAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.products_path = os.path.join(self.tmp.name, 'Products.csv')
+        self.transactions_path = os.path.join(self.tmp.name, 'Transactions.csv')
+        with open(self.products_path, 'w', encoding='utf-8-sig') as f:
+            f.write(PRODUCTS_CSV)
+        with open(self.transactions_path, 'w', encoding='utf-8-sig') as f:
+            f.write(TRANSACTIONS_CSV)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def batch_report(self):
+        df = analysis.load_and_prepare_data(self.products_path, self.transactions_path)
+        return (capture(analysis.analyze_turnover_by_category, df)
+                + capture(analysis.analyze_orders_by_weekday, df)
+                + capture(analysis.analyze_cosold_with_tv, df)
+                + capture(analysis.analyze_marketing_impact, df))
+
+    def test_streaming_report_matches_batch(self):
+        """The streaming aggregates print exactly the same report, whatever the chunk size."""
+        expected = self.batch_report()
+        for chunksize in (1, 2, 4, 100):
+            aggregates = analysis.load_aggregates_streaming(self.products_path, self.transactions_path, chunksize=chunksize)
+            self.assertEqual(aggregates.rows, 11)
+            self.assertEqual(capture(analysis.print_report, aggregates), expected, f"chunksize={chunksize}")
+
+    def test_analyses_do_not_modify_the_frame(self):
+        """The analyze_* functions leave the input frame untouched, so it can be shared safely."""
+        df = analysis.load_and_prepare_data(self.products_path, self.transactions_path)
+        columns = df.columns.to_list()
+        capture(analysis.analyze_turnover_by_category, df)
+        capture(analysis.analyze_orders_by_weekday, df)
+        self.assertEqual(df.columns.to_list(), columns)
+
+    def test_given_empty_time_index_is_used(self):
+        """A passed time index is used even when it has no days, instead of being rebuilt from the frame."""
+        with patch('analysis.print_marketing_impact') as print_impact:
+            analysis.analyze_marketing_impact(None, time_index=DailyTimeIndex([], [], []))
+        print_impact.assert_called_once_with(pd.Timestamp('2022-03-18'), turnover_before=0.0, turnover_after=0.0, orders_before=0,
+                                             orders_after=0, days_before=0, days_after=0)
+
+    def test_parallel_report_matches_batch(self):
+        """Partial aggregates of the row ranges reduce to the same report."""
+        expected = self.batch_report()
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+        for workers, partitions in ((1, 3), (2, 2), (1, 20)):
+            aggregates = parallel_analysis.run_parallel(self.products_path, self.transactions_path, cache_dir, workers, partitions)
+            self.assertEqual(capture(analysis.print_report, aggregates), expected, f"workers={workers}, partitions={partitions}")
+
+        # Ranges are contiguous, cover every row and are cut only where a new order starts
+        transaction_ids = np.array([1, 1, 1, 2, 3, 3, 4, 4, 4, 4, 5])
+        bounds = parallel_analysis.partition_bounds(transaction_ids, 4)
+        self.assertEqual(bounds, [(0, 3), (3, 6), (6, 10), (10, 11)])
+        self.assertEqual(parallel_analysis.partition_bounds(np.array([7, 7, 7]), 3), [(0, 3), (3, 3), (3, 3)])
+
+class TestCooccurrence(unittest.TestCase):
+
+    def test_tv_answer_is_a_special_case(self):
+        """Regression check: the engine reproduces analyze_cosold_with_tv on the real data."""
+        df = analysis.load_and_prepare_data(
+            os.path.join(os.path.dirname(__file__), '..', 'data', 'in', 'Products.csv'),
+            os.path.join(os.path.dirname(__file__), '..', 'data', 'in', 'Transactions.csv'))
+        tv_transactions = df[df['Category'] == 'Televize']['Transaction ID'].unique()
+        co_sold_products = df[df['Transaction ID'].isin(tv_transactions)]
+        expected = co_sold_products[co_sold_products['Category'] != 'Televize']['Category'].value_counts()
+
+        result = CooccurrenceEngine.from_frame(df).cosold_line_counts('Televize')
+        self.assertEqual(result.to_dict(), expected.to_dict())
+        self.assertEqual(result.index[0], expected.index[0])
+
+    def test_counts_support_and_lift(self):
+        """Pair counts, support and lift on a small set of baskets."""
+        engine = CooccurrenceEngine([1, 1, 2, 2, 2, 3, 4, 4], ['A', 'B', 'A', 'B', 'B', 'C', 'A', None])
+        self.assertEqual(engine.n_baskets, 4)
+        self.assertEqual(engine.support().to_dict(), {'A': 0.75, 'B': 0.5, 'C': 0.25})
+
+        pairs = engine.pairs()
+        self.assertEqual(pairs[['item_a', 'item_b', 'count']].values.tolist(), [['A', 'B', 2]])
+        self.assertAlmostEqual(pairs.loc[0, 'lift'], 0.5 / (0.75 * 0.5))
+
+        together = engine.bought_together('B')
+        self.assertEqual(together['item'].tolist(), ['A'])
+        self.assertEqual(engine.cosold_line_counts('A').to_dict(), {'B': 3})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import filecmp
+import os
+import sys
+import tempfile
+import unittest
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import benchmark
+import order_automation
+import synthetic_data
+from data_cache import load_prepared_data
+from inventory import load_stock
+
+class TestSyntheticData(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_generation_is_deterministic(self):
+        """The same seed gives byte-identical files, whatever the chunk size; another seed does not."""
+        first = synthetic_data.generate_dataset(os.path.join(self.tmp.name, 'a'), 5000, n_products=50, seed=7)
+        second = synthetic_data.generate_dataset(os.path.join(self.tmp.name, 'b'), 5000, n_products=50, seed=7, chunk_lines=5000)
+        other = synthetic_data.generate_dataset(os.path.join(self.tmp.name, 'c'), 5000, n_products=50, seed=8)
+        for name in ('Products', 'Stock'):
+            self.assertTrue(filecmp.cmp(first['paths'][name], second['paths'][name], shallow=False))
+        self.assertFalse(filecmp.cmp(first['paths']['Transactions'], other['paths']['Transactions'], shallow=False))
+
+    def test_shape_of_the_data(self):
+        """Exact line count, orders in ID and date order, out-of-stock and unknown products present."""
+        dataset = synthetic_data.generate_dataset(self.tmp.name, 20000, n_products=200, out_of_stock_ratio=0.2,
+                                                  unknown_ratio=0.01, days=30, chunk_lines=3000)
+        df = load_prepared_data(dataset['paths']['Products'], dataset['paths']['Transactions'], cache_dir=None)
+        stock = load_stock(dataset['paths']['Stock'])
+
+        self.assertEqual(len(df), 20000)
+        self.assertEqual(df['Transaction ID'].nunique(), dataset['orders'])
+        self.assertTrue(df['Transaction ID'].is_monotonic_increasing)
+        self.assertTrue(df['Date'].is_monotonic_increasing)
+        self.assertEqual(df['Date'].dt.normalize().nunique(), 30)
+        self.assertTrue(1.5 < len(df) / dataset['orders'] < 2.1)
+        self.assertTrue(0 < df['Category'].isna().mean() < 0.02)
+        self.assertTrue(0.1 < sum(count == 0 for count, _ in stock.values()) / len(stock) < 0.3)
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_suite_and_comparison(self):
+        """A small in-process run measures every stage, and the comparison flags an obvious regression."""
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = synthetic_data.generate_dataset(tmp, 3000, n_products=40)
+            result = benchmark.run_benchmarks(dataset, repeat=1, isolate=False, workers=1, order_batch=500,
+                                              reference_orders=100, insurance_latency=0.0)
+            path = os.path.join(tmp, 'result.json')
+            benchmark.save_result(result, path)
+            result = benchmark.load_result(path)
+
+        self.assertEqual(list(result['stages']), list(benchmark.STAGES))
+        for name, stage in result['stages'].items():
+            self.assertGreater(stage['throughput'], 0, name)
+            self.assertGreater(stage['peak_rss_bytes'], 0, name)
+            self.assertIn('p95', stage['latency'], name)
+        orders = result['stages']['orders_batch']
+        self.assertEqual(orders['units'], dataset['orders'])
+        self.assertEqual(sum(orders['statuses'].values()), dataset['orders'])
+        self.assertEqual(result['stages']['orders_reference']['units'], 100)
+        # The module-level stock and insurance stub are restored after the order stages
+        self.assertIn('JBL Charge 4', order_automation.MOCK_STOCK)
+        self.assertEqual(order_automation.INSURANCE_LATENCY_S, 1.0)
+
+        slower = {'stages': {'analyze': dict(result['stages']['analyze'], throughput=result['stages']['analyze']['throughput'] / 2)}}
+        regressions = [row for row in benchmark.compare_results(result, slower) if row[-1]]
+        self.assertEqual([(stage, metric) for stage, metric, *_ in regressions], [('analyze', 'throughput')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from catalog import UNKNOWN_ID, ProductCatalog
+from data_cache import load_prepared_data
+from inventory import InventoryLedger
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestProductCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.products = pd.DataFrame({
+            'Product name': ['JBL Charge 4', 'LG OLED55CX', 'Apple iPad Air'],
+            'Category': ['Audio', 'Televize', 'Tablety'],
+            'Price': [2990, 29990, 16990],
+        })
+        self.catalog = ProductCatalog.from_products(self.products, {'JBL Charge 4': (10, 0.96), 'Sony WH-1000XM4': (0, 0.25)})
+
+    def test_encoding_and_join_match_a_left_merge(self):
+        """Ids, unknown names and the gathered columns are those of a left merge, for plain and categorical names."""
+        transactions = pd.DataFrame({'Transaction ID': [1, 1, 2, 3], 'Product name': ['LG OLED55CX', 'Unknown', 'JBL Charge 4', 'Unknown'],
+                                     'Quantity': [1, 2, 1, 1]})
+        ids, unknown = self.catalog.encode(transactions['Product name'])
+        self.assertEqual(ids.tolist(), [1, UNKNOWN_ID, 0, UNKNOWN_ID])
+        self.assertEqual(unknown, ['Unknown'])
+        categorical_ids, categorical_unknown = self.catalog.encode(transactions['Product name'].astype('category'))
+        self.assertEqual(categorical_ids.tolist(), ids.tolist())
+        self.assertEqual(categorical_unknown, unknown)
+
+        joined, _ = self.catalog.join(transactions)
+        expected = pd.merge(transactions, self.products, on='Product name', how='left')
+        pd.testing.assert_frame_equal(joined.drop(columns='Product ID'), expected)
+        self.assertEqual(self.catalog.categories_of(ids).categories.tolist(), ['Audio', 'Tablety', 'Televize'])
+
+        # The stock is aligned with the ids; stock products outside the catalog are left out
+        stock_count, weight, in_stock = self.catalog.stock_of(ids)
+        self.assertEqual(in_stock.tolist(), [False, False, True, False])
+        self.assertEqual(stock_count.tolist(), [0, 0, 10, 0])
+        self.assertEqual(self.catalog.stock(), {'JBL Charge 4': (10, 0.96)})
+
+        with self.assertRaises(ValueError):
+            ProductCatalog.from_products(pd.concat([self.products, self.products.iloc[:1]]))
+
+    @patch('order_automation.arrange_insurance', side_effect=lambda order_id, total_value: order_id % 3 != 0)
+    def test_batch_engine_by_id_matches_engine_by_name(self, _):
+        """Stock checks and reservations gathered by product id decide exactly as the lookups by name."""
+        df = load_prepared_data(os.path.join(DATA_DIR, 'Products.csv'), os.path.join(DATA_DIR, 'Transactions.csv'), cache_dir=None)
+        catalog = order_automation.build_catalog(order_automation.MOCK_STOCK, pd.read_csv(os.path.join(DATA_DIR, 'Products.csv')))
+        orders_table = order_automation.build_orders_table(df)
+        by_name = df.drop(columns='Product ID')
+
+        for make_ledger in (lambda: None, lambda: InventoryLedger(order_automation.MOCK_STOCK)):
+            expected = order_automation.process_orders_batch(orders_table.copy(), by_name, ledger=make_ledger())
+            result = order_automation.process_orders_batch(orders_table.copy(), df, catalog, ledger=make_ledger())
+            pd.testing.assert_frame_equal(result, expected)
+
+        is_stock_ok, total_weight = order_automation.check_stock_availability_batch(orders_table.index, df, catalog)
+        expected_ok, expected_weight = order_automation.check_stock_availability_batch(orders_table.index, by_name)
+        np.testing.assert_array_equal(is_stock_ok, expected_ok)
+        np.testing.assert_allclose(total_weight, expected_weight)
+
+if __name__ == '__main__':
+    unittest.main()
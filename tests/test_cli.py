@@ -0,0 +1,85 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, SRC_DIR)
+
+import catalog_snapshot
+import cli
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tmp.name, 'catalog.snapshot')
+        self.stock_path = os.path.join(self.tmp.name, 'Stock.json')
+        with open(self.stock_path, 'w', encoding='utf-8') as f:
+            json.dump({'JBL Charge 4': [10, 0.96], 'Sony WH-1000XM4': [0, 0.25]}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_snapshot_matches_sources_and_follows_changes(self):
+        """The snapshot holds what the CSV/JSON hold, is reused while fresh and rebuilt after a change."""
+        products_path = os.path.join(DATA_DIR, 'Products.csv')
+        snapshot = catalog_snapshot.load_snapshot(products_path, self.stock_path, self.snapshot_path)
+        products = pd.read_csv(products_path)
+        self.assertEqual(snapshot.product_names, products['Product name'].tolist())
+        self.assertEqual(snapshot.prices, products['Price'].tolist())
+        self.assertEqual(snapshot.product('JBL Charge 4'), {'category': 'Audio', 'price': 2990, 'stock_count': 10, 'weight_kg': 0.96})
+        self.assertIsNone(snapshot.product('Unknown product'))
+
+        with patch('catalog_snapshot.build_snapshot', side_effect=AssertionError('rebuilt')):
+            self.assertEqual(catalog_snapshot.load_snapshot(products_path, self.stock_path, self.snapshot_path).stock, snapshot.stock)
+
+        with open(self.stock_path, 'w', encoding='utf-8') as f:
+            json.dump({'JBL Charge 4': [3, 0.96]}, f)
+        self.assertEqual(catalog_snapshot.load_snapshot(products_path, self.stock_path, self.snapshot_path).stock, {'JBL Charge 4': (3, 0.96)})
+
+    def test_incremental_uses_the_given_folders(self):
+        """incremental reads the inputs of --data-dir and keeps its state in --cache-dir."""
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as log:
+            cli.main(['--data-dir', DATA_DIR, '--cache-dir', self.tmp.name, 'incremental', '--check'])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'analysis_state.json')))
+        self.assertIn("je konzistentní", log.getvalue())
+
+    def test_builtin_stock_snapshot_does_not_import_pandas(self):
+        """The snapshot of MOCK_STOCK is built without order_automation and pandas, and is tied to mock_stock.py."""
+        products_path = os.path.join(DATA_DIR, 'Products.csv')
+        script = (f"import sys; sys.path.insert(0, {SRC_DIR!r}); import catalog_snapshot; "
+                  f"snapshot = catalog_snapshot.build_snapshot({products_path!r}, None, None); "
+                  f"print(snapshot.stock['LG 75NANO81'], 'pandas' in sys.modules, 'order_automation' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '(1, 35.4) False False')
+        self.assertEqual(os.path.basename(catalog_snapshot.BUILTIN_STOCK_SOURCE), 'mock_stock.py')
+
+    @patch('order_automation.arrange_insurance', return_value=True)
+    def test_process_and_status_use_the_given_folders(self, _):
+        """process writes output.csv to --out-dir; status reads it back, in a fresh interpreter without importing pandas."""
+        common = ['--data-dir', DATA_DIR, '--out-dir', self.tmp.name, '--cache-dir', self.tmp.name, '--stock', self.stock_path]
+        cli.main(common + ['process', '--batch', '--insurance-workers', '0', '--log-level', 'ERROR'])
+        output = pd.read_csv(os.path.join(self.tmp.name, 'output.csv'))
+        self.assertEqual(cli.order_status_counts(os.path.join(self.tmp.name, 'output.csv')), output['status'].value_counts().to_dict())
+
+        script = (f"import sys; sys.path.insert(0, {SRC_DIR!r}); import cli; "
+                  f"cli.main({common + ['status']!r}); cli.main({common + ['catalog', 'JBL Charge 4']!r}); "
+                  f"print('pandas' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        lines = result.stdout.splitlines()
+        self.assertIn(f": {len(output)}", lines[0])
+        self.assertIn("JBL Charge 4: kategorie Audio, cena 2990, skladem 10", result.stdout)
+        self.assertEqual(lines[-1], 'False')
+
+if __name__ == '__main__':
+    unittest.main()
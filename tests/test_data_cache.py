@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import data_cache
+
+PRODUCTS_CSV = "Product name,Category,Price\nTV A,Televize,20000\nPhone,Mobilní telefony,10000\n"
+TRANSACTIONS_CSV = "Transaction ID,Date,Product name ,Quantity\n1,3/14/2022,TV A,1\n1,3/14/2022,Unknown,2\n2,3/15/2022,Phone,3\n"
+
+class TestDataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.products_path = os.path.join(self.tmp.name, 'Products.csv')
+        self.transactions_path = os.path.join(self.tmp.name, 'Transactions.csv')
+        self.write(self.products_path, PRODUCTS_CSV)
+        self.write(self.transactions_path, TRANSACTIONS_CSV)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content):
+        with open(path, 'w', encoding='utf-8-sig') as f:
+            f.write(content)
+
+    def load(self, **kwargs):
+        return data_cache.load_prepared_data(self.products_path, self.transactions_path, cache_dir=self.cache_dir, **kwargs)
+
+    def test_warm_load_matches_csv_load(self):
+        """A frame loaded from the cache equals the one prepared from the CSVs."""
+        expected = data_cache.load_prepared_data(self.products_path, self.transactions_path, cache_dir=None)
+        pd.testing.assert_frame_equal(self.load(), expected)
+        with patch('data_cache.prepare_transactions', side_effect=AssertionError("cache was rebuilt")):
+            pd.testing.assert_frame_equal(self.load(), expected)
+            categorical = self.load(categorical=True)
+        self.assertIsInstance(categorical['Product name'].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.isna(categorical.loc[1, 'Category']))
+
+    def test_changed_source_rebuilds_cache(self):
+        """A changed transactions file invalidates the cache."""
+        self.load()
+        self.write(self.transactions_path, TRANSACTIONS_CSV + "3,3/16/2022,Phone,1\n")
+        self.assertEqual(len(self.load()), 4)
+
+    def test_touched_source_with_same_content_stays_fresh(self):
+        """Only the mtime changed: the content hash keeps the cache valid."""
+        self.load()
+        stat = os.stat(self.transactions_path)
+        os.utime(self.transactions_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with patch('data_cache.prepare_transactions', side_effect=AssertionError("cache was rebuilt")):
+            self.assertEqual(len(self.load()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
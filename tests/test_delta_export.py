@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from data_cache import load_prepared_data
+from delta_export import DeltaWriter, compact, read_latest_changes
+from inventory import InventoryLedger
+from orders_store import SqliteOrdersStore
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestDeltaExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.delta_path = os.path.join(self.tmp.name, 'output_delta.csv')
+        self.snapshot_path = os.path.join(self.tmp.name, 'output.csv')
+        self.orders = pd.DataFrame({
+            'total_value': [600, 250000, 100],
+            'status': ['čeká na schválení'] * 3,
+            'notes': [''] * 3, 'shipping_carrier': [None] * 3, 'shipping_cost': [0] * 3,
+        }, index=pd.Index([1, 2, 3], name='Transaction ID'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_only_changes_are_appended_and_compacted(self):
+        """Unchanged orders are not written; compaction keeps the last state of each order and empties the delta."""
+        first = self.orders.copy()
+        first.loc[[1, 2], 'status'] = ['schváleno - k expedici', 'čeká na naskladnění']
+        first.loc[1, ['shipping_carrier', 'shipping_cost']] = ['DPD', 180]
+        with DeltaWriter(self.delta_path) as delta:
+            self.assertEqual(delta.write_changes(self.orders['status'], first, changed_at='2022-03-18T10:00:00'), 2)
+
+        second = first.copy()
+        second.loc[2, ['status', 'notes']] = ['vyžaduje manuální kontrolu', 'Nepodařilo se sjednat pojištění pro zásilku.']
+        with DeltaWriter(self.delta_path) as delta:
+            self.assertEqual(delta.write_changes(first['status'], second), 1)
+
+        changes = read_latest_changes(self.delta_path)
+        self.assertEqual(changes.index.tolist(), [1, 2])
+        self.assertEqual(changes.loc[2, 'previous_status'], 'čeká na naskladnění')
+        self.assertEqual(changes.loc[1, 'changed_at'], '2022-03-18T10:00:00')
+
+        # The snapshot from before the changes is brought up to date
+        self.orders.to_csv(self.snapshot_path, encoding='utf-8')
+        self.assertEqual(compact(self.delta_path, self.snapshot_path), 2)
+        snapshot = pd.read_csv(self.snapshot_path, index_col='Transaction ID', keep_default_na=False)
+        self.assertEqual(snapshot['status'].tolist(), second['status'].tolist())
+        self.assertEqual(snapshot.loc[1, 'shipping_carrier'], 'DPD')
+        self.assertEqual(snapshot.loc[3, 'notes'], '')
+        self.assertTrue(read_latest_changes(self.delta_path).empty)
+
+    @patch('order_automation.arrange_insurance', return_value=True)
+    def test_store_run_writes_delta_equal_to_full_export(self, _):
+        """A delta run over the store, compacted, gives the full export; a rerun appends nothing."""
+        df = load_prepared_data(os.path.join(DATA_DIR, 'Products.csv'), os.path.join(DATA_DIR, 'Transactions.csv'), cache_dir=None)
+        orders_table = order_automation.build_orders_table(df)
+        expected = order_automation.process_orders_batch(orders_table.copy(), df, ledger=InventoryLedger(order_automation.MOCK_STOCK))
+
+        with SqliteOrdersStore(os.path.join(self.tmp.name, 'orders.sqlite')) as store:
+            store.add_orders(orders_table)
+            for run in range(2):
+                with DeltaWriter(self.delta_path) as delta:
+                    order_automation.process_orders_store(store, df, order_automation.process_orders_batch, page_size=10,
+                                                          ledger=InventoryLedger(order_automation.MOCK_STOCK), delta=delta)
+                    self.assertEqual(delta.rows_written, len(expected) if run == 0 else 0)
+
+        compact(self.delta_path, self.snapshot_path)
+        snapshot = pd.read_csv(self.snapshot_path, index_col='Transaction ID')
+        self.assertEqual(snapshot.index.tolist(), expected.index.tolist())
+        for column in ('status', 'shipping_carrier', 'shipping_cost'):
+            self.assertEqual(snapshot[column].fillna('').tolist(), expected[column].fillna('').tolist(), column)
+
+if __name__ == '__main__':
+    unittest.main()
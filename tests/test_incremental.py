@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import incremental
+from aggregates import AnalysisAggregates
+
+PRODUCTS_CSV = "Product name,Category,Price\nTV A,Televize,20000\nPhone,Mobilní telefony,10000\nHeadphones,Audio,2000\n"
+HEADER = "Transaction ID,Date,Product name ,Quantity\n"
+DAY_1 = "1,3/14/2022,TV A,1\n1,3/14/2022,Headphones,2\n2,3/14/2022,Phone,1\n"
+DAY_2 = "3,3/21/2022,TV A,1\n3,3/21/2022,Phone,1\n4,3/22/2022,Headphones,3\n"
+
+class TestIncrementalAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.products_path = os.path.join(self.tmp.name, 'Products.csv')
+        self.transactions_path = os.path.join(self.tmp.name, 'Transactions.csv')
+        self.state_path = os.path.join(self.tmp.name, 'state.json')
+        self.write(self.products_path, PRODUCTS_CSV)
+        self.write(self.transactions_path, HEADER + DAY_1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content, mode='w'):
+        with open(path, mode, encoding='utf-8-sig' if mode == 'w' else 'utf-8') as f:
+            f.write(content)
+
+    def update(self, **kwargs):
+        return incremental.update_state(self.products_path, self.transactions_path, self.state_path, chunksize=2, **kwargs)
+
+    def test_only_new_lines_are_folded(self):
+        """A second run folds only the appended day and ends with the same totals as a rebuild."""
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 3)
+        self.assertEqual(state['watermark'], {'transaction_id': 2, 'date': '2022-03-14'})
+
+        self.write(self.transactions_path, DAY_2, mode='a')
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 3)
+        self.assertEqual(state['watermark'], {'transaction_id': 4, 'date': '2022-03-22'})
+        self.assertEqual(incremental.check_consistency(state, self.products_path, self.transactions_path), [])
+
+        rebuilt, _ = self.update(rebuild=True)
+        folded, expected = incremental.current_aggregates(state), incremental.current_aggregates(rebuilt)
+        for name in AnalysisAggregates.TABLES:
+            self.assertEqual(getattr(folded, name), getattr(expected, name))
+
+    def test_incomplete_last_line_waits_for_next_run(self):
+        """A line without its newline yet is not counted until it is complete."""
+        self.update()
+        self.write(self.transactions_path, "3,3/21/2022,TV", mode='a')
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 0)
+        self.write(self.transactions_path, " A,1\n", mode='a')
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 1)
+        self.assertEqual(state['watermark'], {'transaction_id': 3, 'date': '2022-03-21'})
+        self.assertEqual(incremental.check_consistency(state, self.products_path, self.transactions_path), [])
+
+    def test_order_split_across_appends(self):
+        """Lines appended to the last order of a previous run are folded, and the order is counted once."""
+        self.update()
+        self.write(self.transactions_path, "200,3/21/2022,TV A,1\n", mode='a')
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 1)
+        self.write(self.transactions_path, "200,3/21/2022,Headphones,1\n201,3/21/2022,Phone,1\n", mode='a')
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 2)
+        self.assertEqual(state['watermark'], {'transaction_id': 201, 'date': '2022-03-21'})
+        self.assertEqual(incremental.check_consistency(state, self.products_path, self.transactions_path), [])
+
+        aggregates = incremental.current_aggregates(state)
+        self.assertEqual(aggregates.daily_orders['2022-03-21'], 2)
+        self.assertEqual(aggregates.cosold_category_lines, {'Audio': 2})
+        rebuilt, _ = self.update(rebuild=True)
+        expected = incremental.current_aggregates(rebuilt)
+        for name in AnalysisAggregates.TABLES:
+            self.assertEqual(getattr(aggregates, name), getattr(expected, name))
+
+    def test_rewritten_inputs_trigger_rebuild(self):
+        """Changed products or a rewritten transactions file invalidate the state."""
+        self.update()
+        self.write(self.products_path, PRODUCTS_CSV.replace('20000', '25000'))
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 3)
+        self.assertEqual(incremental.check_consistency(state, self.products_path, self.transactions_path), [])
+
+        self.write(self.transactions_path, HEADER + DAY_1.replace('Headphones,2', 'Headphones,5'))
+        state, new_rows = self.update()
+        self.assertEqual(new_rows, 3)
+        self.assertEqual(incremental.check_consistency(state, self.products_path, self.transactions_path), [])
+
+if __name__ == '__main__':
+    unittest.main()
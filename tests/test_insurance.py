@@ -0,0 +1,237 @@
+import pandas as pd
+import threading
+import time
+import unittest
+import sys
+import os
+import tempfile
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from insurance import CircuitBreaker, InsuranceDecisionCache, InsuranceDispatcher
+from metrics import PipelineMetrics
+
+class TestInsuranceDispatcher(unittest.TestCase):
+
+    def test_transient_failure_is_retried(self):
+        """A failed call is retried and the order is insured on a later attempt."""
+        results = iter([False, RuntimeError("503"), True])
+
+        def flaky_insurer(order_id, total_value):
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with InsuranceDispatcher(flaky_insurer, max_retries=2, backoff_base=0.001, seed=1) as dispatcher:
+            self.assertTrue(dispatcher.submit(1, 150000).result())
+
+    def test_final_failure_after_retries(self):
+        """When every attempt fails the future resolves to False."""
+        calls = []
+
+        def failing_insurer(order_id, total_value):
+            calls.append(order_id)
+            return False
+
+        with InsuranceDispatcher(failing_insurer, max_retries=2, backoff_base=0.001) as dispatcher:
+            self.assertFalse(dispatcher.submit(7, 150000).result())
+        self.assertEqual(calls, [7, 7, 7])
+
+    def test_timeout_counts_as_failure(self):
+        """A call that does not answer within the timeout is treated as a failed attempt."""
+        def slow_insurer(order_id, total_value):
+            time.sleep(0.2)
+            return True
+
+        with InsuranceDispatcher(slow_insurer, timeout=0.01, max_retries=0) as dispatcher:
+            self.assertFalse(dispatcher.submit(1, 150000).result())
+
+    def test_queued_call_is_not_timed_out_or_repeated(self):
+        """While calls hang, a queued call does not use up its call timeout; each attempt reaches the insurer at most once."""
+        release = threading.Event()
+        calls = []
+
+        def hanging_insurer(order_id, total_value):
+            calls.append(order_id)
+            if order_id == 1:
+                release.wait()
+            return True
+
+        with InsuranceDispatcher(hanging_insurer, max_in_flight=1, timeout=0.05, queue_timeout=10, max_retries=1, backoff_base=0.001) as dispatcher:
+            try:
+                # Both attempts of order 1 time out and keep both call workers busy
+                self.assertFalse(dispatcher.submit(1, 150000).result())
+                second = dispatcher.submit(2, 150000)
+                time.sleep(0.2)
+                self.assertFalse(second.done())
+            finally:
+                release.set()
+            self.assertTrue(second.result())
+        self.assertEqual(calls, [1, 1, 2])
+
+    def test_wait_for_a_free_call_worker_is_bounded(self):
+        """When hung calls hold every call worker, a queued attempt fails after queue_timeout and never reaches the insurer."""
+        release = threading.Event()
+        calls = []
+
+        def hanging_insurer(order_id, total_value):
+            calls.append(order_id)
+            release.wait()
+            return True
+
+        with InsuranceDispatcher(hanging_insurer, max_in_flight=1, timeout=0.05, max_retries=1, backoff_base=0.001) as dispatcher:
+            try:
+                self.assertFalse(dispatcher.submit(1, 150000).result())
+                self.assertFalse(dispatcher.submit(2, 150000).result(timeout=5))
+            finally:
+                release.set()
+        self.assertEqual(calls, [1, 1])
+
+    def test_max_in_flight_is_respected(self):
+        """No more than max_in_flight calls run at the same time."""
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def tracking_insurer(order_id, total_value):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            return True
+
+        with InsuranceDispatcher(tracking_insurer, max_in_flight=3) as dispatcher:
+            futures = [dispatcher.submit(i, 150000) for i in range(12)]
+            self.assertTrue(all(future.result() for future in futures))
+        self.assertEqual(peak[0], 3)
+
+    def test_process_orders_keeps_manual_review_status(self):
+        """With concurrent insurance, a final failure still ends in 'vyžaduje manuální kontrolu'."""
+        transactions_df = pd.DataFrame({
+            'Transaction ID': [1, 2, 3],
+            'Product name': ['LG OLED55CX', 'JBL Charge 4', 'Samsung QN55Q80T'],
+            'Quantity': [1, 1, 1],
+        })
+        orders_df = pd.DataFrame({
+            'total_value': [150000, 2990, 150000],
+            'status': ['čeká na schválení'] * 3,
+            'notes': [''] * 3, 'shipping_carrier': [None] * 3, 'shipping_cost': [0] * 3,
+        }, index=pd.Index([1, 2, 3], name='Transaction ID'))
+
+        def insurer(order_id, total_value):
+            return order_id == 1
+
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            with InsuranceDispatcher(insurer, max_retries=1, backoff_base=0.001) as dispatcher:
+                result = process(orders_df.copy(), transactions_df, insurance=dispatcher)
+            self.assertEqual(result['status'].to_list(), ['schváleno - k expedici', 'schváleno - k expedici', 'vyžaduje manuální kontrolu'])
+            self.assertEqual(result.loc[3, 'notes'], 'Nepodařilo se sjednat pojištění pro zásilku.')
+            self.assertEqual(result.loc[3, 'shipping_carrier'], 'DPD')
+
+class TestInsuranceResilience(unittest.TestCase):
+
+    def test_breaker_opens_rejects_and_recovers(self):
+        """Consecutive failures open the circuit; after the reset timeout one probe decides whether it closes."""
+        now = [0.0]
+        metrics = PipelineMetrics()
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, metrics=metrics, clock=lambda: now[0])
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        now[0] = 11.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one probe at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        now[0] = 22.0
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(metrics.snapshot()['counters']['insurance_breaker'], {'open': 2, 'half_open': 2, 'closed': 1})
+
+    def test_open_breaker_fails_orders_without_calls_or_retries(self):
+        """While the circuit is open, orders go to manual review at once and the API is not called."""
+        calls = []
+
+        def failing_insurer(order_id, total_value):
+            calls.append(order_id)
+            return False
+
+        metrics = PipelineMetrics()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60, metrics=metrics)
+        with InsuranceDispatcher(failing_insurer, max_in_flight=1, max_retries=3, backoff_base=0.001, breaker=breaker, metrics=metrics) as dispatcher:
+            results = [dispatcher.submit(i, 150000).result() for i in range(5)]
+        self.assertEqual(results, [False] * 5)
+        self.assertEqual(calls, [0, 0])
+        self.assertEqual(metrics.snapshot()['counters']['insurance_breaker'], {'open': 1, 'rejected': 5})
+
+    def test_serial_dispatcher_uses_breaker_and_cache(self):
+        """With no workers, insurance is arranged order by order, still through the breaker and the decision cache."""
+        transactions_df = pd.DataFrame({
+            'Transaction ID': [1, 2, 3],
+            'Product name': ['LG OLED55CX', 'Samsung QN55Q80T', 'Samsung QN55Q80T'],
+            'Quantity': [1, 1, 1],
+        })
+        orders_df = pd.DataFrame({
+            'total_value': [150000] * 3,
+            'status': ['čeká na schválení'] * 3,
+            'notes': [''] * 3, 'shipping_carrier': [None] * 3, 'shipping_cost': [0] * 3,
+        }, index=pd.Index([1, 2, 3], name='Transaction ID'))
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = InsuranceDecisionCache(os.path.join(tmp, 'decisions.sqlite'))
+            cache.put(1, 150000)
+            for process in (order_automation.process_orders, order_automation.process_orders_batch):
+                calls = []
+
+                def failing_insurer(order_id, total_value):
+                    calls.append(order_id)
+                    return False
+
+                metrics = PipelineMetrics()
+                breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, metrics=metrics)
+                with InsuranceDispatcher(failing_insurer, max_in_flight=0, max_retries=2, backoff_base=0.001,
+                                         breaker=breaker, cache=cache, metrics=metrics) as dispatcher:
+                    result = process(orders_df.copy(), transactions_df, insurance=dispatcher, metrics=metrics)
+                self.assertEqual(result['status'].to_list(), ['schváleno - k expedici'] + ['vyžaduje manuální kontrolu'] * 2)
+                self.assertEqual(calls, [2])
+                self.assertEqual(metrics.snapshot()['counters']['insurance_cache'], {'hit': 1, 'miss': 2})
+                self.assertEqual(metrics.snapshot()['counters']['insurance_breaker'], {'open': 1, 'rejected': 2})
+            cache.close()
+
+    def test_decision_cache_persists_and_expires(self):
+        """An insured order is not insured again by a later run, until its decision expires."""
+        calls = []
+
+        def insurer(order_id, total_value):
+            calls.append(order_id)
+            return True
+
+        now = [1000.0]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'decisions.sqlite')
+            for _ in range(2):
+                cache = InsuranceDecisionCache(path, ttl=100, clock=lambda: now[0])
+                metrics = PipelineMetrics()
+                with InsuranceDispatcher(insurer, cache=cache, metrics=metrics) as dispatcher:
+                    self.assertTrue(dispatcher.submit(1, 150000).result())
+                cache.close()
+            self.assertEqual(calls, [1])
+            self.assertEqual(metrics.snapshot()['counters']['insurance_cache'], {'hit': 1})
+
+            cache = InsuranceDecisionCache(path, ttl=100, clock=lambda: now[0])
+            self.assertFalse(cache.get(1, 160000))  # a different value needs a new decision
+            now[0] = 1200.0
+            self.assertFalse(cache.get(1, 150000))
+            cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
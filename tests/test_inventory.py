@@ -0,0 +1,140 @@
+import pandas as pd
+import threading
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from insurance import InsuranceDispatcher
+from inventory import InventoryLedger, benchmark_contention
+
+class TestInventoryLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.ledger = InventoryLedger({'TV': (1, 35.4), 'Phone': (5, 0.2), 'Tablet': (0, 0.5)}, n_stripes=2)
+
+    def test_reservation_is_all_or_nothing(self):
+        """An order with one unavailable line reserves nothing."""
+        reservation_id, total_weight = self.ledger.reserve({'Phone': 2, 'Tablet': 1})
+        self.assertIsNone(reservation_id)
+        self.assertEqual(total_weight, 0)
+        self.assertEqual(self.ledger.available('Phone'), 5)
+
+    def test_commit_and_release(self):
+        """Committed goods leave the warehouse, released goods become available again."""
+        first, total_weight = self.ledger.reserve({'Phone': 2, 'TV': 1})
+        self.assertAlmostEqual(total_weight, 35.8)
+        self.assertEqual(self.ledger.available('TV'), 0)
+        self.assertIsNone(self.ledger.reserve({'TV': 1})[0])
+
+        self.ledger.release(first)
+        self.assertEqual(self.ledger.available('TV'), 1)
+
+        second, _ = self.ledger.reserve({'Phone': 3})
+        self.ledger.commit(second)
+        self.assertEqual(self.ledger.available('Phone'), 2)
+        self.assertEqual(self.ledger.on_hand[self.ledger.product_index.get_loc('Phone')], 2)
+        self.assertEqual(self.ledger.open_reservations(), 0)
+
+    def test_repeated_product_lines_are_checked_together(self):
+        """Two lines of the same product may not exceed the stock together."""
+        self.assertIsNone(self.ledger.reserve_positions([1, 1], [3, 3])[0])
+        self.assertIsNotNone(self.ledger.reserve_positions([1, 1], [3, 2])[0])
+
+    def test_concurrent_reservations_never_oversell(self):
+        """Many threads competing for the same products never reserve more than is on hand."""
+        ledger = InventoryLedger({'A': (100, 1.0), 'B': (50, 1.0)}, n_stripes=4)
+        granted = []
+
+        def worker():
+            for _ in range(100):
+                reservation_id, _ = ledger.reserve_positions([0, 1], [1, 1])
+                if reservation_id is not None:
+                    granted.append(reservation_id)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(granted), 50)
+        self.assertEqual(ledger.available('B'), 0)
+
+    def test_benchmark_stays_consistent(self):
+        """The contention benchmark ends with consistent stock levels."""
+        result = benchmark_contention(n_threads=4, orders_per_thread=500, n_products=50)
+        self.assertTrue(result['consistent'])
+
+class TestOrderProcessingWithLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.transactions_df = pd.DataFrame({
+            'Transaction ID': [1, 2, 3, 4],
+            'Product name': ['LG 75NANO81', 'LG 75NANO81', 'Samsung QN55Q80T', 'Samsung Galaxy S21 Ultra'],
+            'Quantity': [1, 1, 4, 2],
+        })
+        self.orders_df = pd.DataFrame({
+            'total_value': [150000, 30000, 150000, 40000],
+            'status': ['čeká na schválení'] * 4,
+            'notes': [''] * 4, 'shipping_carrier': [None] * 4, 'shipping_cost': [0] * 4,
+        }, index=pd.Index([1, 2, 3, 4], name='Transaction ID'))
+
+    @patch('order_automation.arrange_insurance', return_value=True)
+    def test_last_piece_is_sold_once(self, mock_arrange_insurance):
+        """Two orders for the last LG 75NANO81: only the first one is approved."""
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            ledger = InventoryLedger(order_automation.MOCK_STOCK)
+            result = process(self.orders_df.copy(), self.transactions_df, ledger=ledger)
+            self.assertEqual(result.loc[1, 'status'], 'schváleno - k expedici')
+            self.assertEqual(result.loc[2, 'status'], 'čeká na naskladnění')
+            self.assertEqual(ledger.available('LG 75NANO81'), 0)
+
+    @patch('order_automation.arrange_insurance', side_effect=lambda order_id, total_value: order_id != 3)
+    def test_reservation_released_when_insurance_fails(self, mock_arrange_insurance):
+        """Goods of an order sent to manual review go back to the stock."""
+        expected = None
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            ledger = InventoryLedger(order_automation.MOCK_STOCK)
+            result = process(self.orders_df.copy(), self.transactions_df, ledger=ledger)
+            self.assertEqual(result.loc[3, 'status'], 'vyžaduje manuální kontrolu')
+            self.assertEqual(ledger.available('Samsung QN55Q80T'), 4)
+            self.assertEqual(ledger.available('Samsung Galaxy S21 Ultra'), 0)
+            self.assertEqual(ledger.open_reservations(), 0)
+            if expected is not None:
+                pd.testing.assert_frame_equal(result, expected)
+            expected = result
+
+    @patch('order_automation.arrange_insurance', side_effect=lambda order_id, total_value: order_id != 1)
+    def test_failed_insurance_frees_the_last_piece_for_the_next_order(self, mock_arrange_insurance):
+        """The first order for the last LG 75NANO81 fails insurance, so the second one gets the piece."""
+        expected = None
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            ledger = InventoryLedger(order_automation.MOCK_STOCK)
+            result = process(self.orders_df.copy(), self.transactions_df, ledger=ledger)
+            self.assertEqual(result.loc[[1, 2], 'status'].tolist(), ['vyžaduje manuální kontrolu', 'schváleno - k expedici'])
+            self.assertEqual(ledger.available('LG 75NANO81'), 0)
+            self.assertEqual(ledger.on_hand[ledger.product_index.get_loc('LG 75NANO81')], 0)
+            self.assertEqual(ledger.open_reservations(), 0)
+            if expected is not None:
+                pd.testing.assert_frame_equal(result, expected)
+            expected = result
+
+    def test_failed_insurance_frees_the_last_piece_with_concurrent_insurance(self):
+        """With insurance dispatched concurrently, the order after one that failed insurance still gets the last piece."""
+        def insurer(order_id, total_value):
+            return order_id != 1
+
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            ledger = InventoryLedger(order_automation.MOCK_STOCK)
+            with InsuranceDispatcher(insurer, max_in_flight=4, max_retries=0) as dispatcher:
+                result = process(self.orders_df.copy(), self.transactions_df, insurance=dispatcher, ledger=ledger)
+            self.assertEqual(result.loc[[1, 2], 'status'].tolist(), ['vyžaduje manuální kontrolu', 'schváleno - k expedici'], process.__name__)
+            self.assertEqual(ledger.on_hand[ledger.product_index.get_loc('LG 75NANO81')], 0)
+            self.assertEqual(ledger.open_reservations(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
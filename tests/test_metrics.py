@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from metrics import Histogram, PeriodicWriter, PipelineMetrics
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_quantiles(self):
+        """Quantiles are interpolated within buckets and never leave the observed range."""
+        histogram = Histogram(buckets=(1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.bucket_counts, [1, 2, 1, 0])
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1.0), 3.0)
+
+        single = Histogram(buckets=(1, 2.5))
+        single.observe(1.2)
+        self.assertEqual(single.quantile(0.5), 1.2)
+
+    def test_prometheus_and_json_output(self):
+        """Cumulative buckets, sums and counts, escaped label values and a JSON snapshot."""
+        metrics = PipelineMetrics(buckets=(0.1, 1))
+        metrics.observe('shipping', 0.05)
+        metrics.observe('shipping', 0.5, n=2)
+        metrics.count('status', 'schváleno - k expedici', n=2)
+        metrics.count('status', 'čeká na naskladnění')
+        metrics.count('insurance_cache', 'hit')
+        metrics.count('carrier', "PPL 'Nadměrná zásilka'")
+        metrics.count('carrier', 'a"b')
+
+        text = metrics.to_prometheus()
+        self.assertIn('order_pipeline_stage_seconds_bucket{stage="shipping",le="0.1"} 1', text)
+        self.assertIn('order_pipeline_stage_seconds_bucket{stage="shipping",le="+Inf"} 3', text)
+        self.assertIn('order_pipeline_stage_seconds_count{stage="shipping"} 3', text)
+        self.assertIn('order_pipeline_status_total{status="schváleno - k expedici"} 2', text)
+        self.assertIn('order_pipeline_carrier_total{carrier="a\\"b"} 1', text)
+        self.assertIn('# HELP order_pipeline_status_total Processed orders by final status.', text)
+        self.assertIn('# HELP order_pipeline_insurance_cache_total Insured orders found in (hit) or missing from (miss) the insurance decision cache.', text)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metrics.json')
+            with PeriodicWriter(metrics, path, interval=0):
+                pass
+            with open(path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        self.assertEqual(snapshot['orders'], 3)
+        self.assertEqual(snapshot['stages']['shipping']['count'], 3)
+        self.assertAlmostEqual(snapshot['stages']['shipping']['sum'], 1.05)
+
+class TestPipelineInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        products_df = pd.DataFrame({'Product name': ['A', 'B', 'TV'], 'Category': ['c', 'c', 'c'], 'Price': [100, 500, 150000]})
+        transactions_df = pd.DataFrame({'Transaction ID': [1, 1, 2, 3, 4], 'Product name': ['A', 'B', 'B', 'TV', 'X'], 'Quantity': [1, 1, 9, 1, 1]})
+        self.full_transactions_df = pd.merge(transactions_df, products_df, on='Product name', how='left')
+        self.full_transactions_df['Turnover'] = self.full_transactions_df['Quantity'] * self.full_transactions_df['Price']
+        self.stock = {'A': (5, 1.0), 'B': (5, 30.0), 'TV': (1, 20.0)}
+
+    @patch('order_automation.arrange_insurance', return_value=True)
+    def test_both_engines_record_the_same_outcomes(self, _):
+        """Every order is counted once by status, shipped orders by carrier, and each stage is timed."""
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            metrics = PipelineMetrics()
+            orders = order_automation.build_orders_table(self.full_transactions_df)
+            with patch.dict(order_automation.MOCK_STOCK, self.stock, clear=True):
+                process(orders, self.full_transactions_df, metrics=metrics)
+
+            snapshot = metrics.snapshot()
+            self.assertEqual(snapshot['counters']['status'], {'schváleno - k expedici': 2, 'čeká na naskladnění': 2}, process.__name__)
+            self.assertEqual(snapshot['counters']['carrier'], {'DPD': 1, 'Zásilkovna': 1}, process.__name__)
+            self.assertEqual(snapshot['stages']['stock_check']['count'], 4, process.__name__)
+            self.assertEqual(snapshot['stages']['insurance']['count'], 1, process.__name__)
+            self.assertEqual(snapshot['orders'], 4)
+            self.assertGreater(snapshot['orders_per_second'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
 import order_automation # The script we are testing
+from insurance import InsuranceDispatcher
+from inventory import InventoryLedger
 
 class TestOrderAutomation(unittest.TestCase):
 
@@ -112,5 +114,71 @@ class TestOrderAutomation(unittest.TestCase):
         mock_assign_shipping.assert_called_once()
         mock_arrange_insurance.assert_called_once() # Insurance should be called
 
+class TestBatchProcessing(unittest.TestCase):
+
+    def setUp(self):
+        """Builds orders that cover every branch of the pipeline, using the products from MOCK_STOCK."""
+        self.transactions_df = pd.DataFrame({
+            'Transaction ID': [1, 1, 2, 3, 3, 4, 5, 6, 6, 7, 8],
+            'Product name': [
+                'JBL Charge 4', 'Apple iPad Air',          # 1: light order, approved
+                'Sony WH-1000XM4',                         # 2: out of stock
+                'LG OLED55CX', 'Samsung QN55Q80T',         # 3: 47.1 kg -> DPD
+                'Unknown product',                         # 4: not in the stock system
+                'LG 75NANO81',                             # 5: high value, insurance needed
+                'Apple iPhone 12 Pro', 'Apple iPhone 12 Pro', # 6: repeated product, the last quantity wins
+                'LG OLED55CX',                             # 7: 3 x 23 kg -> PPL
+                'LG 75NANO81',                             # 8: high value, insurance needed
+            ],
+            'Quantity': [2, 1, 1, 1, 1, 1, 1, 1, 9, 3, 1],
+        })
+        self.orders_df = pd.DataFrame({
+            'total_value': [1000, 2000, 3000, 4000, 150000, 5000, 6000, 200000, 7000],
+            'status': ['čeká na schválení'] * 8 + ['schváleno - k expedici'],
+            'notes': [''] * 9, 'shipping_carrier': [None] * 9, 'shipping_cost': [0] * 9,
+        }, index=pd.Index([1, 2, 3, 4, 5, 6, 7, 8, 9], name='Transaction ID')) # 9: no lines and already processed
+
+    @patch('order_automation.arrange_insurance', side_effect=[True, False])
+    def test_batch_matches_per_order_path(self, mock_arrange_insurance):
+        """The batch engine must produce exactly the same table as the per-order reference path."""
+        expected = order_automation.process_orders(self.orders_df.copy(), self.transactions_df)
+        mock_arrange_insurance.side_effect = [True, False]
+        result = order_automation.process_orders_batch(self.orders_df.copy(), self.transactions_df)
+
+        pd.testing.assert_frame_equal(result, expected)
+        self.assertEqual(result.loc[6, 'status'], 'čeká na naskladnění')
+        self.assertEqual(result.loc[7, 'shipping_carrier'], "PPL 'Nadměrná zásilka'")
+        self.assertEqual(result.loc[8, 'status'], 'vyžaduje manuální kontrolu')
+
+    def test_batch_matches_per_order_path_with_dispatcher_and_ledger(self):
+        """Both engines match the serial per-order path with a serial or concurrent dispatcher, with and without reservations."""
+        # Order 5 fails insurance, so with a ledger the only LG 75NANO81 goes to order 8
+        def insurer(order_id, total_value):
+            return order_id != 5
+
+        for use_ledger in (False, True):
+            with patch('order_automation.arrange_insurance', side_effect=insurer):
+                ledger = InventoryLedger(order_automation.MOCK_STOCK) if use_ledger else None
+                expected = order_automation.process_orders(self.orders_df.copy(), self.transactions_df, ledger=ledger)
+            self.assertEqual(expected.loc[[5, 8], 'status'].tolist(), ['vyžaduje manuální kontrolu', 'schváleno - k expedici'])
+            expected_stock = ledger.snapshot() if use_ledger else None
+            for process in (order_automation.process_orders, order_automation.process_orders_batch):
+                for workers in (0, 4):
+                    with self.subTest(process=process.__name__, workers=workers, ledger=use_ledger):
+                        ledger = InventoryLedger(order_automation.MOCK_STOCK) if use_ledger else None
+                        with InsuranceDispatcher(insurer, max_in_flight=workers, max_retries=0) as dispatcher:
+                            result = process(self.orders_df.copy(), self.transactions_df, insurance=dispatcher, ledger=ledger)
+                        pd.testing.assert_frame_equal(result, expected)
+                        if use_ledger:
+                            self.assertEqual(ledger.snapshot(), expected_stock)
+                            self.assertEqual(ledger.open_reservations(), 0)
+
+    def test_assign_shipping_batch_matches_tiers(self):
+        """The vectorized shipping lookup must agree with assign_shipping on the tier boundaries."""
+        weights = [0, 19.99, 20, 20.01, 50, 50.01, 120]
+        carriers, costs = order_automation.assign_shipping_batch(weights)
+        for weight, carrier, cost in zip(weights, carriers, costs):
+            self.assertEqual((carrier, cost), order_automation.assign_shipping(0, weight))
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,206 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from data_cache import load_prepared_data
+from inventory import InventoryLedger, save_stock
+from order_daemon import OrderDaemon, open_source
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestOrderDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.tmp.name, 'checkpoint.sqlite')
+        self.products_df = pd.read_csv(os.path.join(DATA_DIR, 'Products.csv'))
+        # Insurance always succeeds, so the results do not depend on the simulated random failures
+        patcher = patch('order_automation.arrange_insurance', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def daemon(self, source_path, **kwargs):
+        kwargs.setdefault('batch_size', 7)
+        kwargs.setdefault('max_delay', 0)
+        daemon = OrderDaemon(open_source(source_path), self.products_df, self.checkpoint_path, **kwargs)
+        self.addCleanup(daemon.close)
+        return daemon
+
+    def assert_matches_one_shot_run(self, daemon):
+        df = load_prepared_data(os.path.join(DATA_DIR, 'Products.csv'), os.path.join(DATA_DIR, 'Transactions.csv'), cache_dir=None)
+        expected = order_automation.process_orders(order_automation.build_orders_table(df), df, ledger=InventoryLedger(order_automation.MOCK_STOCK))
+        orders = daemon.store.to_frame()
+        actual = orders.loc[expected.index]
+        self.assertEqual(len(orders), len(expected))
+        for column in ('total_value', 'status', 'shipping_carrier', 'shipping_cost'):
+            self.assertEqual(actual[column].fillna('').tolist(), expected[column].fillna('').tolist(), column)
+
+    def test_growing_csv_with_restarts_matches_one_shot_run(self):
+        """Appending the file piece by piece (cut mid-line) and restarting in between gives the one-shot results."""
+        with open(os.path.join(DATA_DIR, 'Transactions.csv'), 'rb') as f:
+            content = f.read()
+        path = os.path.join(self.tmp.name, 'Transactions.csv')
+        cuts = [0, 300, 301, 1500, 2222, len(content)]
+        for start, end in zip(cuts, cuts[1:]):
+            with open(path, 'ab') as f:
+                f.write(content[start:end])
+            # A new daemon each time resumes from the checkpoint of the previous one; with the clock
+            # standing still only full batches of complete orders are processed before the final flush
+            self.daemon(path, max_delay=10, clock=lambda: 0.0).poll()
+        daemon = self.daemon(path)
+        daemon.poll(flush=True)
+        self.assert_matches_one_shot_run(daemon)
+
+    def test_failed_step_is_rolled_back_and_repeated(self):
+        """A step that fails after some of its batches were stored leaves the previous checkpoint; a restart repeats it."""
+        path = os.path.join(self.tmp.name, 'Transactions.csv')
+        with open(os.path.join(DATA_DIR, 'Transactions.csv'), 'rb') as source, open(path, 'wb') as f:
+            f.write(source.read())
+        engine_calls = []
+
+        def failing_engine(*args, **kwargs):
+            engine_calls.append(1)
+            if len(engine_calls) == 3:
+                raise RuntimeError("výpadek")
+            return order_automation.process_orders(*args, **kwargs)
+
+        with self.assertRaises(RuntimeError):
+            self.daemon(path, engine=failing_engine).poll(flush=True)
+        daemon = self.daemon(path)
+        self.assertEqual(daemon.store.status_counts(), {})
+        daemon.poll(flush=True)
+        self.assert_matches_one_shot_run(daemon)
+
+    def test_failed_batch_restores_the_in_memory_state(self):
+        """A batch failing after others were stored leaves no order lost, also with lines appended in the meantime."""
+        with open(os.path.join(DATA_DIR, 'Transactions.csv'), 'rb') as f:
+            content = f.read()
+        cut = content.index(b'\n', len(content) // 2) + 1
+        path = os.path.join(self.tmp.name, 'Transactions.csv')
+        with open(path, 'wb') as f:
+            f.write(content[:cut])
+        process_batch = OrderDaemon._process_batch
+        calls = []
+
+        def failing_batch(daemon, order_ids):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("výpadek")
+            return process_batch(daemon, order_ids)
+
+        daemon = self.daemon(path)
+        with patch.object(OrderDaemon, '_process_batch', failing_batch):
+            with self.assertRaises(RuntimeError):
+                daemon.poll(flush=True)
+        self.assertEqual(daemon.store.status_counts(), {})
+        self.assertEqual(daemon.ledger.open_reservations(), 0)
+
+        with open(path, 'ab') as f:
+            f.write(content[cut:])
+        daemon.poll()
+        daemon.close()
+        # A restart from the checkpoint finishes the lines the first daemon left buffered
+        restarted = self.daemon(path)
+        restarted.poll(flush=True)
+        self.assert_matches_one_shot_run(restarted)
+
+    def test_waiting_orders_are_reevaluated_on_stock_change(self):
+        """A change of the stock file re-evaluates only the orders waiting for stock, without a rerun."""
+        drop_dir = os.path.join(self.tmp.name, 'drop')
+        os.makedirs(drop_dir)
+        stock_path = os.path.join(self.tmp.name, 'Stock.json')
+        stock = dict(order_automation.MOCK_STOCK)
+        save_stock(stock, stock_path)
+        pd.DataFrame({
+            'Transaction ID': [1, 2, 2],
+            'Date': ['2/1/2022'] * 3,
+            'Product name': ['JBL Charge 4', 'Sony WH-1000XM4', 'JBL Charge 4'],
+            'Quantity': [1, 1, 1],
+        }).to_csv(os.path.join(drop_dir, '001.csv'), index=False)
+
+        daemon = self.daemon(drop_dir, stock_path=stock_path)
+        self.assertEqual(daemon.poll(flush=True), 2)
+        self.assertEqual(daemon.store.to_frame().loc[2, 'status'], 'čeká na naskladnění')
+        self.assertEqual(daemon.store.count_waiting_lines(), 2)
+        self.assertEqual(daemon.poll(), 0)
+
+        stock['Sony WH-1000XM4'] = (1, 0.25)
+        save_stock(stock, stock_path)
+        os.utime(stock_path, ns=(0, os.stat(stock_path).st_mtime_ns + 1))
+        self.assertEqual(daemon.poll(), 1)
+        self.assertEqual(daemon.store.to_frame().loc[2, 'status'], 'schváleno - k expedici')
+        # Only the restocked difference is added; the goods shipped before stay shipped
+        self.assertEqual(daemon.ledger.available('JBL Charge 4'), 8)
+        self.assertEqual(daemon.ledger.available('Sony WH-1000XM4'), 0)
+        self.assertEqual(daemon.store.count_waiting_lines(), 0)
+
+    def test_order_of_the_last_line_waits_whatever_its_id(self):
+        """The order still growing is the one of the last line read, not the one with the highest id."""
+        drop_dir = os.path.join(self.tmp.name, 'drop')
+        os.makedirs(drop_dir)
+        daemon = self.daemon(drop_dir, batch_size=2, max_delay=10, clock=lambda: 0.0)
+
+        pd.DataFrame({'Transaction ID': [5, 6, 3], 'Date': ['2/1/2022'] * 3, 'Product name': ['JBL Charge 4'] * 3,
+                      'Quantity': [1, 1, 1]}).to_csv(os.path.join(drop_dir, '001.csv'), index=False)
+        self.assertEqual(daemon.poll(), 2)
+        self.assertEqual(daemon.pending_lines['Transaction ID'].tolist(), [3])
+
+        pd.DataFrame({'Transaction ID': [3, 8], 'Date': ['2/1/2022'] * 2, 'Product name': ['JBL Charge 4'] * 2,
+                      'Quantity': [1, 1]}).to_csv(os.path.join(drop_dir, '002.csv'), index=False)
+        self.assertEqual(daemon.poll(flush=True), 2)
+        orders = daemon.store.to_frame()
+        self.assertEqual(orders.loc[3, 'total_value'], 2 * orders.loc[5, 'total_value'])
+
+    def test_product_removed_from_stock_file_has_no_stock(self):
+        """A product dropped from the stock file cannot be reserved any more."""
+        drop_dir = os.path.join(self.tmp.name, 'drop')
+        os.makedirs(drop_dir)
+        stock_path = os.path.join(self.tmp.name, 'Stock.json')
+        stock = dict(order_automation.MOCK_STOCK)
+        save_stock(stock, stock_path)
+        daemon = self.daemon(drop_dir, stock_path=stock_path)
+        daemon.poll()
+
+        del stock['JBL Charge 4']
+        save_stock(stock, stock_path)
+        os.utime(stock_path, ns=(0, os.stat(stock_path).st_mtime_ns + 1))
+        pd.DataFrame({'Transaction ID': [1], 'Date': ['2/1/2022'], 'Product name': ['JBL Charge 4'],
+                      'Quantity': [1]}).to_csv(os.path.join(drop_dir, '001.csv'), index=False)
+        self.assertEqual(daemon.poll(flush=True), 1)
+        self.assertEqual(daemon.ledger.available('JBL Charge 4'), 0)
+        self.assertEqual(daemon.store.to_frame().loc[1, 'status'], 'čeká na naskladnění')
+
+    def test_micro_batches_are_bounded_by_size_and_time(self):
+        """Orders wait for a full batch or for max_delay; the last order waits until a later one arrives."""
+        drop_dir = os.path.join(self.tmp.name, 'drop')
+        os.makedirs(drop_dir)
+        now = [0.0]
+        daemon = self.daemon(drop_dir, batch_size=3, max_delay=10, clock=lambda: now[0])
+
+        pd.DataFrame({'Transaction ID': [1, 2, 3], 'Date': ['2/1/2022'] * 3, 'Product name': ['JBL Charge 4'] * 3,
+                      'Quantity': [1, 1, 1]}).to_csv(os.path.join(drop_dir, '001.csv'), index=False)
+        self.assertEqual(daemon.poll(), 0)
+        now[0] = 5.0
+        self.assertEqual(daemon.poll(), 0)
+        now[0] = 11.0
+        # Orders 1 and 2 are complete; order 3 also counts once the source has been quiet for max_delay
+        self.assertEqual(daemon.poll(), 3)
+
+        pd.DataFrame({'Transaction ID': [4, 5, 6, 7], 'Date': ['2/2/2022'] * 4, 'Product name': ['JBL Charge 4'] * 4,
+                      'Quantity': [1, 1, 1, 1]}).to_csv(os.path.join(drop_dir, '002.csv'), index=False)
+        now[0] = 12.0
+        self.assertEqual(daemon.poll(), 3)
+        self.assertEqual(daemon.pending_lines['Transaction ID'].tolist(), [7])
+
+if __name__ == '__main__':
+    unittest.main()
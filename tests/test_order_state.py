@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from data_cache import load_prepared_data
+from inventory import InventoryLedger
+from order_state import Carrier, OrderState, OrderStatus
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestOrderState(unittest.TestCase):
+
+    def test_round_trip_and_unknown_labels(self):
+        """Encoding and decoding keeps the table; labels without a code are rejected."""
+        orders = pd.DataFrame({
+            'total_value': [600, 250000, 100],
+            'status': ['schváleno - k expedici', 'vyžaduje manuální kontrolu', 'čeká na schválení'],
+            'notes': ['Objednávka byla automaticky schválena.', 'Nepodařilo se sjednat pojištění pro zásilku.', ''],
+            'shipping_carrier': ["PPL 'Nadměrná zásilka'", 'DPD', None],
+            'shipping_cost': [500, 180, 0],
+        }, index=pd.Index([1, 2, 3], name='Transaction ID'))
+        state = OrderState.from_frame(orders)
+        self.assertEqual(state.status.tolist(), [OrderStatus.APPROVED, OrderStatus.MANUAL_REVIEW, OrderStatus.PENDING])
+        self.assertEqual(state.carrier.tolist(), [Carrier.PPL_OVERSIZE, Carrier.DPD, Carrier.NONE])
+        self.assertEqual(state.status.dtype, np.uint8)
+        pd.testing.assert_frame_equal(state.to_frame(), orders, check_dtype=False)
+
+        orders.loc[3, 'status'] = 'stornováno'
+        with self.assertRaises(ValueError):
+            OrderState.from_frame(orders)
+
+    @patch('order_automation.arrange_insurance', side_effect=lambda order_id, total_value: order_id % 2 == 0)
+    def test_encoded_engine_matches_batch_engine(self, _):
+        """The engine over the encoded state decides exactly as the batch engine over the table."""
+        df = load_prepared_data(os.path.join(DATA_DIR, 'Products.csv'), os.path.join(DATA_DIR, 'Transactions.csv'), cache_dir=None)
+        orders_table = order_automation.build_orders_table(df)
+        expected = order_automation.process_orders_batch(orders_table.copy(), df, ledger=InventoryLedger(order_automation.MOCK_STOCK))
+        ledger = InventoryLedger(order_automation.MOCK_STOCK)
+        state = order_automation.process_order_state(OrderState.from_frame(orders_table), df, ledger=ledger)
+
+        pd.testing.assert_frame_equal(state.to_frame().fillna(''), expected.fillna(''), check_dtype=False)
+        self.assertEqual(state.status_counts(), expected['status'].value_counts().to_dict())
+        self.assertEqual(ledger.available('JBL Charge 4'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
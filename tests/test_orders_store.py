@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import order_automation
+from data_cache import load_prepared_data
+from inventory import InventoryLedger
+from orders_store import DataFrameOrdersStore, OrdersStore, SqliteOrdersStore
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestOrdersStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'orders.sqlite')
+        self.full_transactions_df = load_prepared_data(os.path.join(DATA_DIR, 'Products.csv'), os.path.join(DATA_DIR, 'Transactions.csv'), cache_dir=None)
+        self.orders_table = order_automation.build_orders_table(self.full_transactions_df)
+        # Insurance always succeeds, so the results do not depend on the simulated random failures
+        patcher = patch('order_automation.arrange_insurance', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pages_and_batched_updates(self):
+        """Both backends page pending orders by id and write the updates of a page at once."""
+        for store in (DataFrameOrdersStore(), SqliteOrdersStore(self.db_path)):
+            with store:
+                self.assertEqual(store.add_orders(self.orders_table), len(self.orders_table))
+                pages = list(store.pending_pages(page_size=4))
+                self.assertEqual([len(page) for page in pages[:-1]], [4] * (len(pages) - 1))
+                self.assertLessEqual(len(pages[-1]), 4)
+                self.assertEqual(pd.concat(pages).index.tolist(), self.orders_table.index.tolist())
+
+                updates = pages[0].copy()
+                updates['status'] = 'čeká na naskladnění'
+                updates['notes'] = 'Jeden nebo více produktů není skladem.'
+                store.apply_updates(updates)
+                self.assertEqual(store.status_counts(), {'čeká na schválení': len(self.orders_table) - 4, 'čeká na naskladnění': 4}, type(store).__name__)
+                self.assertEqual(store.to_frame().loc[pages[0].index[0], 'notes'], 'Jeden nebo více produktů není skladem.')
+
+    def test_backend_must_implement_the_interface(self):
+        """A backend missing one of the interface methods cannot be created."""
+        class PartialStore(OrdersStore):
+            def add_orders(self, orders_df):
+                return 0
+
+        with self.assertRaises(TypeError):
+            PartialStore()
+
+    def test_store_run_matches_in_memory_run_and_persists(self):
+        """Paged processing through SQLite gives the in-memory results; a rerun adds and processes nothing."""
+        expected_ledger = InventoryLedger(order_automation.MOCK_STOCK)
+        expected = order_automation.process_orders(self.orders_table.copy(), self.full_transactions_df, ledger=expected_ledger)
+
+        for process in (order_automation.process_orders, order_automation.process_orders_batch):
+            path = os.path.join(self.tmp.name, f"{process.__name__}.sqlite")
+            with SqliteOrdersStore(path) as store:
+                store.add_orders(self.orders_table)
+                processed = order_automation.process_orders_store(store, self.full_transactions_df, process, page_size=3,
+                                                                  ledger=InventoryLedger(order_automation.MOCK_STOCK))
+                self.assertEqual(processed, len(expected))
+            with SqliteOrdersStore(path) as store:
+                # The next run continues from the stock left by the shipped orders
+                self.assertEqual(order_automation.stored_stock(store, order_automation.MOCK_STOCK), expected_ledger.snapshot())
+                self.assertEqual(store.add_orders(self.orders_table), 0)
+                self.assertEqual(order_automation.process_orders_store(store, self.full_transactions_df, process), 0)
+                actual = store.to_frame()
+            for column in expected.columns:
+                self.assertEqual(actual[column].fillna('').tolist(), expected[column].fillna('').tolist(), f"{process.__name__}: {column}")
+
+if __name__ == '__main__':
+    unittest.main()
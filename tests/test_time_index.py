@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+import pandas as pd
+
+# Add the 'src' directory to the Python path to allow imports of our scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from aggregates import AnalysisAggregates
+from data_cache import load_prepared_data
+from time_index import DailyTimeIndex
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'in')
+
+class TestDailyTimeIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = load_prepared_data(os.path.join(DATA_DIR, 'Products.csv'), os.path.join(DATA_DIR, 'Transactions.csv'), cache_dir=None)
+        cls.index = DailyTimeIndex.from_frame(cls.df)
+
+    def test_splits_match_filtering_the_transactions(self):
+        """Every candidate date, including ones outside the data, splits like filtering the lines."""
+        dates = ['2021-01-01', self.df['Date'].min(), '2022-03-18', '2022-04-02', self.df['Date'].max(), '2030-01-01']
+        comparison = self.index.compare_dates(dates)
+        aggregates = AnalysisAggregates()
+        aggregates.update(self.df)
+        for change_date, row in zip(pd.to_datetime(dates), comparison.itertuples()):
+            before = self.df[self.df['Date'] < change_date]
+            after = self.df[self.df['Date'] >= change_date]
+            expected = {
+                'turnover_before': before['Turnover'].sum(), 'turnover_after': after['Turnover'].sum(),
+                'orders_before': before['Transaction ID'].nunique(), 'orders_after': after['Transaction ID'].nunique(),
+                'days_before': (change_date - self.df['Date'].min()).days if not before.empty else 0,
+                'days_after': (self.df['Date'].max() - change_date).days if not after.empty else 0,
+            }
+            self.assertEqual(self.index.marketing_totals(change_date), expected, change_date)
+            self.assertEqual(aggregates.marketing_totals(change_date), expected, change_date)
+            self.assertEqual(row.turnover_before, expected['turnover_before'])
+            if expected['days_after']:
+                self.assertAlmostEqual(row.avg_daily_orders_after, expected['orders_after'] / expected['days_after'])
+
+    def test_windows_and_rolling_averages(self):
+        """Window totals cover [start, end); rolling windows average over their calendar days."""
+        windows = self.index.windows(['2022-03-01', '2022-03-18'], ['2022-03-18', '2022-03-18'])
+        march = self.df[(self.df['Date'] >= '2022-03-01') & (self.df['Date'] < '2022-03-18')]
+        self.assertEqual(windows.loc[0, 'turnover'], march['Turnover'].sum())
+        self.assertEqual(windows.loc[0, 'orders'], march['Transaction ID'].nunique())
+        self.assertEqual(windows.loc[0, 'days'], 17)
+        self.assertEqual(windows.loc[1, 'orders'], 0)
+        self.assertEqual(windows.loc[1, 'avg_daily_orders'], 0)
+
+        rolling = self.index.rolling(7)
+        self.assertEqual(rolling.index[0], self.df['Date'].min() + pd.Timedelta(days=6))
+        self.assertEqual(rolling.index[-1], self.df['Date'].max())
+        last_week = self.df[self.df['Date'] > self.df['Date'].max() - pd.Timedelta(days=7)]
+        self.assertAlmostEqual(rolling['avg_daily_turnover'].iloc[-1], last_week['Turnover'].sum() / 7)
+
+if __name__ == '__main__':
+    unittest.main()